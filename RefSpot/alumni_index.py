@@ -0,0 +1,91 @@
+from sqlalchemy import event, or_
+
+from app import db
+from models import User, Experience
+from logo_fetcher import normalize_company_name
+
+# Everyone who has worked at a company, from Experience history. Each row
+# carries the normalized company name, indexed with the current flag and
+# user id, so "current/former employees of Acme" is an index range rather
+# than a scan over company strings. User.current_company is keyed the same
+# way for people who list an employer without a matching Experience.
+ALUMNI_CURRENT = 'current'
+ALUMNI_FORMER = 'former'
+
+
+def company_key(company_name):
+    """Index key for a company name; spelling variants share one key"""
+    return normalize_company_name(company_name)
+
+
+def alumni_query(company_name, status=None):
+    """User query for people who work or worked at a company.
+
+    status ALUMNI_CURRENT keeps people with a current role there,
+    ALUMNI_FORMER people who worked there but no longer do, and None both.
+    """
+    key = company_key(company_name)
+    current_ids = db.session.query(Experience.user_id).filter(
+        Experience.company_key == key, Experience.current == True
+    )
+    if status == ALUMNI_CURRENT:
+        return User.query.filter(or_(User.id.in_(current_ids), User.current_company_key == key))
+
+    all_ids = db.session.query(Experience.user_id).filter(Experience.company_key == key)
+    if status == ALUMNI_FORMER:
+        return User.query.filter(User.id.in_(all_ids), User.id.notin_(current_ids),
+                                 or_(User.current_company_key.is_(None), User.current_company_key != key))
+    # Everyone includes people who list the company on their profile only
+    return User.query.filter(or_(User.id.in_(all_ids), User.current_company_key == key))
+
+
+def current_employee_ids(company_name):
+    """Ids of everyone who currently works at a company, by profile or work history"""
+    key = company_key(company_name)
+    if not key:
+        return set()
+    ids = {user_id for user_id, in db.session.query(Experience.user_id).filter(
+        Experience.company_key == key, Experience.current == True
+    )}
+    ids.update(user_id for user_id, in db.session.query(User.id).filter(User.current_company_key == key))
+    return ids
+
+
+def company_tenures(company_name, user_ids):
+    """Map user ids to their (start_date, end_date, current) spans at a company, latest first"""
+    tenures = {user_id: [] for user_id in user_ids}
+    if tenures:
+        rows = db.session.query(
+            Experience.user_id, Experience.start_date, Experience.end_date, Experience.current
+        ).filter(
+            Experience.company_key == company_key(company_name),
+            Experience.user_id.in_(tenures.keys())
+        ).order_by(Experience.current.desc(), Experience.start_date.desc()).all()
+        for user_id, start_date, end_date, current in rows:
+            tenures[user_id].append((start_date, end_date, bool(current)))
+    return tenures
+
+
+def user_company_keys(user_id):
+    """Map the key of every company a user has worked at to whether they still do"""
+    companies = {}
+    for key, current in db.session.query(Experience.company_key, Experience.current).filter(
+        Experience.user_id == user_id, Experience.company_key.isnot(None)
+    ):
+        companies[key] = companies.get(key, False) or bool(current)
+    profile_key = db.session.query(User.current_company_key).filter(User.id == user_id).scalar()
+    if profile_key:
+        companies[profile_key] = True
+    return companies
+
+
+@event.listens_for(Experience, 'before_insert')
+@event.listens_for(Experience, 'before_update')
+def _key_on_write(mapper, connection, target):
+    target.company_key = company_key(target.company)
+
+
+@event.listens_for(User, 'before_insert')
+@event.listens_for(User, 'before_update')
+def _user_key_on_write(mapper, connection, target):
+    target.current_company_key = company_key(target.current_company) if target.current_company else None
@@ -58,6 +58,22 @@ with app.app_context():
     # Import models and routes
     import models
     import routes
+    import commands
+    import search_index
+    import suggest_index
+    import skill_index
+    import alumni_index
+    import connection_graph
+    import notification_counters
+    import conversation_threads
+    import live_events
+    import delta_sync
+    import read_receipts
+    import migrations
     
-    # Create all database tables
+    # Create all database tables, then bring older databases up to date
     db.create_all()
+    if os.environ.get('AUTO_MIGRATE', '1') != '0':
+        migrations.upgrade()
+    search_index.init_search_index()
+    suggest_index.build_suggest_index()
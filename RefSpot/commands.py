@@ -0,0 +1,277 @@
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import click
+from sqlalchemy import and_, func, or_, text
+
+from app import app, db
+from models import (User, UserSkill, Experience, Education, CompanyLogo, Connection, Message,
+                    ReferralRequest, JobReferral, JobPosting, Conversation)
+from logo_fetcher import normalize_company_name
+from logo_store import acquire_company_logo, release_company_logo, refresh_company_logo
+from logo_jobs import LOGO_PENDING, LOGO_READY, LOGO_MISSING
+from network_suggestions import refresh_suggestions
+from notification_counters import reconcile
+import migrations
+
+
+def _backfill_company(company_names, experience_ids, retry_missing):
+    """Resolve one company's logo and attach it to the given experiences"""
+    with app.app_context():
+        try:
+            filename = acquire_company_logo(next(iter(company_names)), count=len(experience_ids),
+                                            retry_missing=retry_missing)
+        except Exception as e:
+            app.logger.warning(f"Logo backfill failed for {company_names}: {e}")
+            db.session.rollback()
+            filename = None
+
+        # Skip rows that were edited since the batch was read
+        rows = Experience.query.filter(
+            Experience.id.in_(experience_ids),
+            Experience.company.in_(company_names),
+            Experience.company_logo.is_(None)
+        )
+        if filename:
+            updated = rows.update({Experience.company_logo: filename, Experience.logo_status: LOGO_READY},
+                                  synchronize_session=False)
+            for _ in range(len(experience_ids) - updated):
+                release_company_logo(filename)
+        else:
+            updated = rows.update({Experience.logo_status: LOGO_MISSING}, synchronize_session=False)
+
+        db.session.commit()
+        return updated if filename else 0
+
+
+def _refresh_entry(entry_id):
+    """Refetch one registry logo"""
+    with app.app_context():
+        entry = db.session.get(CompanyLogo, entry_id)
+        if entry is None:
+            return False
+        try:
+            old_filename = entry.filename
+            changed = refresh_company_logo(entry) != old_filename
+            db.session.commit()
+            return changed
+        except Exception as e:
+            app.logger.warning(f"Logo refresh failed for {entry.normalized_name!r}: {e}")
+            db.session.rollback()
+            return False
+
+
+def _report(label, done, extra, started, last_id):
+    """Print progress and throughput for a batch"""
+    rate = done / max(time.monotonic() - started, 1e-6)
+    click.echo(f"{label}: {done} processed, {extra} - {rate:.1f}/s (resume with --after-id {last_id})")
+
+
+@app.cli.command('backfill-logos')
+@click.option('--batch-size', default=500, show_default=True, help='Experience rows read and committed per batch')
+@click.option('--workers', default=4, show_default=True, help='Companies fetched concurrently')
+@click.option('--after-id', default=0, help='Resume after this Experience id')
+@click.option('--retry-missing', is_flag=True, help='Retry rows whose previous lookup found no logo')
+@click.option('--refresh-days', type=int, default=None, help='Also refetch registry logos older than this many days')
+def backfill_logos(batch_size, workers, after_id, retry_missing, refresh_days):
+    """Fetch logos for experiences that have none, fetching each company once"""
+    statuses = [LOGO_PENDING, LOGO_MISSING] if retry_missing else [LOGO_PENDING]
+    started = time.monotonic()
+    processed = with_logo = 0
+    last_id = after_id
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='logo-backfill') as executor:
+        while True:
+            batch = db.session.query(Experience.id, Experience.company).filter(
+                Experience.id > last_id,
+                Experience.company_logo.is_(None),
+                or_(Experience.logo_status.is_(None), Experience.logo_status.in_(statuses))
+            ).order_by(Experience.id).limit(batch_size).all()
+            db.session.rollback()
+            if not batch:
+                break
+
+            # One fetch per company, however many rows share it
+            groups = defaultdict(lambda: (set(), []))
+            for experience_id, company in batch:
+                names, ids = groups[normalize_company_name(company)]
+                names.add(company)
+                ids.append(experience_id)
+
+            futures = [executor.submit(_backfill_company, names, ids, retry_missing)
+                       for names, ids in groups.values()]
+            with_logo += sum(future.result() for future in futures)
+            processed += len(batch)
+            last_id = batch[-1].id
+            _report('Backfill', processed, f"{with_logo} with logos, {len(groups)} companies in batch",
+                    started, last_id)
+
+        if refresh_days is not None:
+            cutoff = datetime.utcnow() - timedelta(days=refresh_days)
+            refreshed = changed = 0
+            last_entry_id = 0
+            while True:
+                entry_ids = [row.id for row in db.session.query(CompanyLogo.id).filter(
+                    CompanyLogo.id > last_entry_id,
+                    CompanyLogo.updated_at < cutoff
+                ).order_by(CompanyLogo.id).limit(batch_size).all()]
+                db.session.rollback()
+                if not entry_ids:
+                    break
+
+                changed += sum(executor.map(_refresh_entry, entry_ids))
+                refreshed += len(entry_ids)
+                last_entry_id = entry_ids[-1]
+                click.echo(f"Refresh: {refreshed} company logos checked, {changed} replaced")
+
+    click.echo(f"Done: {processed} experiences, {with_logo} logos attached in {time.monotonic() - started:.1f}s")
+
+
+def _refresh_user_suggestions(user_id):
+    """Recompute one user's suggestions"""
+    with app.app_context():
+        try:
+            refresh_suggestions(user_id)
+            return True
+        except Exception as e:
+            app.logger.warning(f"Suggestion refresh failed for user {user_id}: {e}")
+            return False
+
+
+@app.cli.command('precompute-suggestions')
+@click.option('--active-days', default=14, show_default=True, help='Users with connection or message activity this recent')
+@click.option('--batch-size', default=500, show_default=True, help='Users read per batch')
+@click.option('--workers', default=4, show_default=True, help='Users computed concurrently')
+@click.option('--after-id', default=0, help='Resume after this User id')
+def precompute_suggestions(active_days, batch_size, workers, after_id):
+    """Cache "people you may know" for recently active users"""
+    cutoff = datetime.utcnow() - timedelta(days=active_days)
+    started = time.monotonic()
+
+    active = set()
+    for sender_id, receiver_id in db.session.query(Connection.sender_id, Connection.receiver_id).filter(
+        Connection.updated_at >= cutoff
+    ):
+        active.update([sender_id, receiver_id])
+    active.update(user_id for user_id, in db.session.query(Message.sender_id).filter(
+        Message.created_at >= cutoff
+    ).distinct())
+    db.session.rollback()
+
+    user_ids = sorted(user_id for user_id in active if user_id > after_id)
+    done = 0
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='suggestions-precompute') as executor:
+        for start in range(0, len(user_ids), batch_size):
+            batch = user_ids[start:start + batch_size]
+            done += sum(executor.map(_refresh_user_suggestions, batch))
+            _report('Suggestions', start + len(batch), f"{done} cached", started, batch[-1])
+
+    click.echo(f"Done: suggestions cached for {done} of {len(user_ids)} active users in {time.monotonic() - started:.1f}s")
+
+
+@app.cli.command('reconcile-counters')
+@click.option('--batch-size', default=1000, show_default=True, help='Users checked and committed per batch')
+@click.option('--after-id', default=0, help='Resume after this User id')
+def reconcile_counters(batch_size, after_id):
+    """Recount unread and pending badge counters and repair any that drifted"""
+    started = time.monotonic()
+    checked = repaired = 0
+    while True:
+        user_ids = [user_id for user_id, in db.session.query(User.id).filter(User.id > after_id)
+                    .order_by(User.id).limit(batch_size)]
+        if not user_ids:
+            break
+        repaired += reconcile(user_ids)
+        db.session.commit()
+        checked += len(user_ids)
+        after_id = user_ids[-1]
+        _report('Counters', checked, f"{repaired} repaired", started, after_id)
+
+    click.echo(f"Done: {checked} users checked, {repaired} counters repaired in {time.monotonic() - started:.1f}s")
+
+
+@app.cli.command('upgrade-db')
+def upgrade_db():
+    """Apply pending schema migrations"""
+    applied = migrations.upgrade()
+    click.echo(f"Done: {len(applied)} migrations applied" + (f" ({', '.join(map(str, applied))})" if applied else ''))
+
+
+@app.cli.command('db-status')
+def db_status():
+    """List schema migrations and whether each is applied"""
+    applied = migrations.applied_versions()
+    for version, name, _ in migrations.MIGRATIONS:
+        click.echo(f"{version:>4}  {'applied' if version in applied else 'pending':<8} {name}")
+
+
+def _hot_queries(user_id):
+    """(label, query) for the lookups routes.py runs on every page view"""
+    return [
+        ('connections', Connection.query.filter(or_(
+            and_(Connection.sender_id == user_id, Connection.status == 'accepted'),
+            and_(Connection.receiver_id == user_id, Connection.status == 'accepted')
+        )).order_by(Connection.created_at.desc(), Connection.id.desc())),
+        ('incoming connection requests', Connection.query.filter_by(receiver_id=user_id, status='pending')
+            .order_by(Connection.created_at.desc())),
+        ('outgoing connection requests', Connection.query.filter_by(sender_id=user_id, status='pending')
+            .order_by(Connection.created_at.desc())),
+        ('connection between', Connection.between(user_id, user_id + 1)),
+        ('conversation read state', Conversation.query.filter_by(low_user_id=user_id, high_user_id=user_id + 1)),
+        ('message requests', Message.query.filter_by(receiver_id=user_id, message_request_status='pending')
+            .order_by(Message.created_at.desc(), Message.id.desc())),
+        ('unread past watermark', Message.query.with_entities(func.count()).filter(
+            Message.sender_id == user_id + 1, Message.receiver_id == user_id,
+            Message.message_request_status == 'approved', Message.id > 0
+        )),
+        ('conversation', Message.query.filter(or_(
+            and_(Message.sender_id == user_id, Message.receiver_id == user_id + 1),
+            and_(Message.sender_id == user_id + 1, Message.receiver_id == user_id)
+        ), Message.message_request_status == 'approved').order_by(Message.created_at.asc())),
+        ('open referral requests', ReferralRequest.query.filter_by(status='open')
+            .order_by(ReferralRequest.created_at.desc(), ReferralRequest.id.desc())),
+        ('my referral requests', ReferralRequest.query.filter_by(job_seeker_id=user_id)
+            .order_by(ReferralRequest.created_at.desc(), ReferralRequest.id.desc())),
+        ('referrals given', JobReferral.query.filter_by(referrer_id=user_id)
+            .order_by(JobReferral.created_at.desc(), JobReferral.id.desc())),
+        ('referrals received', JobReferral.query.filter_by(candidate_id=user_id)
+            .order_by(JobReferral.created_at.desc(), JobReferral.id.desc())),
+        ('active jobs', JobPosting.query.filter_by(is_active=True)
+            .order_by(JobPosting.created_at.desc(), JobPosting.id.desc())),
+        ('profile skills', UserSkill.query.filter_by(user_id=user_id)),
+        ('profile experience', Experience.query.filter_by(user_id=user_id).order_by(Experience.start_date.desc())),
+        ('profile education', Education.query.filter_by(user_id=user_id).order_by(Education.start_year.desc())),
+        ('resume download', User.query.filter_by(resume_file='resume.pdf')),
+        ('skill posting list', UserSkill.query.filter_by(normalized_skill='python')),
+        ('current employees', Experience.query.filter_by(company_key='acme', current=True)),
+    ]
+
+
+def _full_scans(statement):
+    """Tables the database plans to read in full for a statement"""
+    if db.engine.dialect.name == 'sqlite':
+        plan = db.session.execute(text(f'EXPLAIN QUERY PLAN {statement}')).all()
+        # "SCAN t" reads every row; "SEARCH t USING INDEX" and covering scans don't
+        return [row[-1] for row in plan if row[-1].startswith('SCAN') and ' INDEX' not in row[-1]]
+    # Planners prefer sequential scans on small tables; rule them out to see whether an index could serve
+    db.session.execute(text('SET LOCAL enable_seqscan = off'))
+    plan = db.session.execute(text(f'EXPLAIN {statement}')).all()
+    return [row[0].strip() for row in plan if 'Seq Scan' in row[0]]
+
+
+@app.cli.command('check-indexes')
+@click.option('--user-id', default=1, show_default=True, help='User id bound into per-user queries')
+def check_indexes(user_id):
+    """EXPLAIN each hot query and fail if any reads a whole table"""
+    failures = 0
+    for label, query in _hot_queries(user_id):
+        statement = query.statement.compile(db.engine, compile_kwargs={'literal_binds': True})
+        scans = _full_scans(statement)
+        db.session.rollback()
+        click.echo(f"{'FULL SCAN' if scans else 'ok':<10}{label}" + (f": {'; '.join(scans)}" if scans else ''))
+        failures += bool(scans)
+    if failures:
+        raise click.ClickException(f"Hot queries not served by an index: {failures}")
+    click.echo("Done: every hot query uses an index")
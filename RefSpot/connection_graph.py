@@ -0,0 +1,169 @@
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from sqlalchemy import event, or_
+from sqlalchemy.orm import Session
+
+from app import db
+from models import Connection
+from shared_cache import cache_get, cache_get_many, cache_set
+
+# Per-process adjacency of the connection graph: for each user seen
+# recently, the ids they are connected to and have a pending request with.
+# A user's edges are loaded in one query the first time they are needed.
+# Committing a Connection change stamps a new version on both users in the
+# shared cache; every process compares versions on lookup and reloads a
+# user whose edges changed elsewhere. Without a shared cache the versions
+# live in this process only.
+GRAPH_CACHE_USERS = int(os.environ.get('GRAPH_CACHE_USERS', 20000))
+GRAPH_ENTRY_TTL = 600  # Reload an entry at least this often, in seconds
+GRAPH_VERSION_TTL = 30 * 24 * 3600
+
+# user id -> (version, loaded_at, accepted ids, pending ids)
+_adjacency = OrderedDict()
+_lock = threading.Lock()
+
+
+def _version_key(user_id):
+    return f"graph_version_{user_id}"
+
+
+def graph_version(user_id):
+    """Token that changes whenever a user's edges do"""
+    return cache_get(_version_key(user_id))
+
+
+def graph_versions(user_ids):
+    """graph_version of each user, read in one round trip"""
+    user_ids = list(user_ids)
+    return dict(zip(user_ids, cache_get_many(_version_key(user_id) for user_id in user_ids)))
+
+
+def _load(user_id):
+    """Read a user's accepted and pending edges from the database"""
+    accepted, pending = set(), set()
+    rows = db.session.query(Connection.sender_id, Connection.receiver_id, Connection.status).filter(
+        or_(Connection.low_user_id == user_id, Connection.high_user_id == user_id),
+        Connection.status.in_(['accepted', 'pending'])
+    ).all()
+    for sender_id, receiver_id, status in rows:
+        other_id = receiver_id if sender_id == user_id else sender_id
+        (accepted if status == 'accepted' else pending).add(other_id)
+    # An accepted connection wins over a leftover pending one
+    return frozenset(accepted), frozenset(pending - accepted)
+
+
+def _store(user_id, version, accepted, pending):
+    with _lock:
+        _adjacency[user_id] = (version, time.monotonic(), accepted, pending)
+        _adjacency.move_to_end(user_id)
+        while len(_adjacency) > GRAPH_CACHE_USERS:
+            _adjacency.popitem(last=False)
+
+
+def _fresh_entry(user_id, version):
+    """Cached (accepted, pending) for a user if still current, else None"""
+    with _lock:
+        entry = _adjacency.get(user_id)
+        if entry and entry[0] == version and time.monotonic() - entry[1] < GRAPH_ENTRY_TTL:
+            _adjacency.move_to_end(user_id)
+            return entry[2], entry[3]
+    return None
+
+
+def connection_state(user_id):
+    """Return (accepted ids, pending ids) for a user"""
+    version = graph_version(user_id)
+    entry = _fresh_entry(user_id, version)
+    if entry:
+        return entry
+
+    accepted, pending = _load(user_id)
+    _store(user_id, version, accepted, pending)
+    return accepted, pending
+
+
+def preload(user_ids, chunk_size=500):
+    """(accepted ids, pending ids) of every listed user, as a dict.
+
+    Versions are read in one cache round trip and users not cached are
+    loaded a chunk of users per query. Use the returned edges rather than
+    looking users up again, which a full adjacency cache may have evicted.
+    """
+    versions = graph_versions(set(user_ids))
+    states = {}
+    missing = []
+    for user_id, version in versions.items():
+        entry = _fresh_entry(user_id, version)
+        if entry is None:
+            missing.append(user_id)
+        else:
+            states[user_id] = entry
+
+    for start in range(0, len(missing), chunk_size):
+        chunk = missing[start:start + chunk_size]
+        accepted = {user_id: set() for user_id in chunk}
+        pending = {user_id: set() for user_id in chunk}
+        rows = db.session.query(Connection.sender_id, Connection.receiver_id, Connection.status).filter(
+            or_(Connection.low_user_id.in_(chunk), Connection.high_user_id.in_(chunk)),
+            Connection.status.in_(['accepted', 'pending'])
+        ).all()
+        for sender_id, receiver_id, status in rows:
+            for user_id, other_id in [(sender_id, receiver_id), (receiver_id, sender_id)]:
+                if user_id in accepted:
+                    (accepted if status == 'accepted' else pending)[user_id].add(other_id)
+        for user_id in chunk:
+            states[user_id] = frozenset(accepted[user_id]), frozenset(pending[user_id] - accepted[user_id])
+            _store(user_id, versions[user_id], *states[user_id])
+    return states
+
+
+def is_connected(user_id, other_id):
+    return other_id in connection_state(user_id)[0]
+
+
+def has_pending(user_id, other_id):
+    return other_id in connection_state(user_id)[1]
+
+
+def connected_ids(user_id):
+    """Ids of everyone a user is connected to"""
+    return connection_state(user_id)[0]
+
+
+def invalidate_users(user_ids):
+    """Drop cached edges for users here and in every other process"""
+    with _lock:
+        for user_id in user_ids:
+            _adjacency.pop(user_id, None)
+    for user_id in user_ids:
+        cache_set(_version_key(user_id), uuid.uuid4().hex, GRAPH_VERSION_TTL)
+
+
+@event.listens_for(Session, 'after_flush')
+def _collect_graph_changes(session, flush_context):
+    """Note the users whose edges the flush changed"""
+    changed = session.info.setdefault('graph_users_changed', set())
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, Connection):
+            changed.update([obj.sender_id, obj.receiver_id])
+
+
+@event.listens_for(Session, 'after_commit')
+def _apply_graph_changes(session):
+    changed = session.info.pop('graph_users_changed', None)
+    if changed:
+        invalidate_users(changed)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_graph_changes(session):
+    # Edges read inside the failed transaction may include its own writes
+    changed = session.info.pop('graph_users_changed', None)
+    if changed:
+        with _lock:
+            for user_id in changed:
+                _adjacency.pop(user_id, None)
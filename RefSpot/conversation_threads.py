@@ -0,0 +1,209 @@
+from collections import defaultdict
+
+from sqlalchemy import event, func, inspect, case, delete, insert, select, update, and_, or_
+from sqlalchemy.orm import Session
+
+from app import db
+from models import Message, Connection, Conversation
+from pagination import Page, PAGE_SIZE, paginate, encode_cursor
+
+# Inbox summaries: one Conversation row per pair of users who have
+# exchanged approved messages, holding the latest message and each side's
+# unread count, so the inbox is one indexed query over a user's
+# conversations however long their history. Flushes that add an approved
+# message update the row in the same transaction; deleting or un-approving
+# one recounts the pair. Read state is a watermark per side rather than a
+# flag per message: a side has read every message to it with an id up to
+# its read id, and its unread count is the messages past that. Viewing a
+# conversation moves the watermark through read_receipts, which only writes
+# when it advances. Bulk statements in routes.py call recount_conversation.
+_table = Conversation.__table__
+
+
+def _thread_state(obj, old=False):
+    """(pair, unread side or None, created_at) if the message is approved, else None"""
+    state = inspect(obj)
+    values = {}
+    for column in ['sender_id', 'receiver_id', 'message_request_status', 'created_at']:
+        history = state.attrs[column].history
+        values[column] = history.deleted[0] if old and history.deleted else getattr(obj, column)
+    if (values['message_request_status'] or 'approved') != 'approved':
+        return None
+    pair = Connection.pair(values['sender_id'], values['receiver_id'])
+    # A message is written past its receiver's watermark, so it starts unread
+    side = 'low_unread' if values['receiver_id'] == pair[0] else 'high_unread'
+    return pair, side, values['created_at']
+
+
+def _pair_filter(low, high):
+    return and_(
+        or_(and_(Message.sender_id == low, Message.receiver_id == high),
+            and_(Message.sender_id == high, Message.receiver_id == low)),
+        Message.message_request_status == 'approved'
+    )
+
+
+def _insert_if_absent(connection, values):
+    """Insert a Conversation row unless its pair already has one; returns whether it did"""
+    exists = connection.execute(select(_table.c.id).where(
+        _table.c.low_user_id == values['low_user_id'], _table.c.high_user_id == values['high_user_id']
+    )).first()
+    if exists:
+        return False
+    connection.execute(insert(_table).values(**values))
+    return True
+
+
+def unread_past(connection, sender_id, receiver_id, read_id):
+    """Approved messages from sender_id to receiver_id after the watermark read_id"""
+    return connection.execute(select(func.count()).select_from(Message.__table__).where(
+        Message.sender_id == sender_id, Message.receiver_id == receiver_id,
+        Message.message_request_status == 'approved', Message.id > (read_id or 0)
+    )).scalar()
+
+
+def advance_read(connection, reader_id, other_id, message_id):
+    """Move reader_id's watermark in the pair up to message_id; returns whether it moved.
+
+    Only a watermark behind message_id is written, so repeat views of a read
+    conversation cost no write, and of two racing readers one wins.
+    """
+    low, high = Connection.pair(reader_id, other_id)
+    side = 'low' if reader_id == low else 'high'
+    read_id = _table.c[f'{side}_read_id']
+    return bool(connection.execute(update(_table).where(
+        _table.c.low_user_id == low, _table.c.high_user_id == high, read_id < message_id
+    ).values(**{
+        f'{side}_read_id': message_id,
+        # Messages newer than message_id may have arrived since the page was read
+        f'{side}_unread': select(func.count()).select_from(Message.__table__).where(
+            Message.sender_id == other_id, Message.receiver_id == reader_id,
+            Message.message_request_status == 'approved', Message.id > message_id
+        ).scalar_subquery()
+    })).rowcount)
+
+
+def read_marks(user_id, other_ids):
+    """{(receiver id, sender id): read watermark} for user_id's conversations with other_ids"""
+    other_ids = list(set(other_ids))
+    marks = {}
+    if not other_ids:
+        return marks
+    for thread in Conversation.query.filter(or_(
+        and_(Conversation.low_user_id == user_id, Conversation.high_user_id.in_(other_ids)),
+        and_(Conversation.high_user_id == user_id, Conversation.low_user_id.in_(other_ids))
+    )):
+        marks[(thread.low_user_id, thread.high_user_id)] = thread.low_read_id
+        marks[(thread.high_user_id, thread.low_user_id)] = thread.high_read_id
+    return marks
+
+
+def refresh_pair(connection, low, high):
+    """Rebuild one pair's row from its messages, deleting it if none are left"""
+    latest = connection.execute(select(Message.id, Message.created_at).where(_pair_filter(low, high))
+                                .order_by(Message.created_at.desc(), Message.id.desc()).limit(1)).first()
+    if not latest:
+        connection.execute(delete(_table).where(_table.c.low_user_id == low, _table.c.high_user_id == high))
+        return
+
+    marks = connection.execute(select(_table.c.low_read_id, _table.c.high_read_id).where(
+        _table.c.low_user_id == low, _table.c.high_user_id == high
+    )).first()
+    values = {'last_message_id': latest.id, 'last_message_at': latest.created_at,
+              'low_unread': unread_past(connection, high, low, marks.low_read_id if marks else 0),
+              'high_unread': unread_past(connection, low, high, marks.high_read_id if marks else 0)}
+    updated = connection.execute(update(_table).where(
+        _table.c.low_user_id == low, _table.c.high_user_id == high
+    ).values(**values)).rowcount
+    if not updated:
+        _insert_if_absent(connection, dict(low_user_id=low, high_user_id=high, **values))
+
+
+def _advance(connection, low, high, changes):
+    """Apply unread deltas and a possibly newer last message to a pair's row"""
+    values = {side: _table.c[side] + delta for side, delta in changes['unread'].items() if delta}
+    latest = changes['latest']
+    if latest:
+        created_at, message_id = latest
+        newer = or_(_table.c.last_message_at < created_at,
+                    and_(_table.c.last_message_at == created_at, _table.c.last_message_id < message_id))
+        values['last_message_id'] = case((newer, message_id), else_=_table.c.last_message_id)
+        values['last_message_at'] = case((newer, created_at), else_=_table.c.last_message_at)
+    if not values:
+        return
+    updated = connection.execute(update(_table).where(
+        _table.c.low_user_id == low, _table.c.high_user_id == high
+    ).values(**values)).rowcount
+    if not updated:
+        # First approved message of the pair; the flush already wrote it
+        refresh_pair(connection, low, high)
+
+
+def recount_conversation(user_id, other_id):
+    """Rebuild the pair's row within the current transaction"""
+    refresh_pair(db.session.connection(), *Connection.pair(user_id, other_id))
+
+
+def history_page(user_id, other_id, cursor=None, limit=PAGE_SIZE):
+    """One Page of the approved messages between two users, newest first.
+
+    Each direction is read as its own range of the (sender, receiver,
+    created_at) index and the two are merged, so a page costs the same
+    however long the conversation is.
+    """
+    rows, more = [], False
+    for sender_id, receiver_id in [(user_id, other_id), (other_id, user_id)]:
+        page = paginate(Message.query.filter_by(sender_id=sender_id, receiver_id=receiver_id,
+                                                message_request_status='approved'),
+                        Message.created_at, Message.id, cursor, limit)
+        rows += page.items
+        more = more or bool(page.next_cursor)
+    rows.sort(key=lambda message: (message.created_at, message.id), reverse=True)
+    items = rows[:limit]
+    if items and (more or len(rows) > limit):
+        return Page(items, encode_cursor(items[-1].created_at, items[-1].id))
+    return Page(items, None)
+
+
+@event.listens_for(Session, 'after_flush')
+def _thread_changes(session, flush_context):
+    """Apply the flush's approved messages to their conversations in the same transaction"""
+    changes = defaultdict(lambda: {'unread': defaultdict(int), 'latest': None, 'recount': False})
+
+    def added(thread, message_id):
+        pair, side, created_at = thread
+        if side:
+            changes[pair]['unread'][side] += 1
+        if created_at is None:
+            changes[pair]['recount'] = True
+        elif not changes[pair]['latest'] or (created_at, message_id) > changes[pair]['latest']:
+            changes[pair]['latest'] = (created_at, message_id)
+
+    for obj in session.new:
+        if isinstance(obj, Message):
+            thread = _thread_state(obj)
+            if thread:
+                added(thread, obj.id)
+    for obj in session.dirty:
+        if isinstance(obj, Message) and session.is_modified(obj, include_collections=False):
+            old, new = _thread_state(obj, old=True), _thread_state(obj)
+            if old and new and old[0] == new[0] and old[2] == new[2]:
+                # Nothing the conversation shows has changed
+                continue
+            # An approved request may be older than the watermark, so count it afresh
+            for thread in [old, new]:
+                if thread:
+                    changes[thread[0]]['recount'] = True
+    for obj in session.deleted:
+        if isinstance(obj, Message):
+            old = _thread_state(obj, old=True)
+            if old:
+                changes[old[0]]['recount'] = True
+
+    if changes:
+        connection = session.connection()
+        for (low, high), pair_changes in changes.items():
+            if pair_changes['recount']:
+                refresh_pair(connection, low, high)
+            else:
+                _advance(connection, low, high, pair_changes)
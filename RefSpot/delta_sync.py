@@ -0,0 +1,122 @@
+from sqlalchemy import event, select, update, insert
+from sqlalchemy.orm import Session
+
+from app import db
+from models import Message, Connection, Conversation, UserCounter, SyncSequence, sync_change_seq
+
+# Change log for clients that poll instead of holding an event stream open.
+# Every flush that writes a Message or Connection takes the next number
+# from a global sequence and stamps it on the changed rows (change_seq) and
+# on each affected user's counter row (sync_seq). A client keeps the last
+# number it saw as its cursor: an idle poll is one primary-key read of its
+# counter row, and a busy one reads the rows past the cursor from the
+# (user, change_seq) indexes. The affected counter rows are locked before
+# the number is taken, so a user's changes commit in sequence order and a
+# cursor never skips a change still in flight. Deleted rows leave no trace
+# beyond the counters. Read receipts travel as the Conversation rows whose
+# read watermarks moved, stamped by read_receipts.
+SYNC_LIMIT = 200  # Rows of each kind per response
+
+# Synced model -> its two user id columns
+SYNCED_MODELS = {
+    Message: ('receiver_id', 'sender_id'),
+    Connection: ('receiver_id', 'sender_id'),
+    Conversation: ('low_user_id', 'high_user_id'),
+}
+
+_counters = UserCounter.__table__
+
+
+def _next_seq(connection):
+    if connection.dialect.name == 'postgresql':
+        return connection.execute(select(sync_change_seq.next_value())).scalar()
+    # SQLite and friends serialize writers, so a single counter row is enough
+    table = SyncSequence.__table__
+    if not connection.execute(update(table).where(table.c.id == 1).values(value=table.c.value + 1)).rowcount:
+        connection.execute(insert(table).values(id=1, value=1))
+    return connection.execute(select(table.c.value).where(table.c.id == 1)).scalar()
+
+
+def lock_users(connection, user_ids):
+    """Lock the users' counter rows, in a fixed order to avoid deadlocks"""
+    connection.execute(select(_counters.c.user_id).where(_counters.c.user_id.in_(set(user_ids)))
+                       .order_by(_counters.c.user_id).with_for_update())
+
+
+def _stamp(connection, user_ids, rows=()):
+    """Give the changed rows and their users the next change number; returns it"""
+    user_ids = sorted(set(user_ids))
+    # Lock the users' counter rows first; a no-op for rows this transaction already holds
+    lock_users(connection, user_ids)
+    seq = _next_seq(connection)
+    connection.execute(update(_counters).where(_counters.c.user_id.in_(user_ids)).values(sync_seq=seq))
+    for model, ids in rows:
+        if ids:
+            connection.execute(update(model.__table__).where(model.__table__.c.id.in_(ids)).values(change_seq=seq))
+    return seq
+
+
+def record_change(user_ids):
+    """Take a change number for users whose rows a bulk statement is about to change"""
+    return _stamp(db.session.connection(), user_ids)
+
+
+def sync_state(user_id):
+    """The user's latest change number, or 0 if nothing has changed for them"""
+    return db.session.execute(select(_counters.c.sync_seq).where(_counters.c.user_id == user_id)).scalar() or 0
+
+
+def _changed(model, user_id, since, limit=None, through=None):
+    """Rows of model involving user_id changed after since, in change order"""
+    rows = {}
+    for column in SYNCED_MODELS[model]:
+        query = model.query.filter(getattr(model, column) == user_id, model.change_seq > since)
+        if through is not None:
+            query = query.filter(model.change_seq <= through)
+        query = query.order_by(model.change_seq, model.id)
+        for row in (query.limit(limit + 1) if limit else query):
+            rows[row.id] = row
+    return sorted(rows.values(), key=lambda row: (row.change_seq, row.id))
+
+
+def changes_since(user_id, since, limit=SYNC_LIMIT):
+    """Return ({model: rows}, cursor, has_more) for a user's changes after cursor since.
+
+    A response never splits one change number: past the limit every list
+    stops before the first change that may be incomplete, and a single change
+    bigger than the limit (such as a bulk delete) is sent whole.
+    """
+    changes = {model: _changed(model, user_id, since, limit) for model in SYNCED_MODELS}
+    every = [row for rows in changes.values() for row in rows]
+    boundaries = [rows[limit].change_seq for rows in changes.values() if len(rows) > limit]
+    if not boundaries:
+        return changes, max([since] + [row.change_seq for row in every]), False
+
+    cursor = min(boundaries) - 1
+    if not any(row.change_seq <= cursor for row in every):
+        cursor = min(boundaries)
+        changes = {model: _changed(model, user_id, since, through=cursor) for model in SYNCED_MODELS}
+    changes = {model: [row for row in rows if row.change_seq <= cursor] for model, rows in changes.items()}
+    return changes, cursor, True
+
+
+# Runs before every other after_flush listener (insert=True), so a flush locks
+# its users' counter rows, in id order, before notification_counters and
+# conversation_threads write counter and Conversation rows; two flushes, or a
+# flush and a read receipt, then never take those locks in opposite orders
+@event.listens_for(Session, 'after_flush', insert=True)
+def _stamp_changes(session, flush_context):
+    """Stamp the flush's Message and Connection rows with one change number"""
+    changed = {Message: [], Connection: []}
+    user_ids = set()
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        model = type(obj)
+        if model not in changed:
+            continue
+        if obj in session.dirty and not session.is_modified(obj, include_collections=False):
+            continue
+        user_ids.update([obj.sender_id, obj.receiver_id])
+        if obj not in session.deleted:
+            changed[model].append(obj.id)
+    if user_ids:
+        _stamp(session.connection(), user_ids, changed.items())
@@ -0,0 +1,100 @@
+import csv
+import os
+import re
+import threading
+
+# Registry of known company -> domain mappings, compiled into a word trie so
+# lookups cost one walk over the name's words no matter how many entries
+# the registry holds
+COMPANY_DOMAINS_FILE = os.environ.get(
+    'COMPANY_DOMAINS_FILE',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'company_domains.csv')
+)
+
+_END = ''  # Trie key marking a complete company name; words are never empty
+
+_mappings = {}
+_trie = None
+_max_words = 0
+_loaded = False
+_lock = threading.Lock()
+_load_lock = threading.Lock()
+
+
+def _words(name):
+    """Split a company name into lower-case words"""
+    name = name.lower().replace('&', ' and ')
+    return re.sub(r'[^a-z0-9]+', ' ', name).split()
+
+
+def register_company_domain(company_name, domain):
+    """Add or replace a company -> domain mapping"""
+    global _trie
+    key = tuple(_words(company_name))
+    if not key or not domain:
+        return
+    with _lock:
+        _mappings[key] = domain.strip().lower()
+        _trie = None
+
+
+def load_company_domains(path=None):
+    """Load company,domain rows from a CSV file; returns the number of rows loaded"""
+    path = path or COMPANY_DOMAINS_FILE
+    count = 0
+    with open(path, newline='') as f:
+        rows = csv.reader(line for line in f if line.strip() and not line.startswith('#'))
+        for row in rows:
+            if len(row) < 2 or row[0].strip().lower() == 'company':
+                continue
+            register_company_domain(row[0], row[1])
+            count += 1
+    return count
+
+
+def _ensure_loaded():
+    """Load the default data file the first time the registry is used"""
+    global _loaded
+    with _load_lock:
+        if not _loaded:
+            if os.path.exists(COMPANY_DOMAINS_FILE):
+                load_company_domains()
+            _loaded = True
+
+
+def _compile():
+    """Build the word trie from the registry"""
+    global _trie, _max_words
+    _ensure_loaded()
+    with _lock:
+        trie = {}
+        for key, domain in _mappings.items():
+            node = trie
+            for word in key:
+                node = node.setdefault(word, {})
+            node[_END] = domain
+        _max_words = max((len(key) for key in _mappings), default=0)
+        _trie = trie
+        return trie
+
+
+def resolve_company_domain(company_name):
+    """Return the domain of the longest known company name contained in company_name.
+
+    Names match on whole words, so "hp" matches "HP Inc" but not "Shpock".
+    """
+    trie = _trie if _trie is not None else _compile()
+    words = _words(company_name or '')
+
+    best_domain = None
+    best_length = 0
+    for start in range(len(words)):
+        node = trie
+        for end in range(start, min(len(words), start + _max_words)):
+            node = node.get(words[end])
+            if node is None:
+                break
+            if _END in node and end - start + 1 > best_length:
+                best_domain = node[_END]
+                best_length = end - start + 1
+    return best_domain
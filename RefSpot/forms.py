@@ -123,6 +123,8 @@ class SearchForm(FlaskForm):
     query = StringField('Search', validators=[DataRequired()])
     search_type = SelectField('Search In', choices=[
         ('people', 'People'),
+        ('skills', 'People by Skill'),
+        ('company', 'People by Company'),
         ('jobs', 'Jobs'),
         ('all', 'Everything')
     ], default='people')
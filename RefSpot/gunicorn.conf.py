@@ -0,0 +1,12 @@
+import os
+
+# Read by gunicorn from the working directory. Each open /api/events stream
+# holds a worker thread until it ends (live_events.LIVE_STREAM_LIFETIME), so
+# use threaded workers with enough threads for the expected open pages on
+# top of ordinary requests; sync workers would be taken whole by one stream.
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:5000')
+worker_class = 'gthread'
+workers = int(os.environ.get('GUNICORN_WORKERS', 2))
+threads = int(os.environ.get('GUNICORN_THREADS', 50))
+timeout = 60
+graceful_timeout = 30
@@ -0,0 +1,100 @@
+import io
+import os
+from PIL import Image
+
+# Square bounding boxes (in px) that every uploaded or fetched image is
+# pre-scaled to, each stored as WebP with a JPEG fallback
+VARIANT_SIZES = (32, 64, 128)
+VARIANT_FORMATS = ('webp', 'jpg')
+
+# Variants already seen on disk, so templates don't stat files on every render
+_known_variants = set()
+
+
+def variant_filename(filename, size, fmt):
+    """Name of the variant of an image at the given size and format"""
+    base = filename.rsplit('.', 1)[0]
+    return f"{base}_{size}.{fmt}"
+
+
+def pick_variant_size(display_size):
+    """Smallest variant that covers the display size, or the largest one"""
+    for size in VARIANT_SIZES:
+        if size >= display_size:
+            return size
+    return VARIANT_SIZES[-1]
+
+
+def open_image_for_size(source, max_size):
+    """Open image bytes or a path, decoding large JPEGs at a reduced scale"""
+    image = Image.open(io.BytesIO(source) if isinstance(source, bytes) else source)
+    # JPEG can be decoded straight to 1/2, 1/4 or 1/8 scale, which is far
+    # cheaper than decoding full size and resizing afterwards
+    image.draft('RGB', (max_size, max_size))
+    return image
+
+
+def flatten_to_rgb(image):
+    """Convert an image to RGB, placing any transparency on white"""
+    if image.mode in ('RGBA', 'LA', 'P'):
+        if image.mode != 'RGBA':
+            image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        background.paste(image, mask=image.split()[-1])
+        return background
+    if image.mode != 'RGB':
+        return image.convert('RGB')
+    return image
+
+
+def generate_variants(image, folder, filename):
+    """Write WebP and JPEG variants of an image at every VARIANT_SIZES"""
+    os.makedirs(folder, exist_ok=True)
+    image = flatten_to_rgb(image)
+    written = []
+
+    # Work down from the largest size so each step shrinks the previous one
+    for size in sorted(VARIANT_SIZES, reverse=True):
+        image.thumbnail((size, size), Image.Resampling.LANCZOS, reducing_gap=3.0)
+        for fmt in VARIANT_FORMATS:
+            name = variant_filename(filename, size, fmt)
+            if fmt == 'webp':
+                image.save(os.path.join(folder, name), 'WEBP', quality=80, method=4)
+            else:
+                image.save(os.path.join(folder, name), 'JPEG', quality=85, optimize=True)
+            _known_variants.add(os.path.abspath(os.path.join(folder, name)))
+            written.append(name)
+
+    return written
+
+
+def generate_variants_from_file(folder, filename):
+    """Generate variants for an image already saved in folder"""
+    try:
+        image = open_image_for_size(os.path.join(folder, filename), max(VARIANT_SIZES))
+        return generate_variants(image, folder, filename)
+    except Exception as e:
+        print(f"Error generating image variants: {e}")
+        return []
+
+
+def delete_variants(folder, filename):
+    """Delete every variant of an image"""
+    for size in VARIANT_SIZES:
+        for fmt in VARIANT_FORMATS:
+            path = os.path.abspath(os.path.join(folder, variant_filename(filename, size, fmt)))
+            _known_variants.discard(path)
+            if os.path.exists(path):
+                os.remove(path)
+
+
+def find_variant(folder, filename, display_size, fmt='jpg'):
+    """Return the variant filename to serve for a display size, or None if missing"""
+    name = variant_filename(filename, pick_variant_size(display_size), fmt)
+    path = os.path.abspath(os.path.join(folder, name))
+    if path in _known_variants:
+        return name
+    if os.path.exists(path):
+        _known_variants.add(path)
+        return name
+    return None
@@ -0,0 +1,192 @@
+import json
+import os
+import queue
+import threading
+import time
+from collections import defaultdict
+
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+from app import app
+from models import User, Message, Connection
+
+# Live notifications for open pages, streamed as server-sent events. A
+# flush that adds a message or connection request, approves a message
+# request or accepts a connection queues an event for the other user, as
+# does a moved read watermark (read_receipts); committing publishes it.
+# With LIVE_EVENTS_REDIS_URL set, events go
+# through Redis pub/sub so a stream on any web process receives them;
+# otherwise they are fanned out within this process, which is enough for a
+# single node and for tests. Each open stream holds a worker thread, so
+# serve the app with threaded or async workers (gunicorn.conf.py); a stream
+# ends after LIVE_STREAM_LIFETIME seconds and the browser reconnects, so
+# threads held by clients that vanished without closing are released.
+LIVE_EVENTS_REDIS_URL = os.environ.get('LIVE_EVENTS_REDIS_URL', os.environ.get('REDIS_URL'))
+LIVE_HEARTBEAT = 15  # Seconds between keep-alive comments on an idle stream
+LIVE_STREAM_LIFETIME = int(os.environ.get('LIVE_STREAM_LIFETIME', 300))
+LIVE_QUEUE_SIZE = 100  # Events buffered per stream before the oldest are dropped
+LIVE_CHANNEL_PREFIX = 'live_events:'
+
+
+class LocalBroker:
+    """Fans events out to the streams open in this process"""
+
+    def __init__(self):
+        self._subscribers = defaultdict(set)
+        self._lock = threading.Lock()
+
+    def publish(self, user_id, payload):
+        with self._lock:
+            subscribers = list(self._subscribers.get(user_id, ()))
+        for events in subscribers:
+            try:
+                events.put_nowait(payload)
+            except queue.Full:
+                # A stalled client loses its oldest event rather than holding memory
+                try:
+                    events.get_nowait()
+                    events.put_nowait(payload)
+                except (queue.Empty, queue.Full):
+                    pass
+
+    def subscribe(self, user_id):
+        events = queue.Queue(maxsize=LIVE_QUEUE_SIZE)
+        with self._lock:
+            self._subscribers[user_id].add(events)
+        return events
+
+    def unsubscribe(self, user_id, events):
+        with self._lock:
+            self._subscribers[user_id].discard(events)
+            if not self._subscribers[user_id]:
+                del self._subscribers[user_id]
+
+
+class RedisBroker(LocalBroker):
+    """Publishes through Redis; one listener thread per process feeds the local streams"""
+
+    def __init__(self, url):
+        super().__init__()
+        import redis
+        self._redis = redis.Redis.from_url(url)
+        self._listener = None
+
+    def publish(self, user_id, payload):
+        try:
+            self._redis.publish(f"{LIVE_CHANNEL_PREFIX}{user_id}", payload)
+        except Exception as e:
+            # Redis is not available, deliver to this process only
+            app.logger.warning(f"Live event publish failed: {e}")
+            super().publish(user_id, payload)
+
+    def subscribe(self, user_id):
+        with self._lock:
+            if self._listener is None or not self._listener.is_alive():
+                self._listener = threading.Thread(target=self._listen, name='live-events', daemon=True)
+                self._listener.start()
+        return super().subscribe(user_id)
+
+    def _listen(self):
+        while True:
+            try:
+                pubsub = self._redis.pubsub(ignore_subscribe_messages=True)
+                pubsub.psubscribe(f"{LIVE_CHANNEL_PREFIX}*")
+                for message in pubsub.listen():
+                    user_id = int(message['channel'].decode()[len(LIVE_CHANNEL_PREFIX):])
+                    LocalBroker.publish(self, user_id, message['data'].decode())
+            except Exception as e:
+                app.logger.warning(f"Live event listener reconnecting: {e}")
+                time.sleep(5)
+
+
+broker = RedisBroker(LIVE_EVENTS_REDIS_URL) if LIVE_EVENTS_REDIS_URL else LocalBroker()
+
+
+def publish(user_id, event_type, data):
+    """Send an event to every open stream of a user"""
+    broker.publish(user_id, json.dumps({'event': event_type, 'data': data}))
+
+
+def stream(user_id):
+    """Server-sent event lines for a user, with keep-alives, until the client disconnects or the lifetime ends"""
+    events = broker.subscribe(user_id)
+    ends_at = time.monotonic() + LIVE_STREAM_LIFETIME
+    try:
+        yield "retry: 5000\n\n"
+        while True:
+            remaining = ends_at - time.monotonic()
+            if remaining <= 0:
+                return
+            try:
+                payload = json.loads(events.get(timeout=min(LIVE_HEARTBEAT, remaining)))
+            except queue.Empty:
+                yield ": keep-alive\n\n"
+                continue
+            yield f"event: {payload['event']}\ndata: {json.dumps(payload['data'])}\n\n"
+    finally:
+        broker.unsubscribe(user_id, events)
+
+
+def queue_event(session, user_id, event_type, data):
+    """Publish an event once the session's transaction commits"""
+    session.info.setdefault('live_events', []).append((user_id, event_type, data))
+
+
+def _user_summary(session, user_id):
+    # The acting user is normally already in the session
+    user = session.get(User, user_id)
+    return {'id': user_id, 'username': user.username, 'full_name': user.get_full_name()} if user else {'id': user_id}
+
+
+def _message_data(session, message):
+    return {
+        'id': message.id,
+        'sender': _user_summary(session, message.sender_id),
+        'receiver_id': message.receiver_id,
+        'content': message.content,
+        'created_at': message.created_at.isoformat() if message.created_at else None
+    }
+
+
+def _changed_to(obj, column, value):
+    history = inspect(obj).attrs[column].history
+    return history.added and history.added[0] == value and not (history.deleted and history.deleted[0] == value)
+
+
+@event.listens_for(Session, 'after_flush')
+def _collect_live_events(session, flush_context):
+    """Queue (user id, event, data) for the flush's messages and connection changes"""
+    pending = session.info.setdefault('live_events', [])
+    for obj in session.new:
+        if isinstance(obj, Message):
+            kind = 'message_request' if obj.message_request_status == 'pending' else 'message'
+            if obj.message_request_status in (None, 'approved', 'pending'):
+                pending.append((obj.receiver_id, kind, _message_data(session, obj)))
+        elif isinstance(obj, Connection) and obj.status in (None, 'pending'):
+            pending.append((obj.receiver_id, 'connection_request', {
+                'id': obj.id, 'sender': _user_summary(session, obj.sender_id), 'message': obj.message
+            }))
+    for obj in session.dirty:
+        if isinstance(obj, Message) and _changed_to(obj, 'message_request_status', 'approved'):
+            pending.append((obj.sender_id, 'message_request_approved', {
+                'id': obj.id, 'receiver': _user_summary(session, obj.receiver_id)
+            }))
+        elif isinstance(obj, Connection) and _changed_to(obj, 'status', 'accepted'):
+            pending.append((obj.sender_id, 'connection_accepted', {
+                'id': obj.id, 'receiver': _user_summary(session, obj.receiver_id)
+            }))
+
+
+@event.listens_for(Session, 'after_commit')
+def _publish_live_events(session):
+    for user_id, event_type, data in session.info.pop('live_events', []):
+        try:
+            publish(user_id, event_type, data)
+        except Exception as e:
+            app.logger.warning(f"Live event for user {user_id} not sent: {e}")
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_live_events(session):
+    session.info.pop('live_events', None)
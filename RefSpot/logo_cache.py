@@ -0,0 +1,54 @@
+import os
+
+from shared_cache import cache_get, cache_set, cache_delete
+
+# How long lookup outcomes are remembered, in seconds. Misses expire sooner
+# than hits so a company that later gains a logo is picked up again.
+LOGO_HIT_TTL = int(os.environ.get('LOGO_HIT_TTL', 7 * 24 * 3600))
+LOGO_MISS_TTL = int(os.environ.get('LOGO_MISS_TTL', 24 * 3600))
+LOGO_DEAD_DOMAIN_TTL = int(os.environ.get('LOGO_DEAD_DOMAIN_TTL', 6 * 3600))
+
+# Stored for companies with no discoverable logo
+_MISSING = '-'
+
+
+def _lookup_key(normalized_name):
+    return f"logo_lookup_{normalized_name}"
+
+
+def _domain_key(domain):
+    return f"logo_dead_domain_{domain}"
+
+
+def get_cached_lookup(normalized_name):
+    """Return (found, filename) for a company; filename is None for a cached miss"""
+    value = cache_get(_lookup_key(normalized_name))
+    if value is None:
+        return False, None
+    return True, (None if value == _MISSING else value)
+
+
+def remember_logo(normalized_name, filename):
+    """Cache a successful lookup"""
+    cache_set(_lookup_key(normalized_name), filename, LOGO_HIT_TTL)
+
+
+def remember_missing_logo(normalized_name):
+    """Cache a failed lookup so it is not retried until the miss TTL expires"""
+    cache_set(_lookup_key(normalized_name), _MISSING, LOGO_MISS_TTL)
+
+
+def forget_lookup(normalized_name):
+    """Drop any cached outcome for a company"""
+    cache_delete(_lookup_key(normalized_name))
+
+
+def get_dead_domains(domains):
+    """Return the subset of domains that recently yielded no logo"""
+    return {domain for domain in domains if cache_get(_domain_key(domain))}
+
+
+def mark_domains_dead(domains):
+    """Remember domains that yielded no logo"""
+    for domain in domains:
+        cache_set(_domain_key(domain), 1, LOGO_DEAD_DOMAIN_TTL)
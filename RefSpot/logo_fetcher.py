@@ -1,61 +1,82 @@
 import requests
 import os
+import re
+import time
 import uuid
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from requests.adapters import HTTPAdapter
 from urllib.parse import urlparse
 from PIL import Image
 import io
+from domain_resolver import resolve_company_domain
+from image_variants import (VARIANT_SIZES, open_image_for_size, flatten_to_rgb,
+                            generate_variants, delete_variants)
 
 COMPANY_LOGO_FOLDER = 'static/uploads/company_logos'
 
+# Logo sources, tried in this order of preference. Every candidate URL comes
+# from these templates, so LOGO_CLEARBIT_URL and LOGO_FAVICON_URLS (comma
+# separated) can point the prober at a local stub server.
+CLEARBIT_URL_TEMPLATE = os.environ.get('LOGO_CLEARBIT_URL', 'https://logo.clearbit.com/{domain}')
+FAVICON_URL_TEMPLATES = [
+    "https://www.google.com/s2/favicons?domain={domain}&sz=128",
+    CLEARBIT_URL_TEMPLATE,
+    "https://{domain}/favicon.ico",
+    "https://{domain}/favicon.png",
+    "https://{domain}/apple-touch-icon.png",
+    "https://{domain}/android-chrome-192x192.png"
+]
+if os.environ.get('LOGO_FAVICON_URLS'):
+    FAVICON_URL_TEMPLATES = os.environ['LOGO_FAVICON_URLS'].split(',')
+
+# Candidate URLs are probed concurrently over a shared keep-alive session
+LOGO_PROBE_WORKERS = int(os.environ.get('LOGO_PROBE_WORKERS', 32))
+LOGO_FETCH_DEADLINE = float(os.environ.get('LOGO_FETCH_DEADLINE', 12))
+
+_session = requests.Session()
+_session.headers['User-Agent'] = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
+_adapter = HTTPAdapter(pool_connections=LOGO_PROBE_WORKERS, pool_maxsize=LOGO_PROBE_WORKERS)
+_session.mount('https://', _adapter)
+_session.mount('http://', _adapter)
+
+_probe_executor = ThreadPoolExecutor(max_workers=LOGO_PROBE_WORKERS, thread_name_prefix='logo-probe')
+
+# Common corporate suffixes stripped before guessing domains or comparing names
+CORPORATE_SUFFIXES = [' inc', ' llc', ' ltd', ' corp', ' corporation', ' company', ' co', ' group', ' holdings', ' pvt', ' private', ' limited']
+
+def normalize_company_name(company_name):
+    """Normalize a company name so spelling variants share one key"""
+    if not company_name:
+        return ''
+    
+    clean_name = company_name.lower().replace('&', ' and ')
+    clean_name = re.sub(r'[^a-z0-9 ]+', ' ', clean_name)
+    clean_name = ' '.join(clean_name.split())
+    
+    # Strip trailing suffixes such as "pvt ltd" one at a time
+    stripped = True
+    while stripped:
+        stripped = False
+        for suffix in CORPORATE_SUFFIXES:
+            if clean_name.endswith(suffix) and len(clean_name) > len(suffix):
+                clean_name = clean_name[:-len(suffix)].strip()
+                stripped = True
+    
+    return clean_name
+
 def get_company_domain(company_name):
     """Get the most likely domain for a company"""
-    # Clean company name
-    clean_name = company_name.lower().strip()
-    
-    # Handle special cases first
-    special_cases = {
-        'google': 'google.com',
-        'microsoft': 'microsoft.com',
-        'apple': 'apple.com',
-        'amazon': 'amazon.com',
-        'facebook': 'facebook.com',
-        'meta': 'meta.com',
-        'netflix': 'netflix.com',
-        'spotify': 'spotify.com',
-        'uber': 'uber.com',
-        'airbnb': 'airbnb.com',
-        'tesla': 'tesla.com',
-        'twitter': 'twitter.com',
-        'linkedin': 'linkedin.com',
-        'adobe': 'adobe.com',
-        'salesforce': 'salesforce.com',
-        'oracle': 'oracle.com',
-        'ibm': 'ibm.com',
-        'intel': 'intel.com',
-        'cisco': 'cisco.com',
-        'hp': 'hp.com',
-        'dell': 'dell.com',
-        'tata': 'tata.com',
-        'reliance': 'ril.com',
-        'infosys': 'infosys.com',
-        'wipro': 'wipro.com',
-        'tcs': 'tcs.com',
-        'accenture': 'accenture.com'
-    }
-    
-    # Check for special cases
-    for key, domain in special_cases.items():
-        if key in clean_name:
-            return [domain]
-    
-    # Remove common corporate suffixes
-    suffixes = [' inc', ' llc', ' ltd', ' corp', ' corporation', ' company', ' co', ' group', ' holdings', ' pvt', ' private', ' limited']
-    for suffix in suffixes:
-        if clean_name.endswith(suffix):
-            clean_name = clean_name[:-len(suffix)].strip()
-    
-    # Replace spaces and special characters
-    clean_name = clean_name.replace(' ', '').replace('&', 'and').replace('.', '').replace('-', '')
+    # Known companies first
+    domain = resolve_company_domain(company_name)
+    if domain:
+        return [domain]
+    
+    # Otherwise guess from the name without suffixes, spaces or punctuation
+    clean_name = normalize_company_name(company_name).replace(' ', '')
+    if not clean_name:
+        return []
     
     # Try common domain extensions
     possible_domains = [
@@ -70,54 +91,123 @@ def get_company_domain(company_name):
     
     return possible_domains
 
-def fetch_logo_from_clearbit(company_name):
-    """Fetch company logo from Clearbit Logo API"""
+def _is_clearbit_logo(response):
+    """Check a Clearbit response is an image"""
+    return response.status_code == 200 and 'image' in response.headers.get('content-type', '')
+
+def _is_favicon_logo(response):
+    """Check a favicon response is a real image, not a placeholder"""
+    return (response.status_code == 200 and len(response.content) > 200 and  # Better size check
+            response.headers.get('content-type', '').startswith('image/'))
+
+def get_logo_candidates(company_name, include_clearbit=True, include_favicon=True, skip_domains=None):
+    """List (url, validator, timeout, domain) probes in preference order"""
     domains = get_company_domain(company_name)
+    if skip_domains:
+        domains = [domain for domain in domains if domain not in skip_domains]
+    candidates = []
+    seen = set()
     
-    for domain in domains:
-        try:
-            # Clearbit Logo API (free tier)
-            url = f"https://logo.clearbit.com/{domain}"
-            
-            response = requests.get(url, timeout=10, allow_redirects=True)
-            if response.status_code == 200 and 'image' in response.headers.get('content-type', ''):
-                return response.content
-        except:
-            continue
+    def add(url, validator, timeout, domain):
+        if url not in seen:
+            seen.add(url)
+            candidates.append((url, validator, timeout, domain))
     
+    # Clearbit first (better quality), earlier domains preferred
+    if include_clearbit:
+        for domain in domains:
+            add(CLEARBIT_URL_TEMPLATE.format(domain=domain), _is_clearbit_logo, 10, domain)
+    
+    if include_favicon:
+        for domain in domains:
+            for template in FAVICON_URL_TEMPLATES:
+                add(template.format(domain=domain), _is_favicon_logo, 8, domain)
+    
+    return candidates
+
+def _probe(url, validator, timeout, stop_event):
+    """Fetch one candidate URL and return its content if it is a valid logo"""
+    if stop_event.is_set():
+        return None
+    try:
+        response = _session.get(url, timeout=timeout, allow_redirects=True)
+        if validator(response):
+            return response.content
+    except Exception:
+        pass
     return None
 
-def fetch_logo_from_favicon(company_name):
-    """Fetch company logo from favicon"""
-    domains = get_company_domain(company_name)
+def _failed_domains(candidates, results):
+    """Domains whose every candidate was probed and none returned a logo"""
+    failed = {}
+    for rank, candidate in enumerate(candidates):
+        domain = candidate[3]
+        failed[domain] = failed.get(domain, True) and rank in results and not results[rank]
+    return [domain for domain, is_failed in failed.items() if is_failed]
+
+def probe_logo_candidates(candidates, deadline=None, on_failed_domains=None):
+    """Race all candidates concurrently and return the most preferred logo found.
     
-    for domain in domains:
-        try:
-            # Try to get favicon from multiple sources
-            favicon_urls = [
-                f"https://www.google.com/s2/favicons?domain={domain}&sz=128",
-                f"https://logo.clearbit.com/{domain}",
-                f"https://{domain}/favicon.ico",
-                f"https://{domain}/favicon.png",
-                f"https://{domain}/apple-touch-icon.png",
-                f"https://{domain}/android-chrome-192x192.png"
-            ]
-            
-            for favicon_url in favicon_urls:
-                response = requests.get(favicon_url, timeout=8, headers={
-                    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
-                })
-                if response.status_code == 200 and len(response.content) > 200:  # Better size check
-                    # Verify it's actually an image
-                    if response.headers.get('content-type', '').startswith('image/'):
-                        return response.content
-        except:
-            continue
+    on_failed_domains, if given, is called with the domains that were fully
+    probed without finding a logo.
+    """
+    if not candidates:
+        return None
     
-    return None
+    deadline = LOGO_FETCH_DEADLINE if deadline is None else deadline
+    end_time = time.monotonic() + deadline
+    stop_event = threading.Event()
+    
+    futures = {}
+    for rank, (url, validator, timeout, domain) in enumerate(candidates):
+        future = _probe_executor.submit(_probe, url, validator, min(timeout, deadline), stop_event)
+        futures[future] = rank
+    
+    results = {}
+    pending = set(futures)
+    try:
+        while pending:
+            remaining = end_time - time.monotonic()
+            if remaining <= 0:
+                break
+            
+            done, pending = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+            for future in done:
+                results[futures[future]] = future.result()
+            
+            # Return a logo as soon as every more preferred candidate has failed
+            for rank in range(len(candidates)):
+                if rank not in results:
+                    break
+                if results[rank]:
+                    return results[rank]
+        
+        # Deadline reached: settle for the most preferred logo found so far
+        for rank in sorted(results):
+            if results[rank]:
+                return results[rank]
+        return None
+    finally:
+        # Stop queued probes; in-flight ones end on their own timeout
+        stop_event.set()
+        for future in pending:
+            future.cancel()
+        
+        if on_failed_domains:
+            failed = _failed_domains(candidates, results)
+            if failed:
+                on_failed_domains(failed)
+
+def fetch_logo_from_clearbit(company_name):
+    """Fetch company logo from Clearbit Logo API"""
+    return probe_logo_candidates(get_logo_candidates(company_name, include_favicon=False))
+
+def fetch_logo_from_favicon(company_name):
+    """Fetch company logo from favicon"""
+    return probe_logo_candidates(get_logo_candidates(company_name, include_clearbit=False))
 
 def save_company_logo_from_data(logo_data, company_name):
-    """Save logo data to file and return filename"""
+    """Save logo data to a content-addressed file and return filename"""
     if not logo_data:
         return None
     
@@ -125,27 +215,31 @@ def save_company_logo_from_data(logo_data, company_name):
         # Create directory if it doesn't exist
         os.makedirs(COMPANY_LOGO_FOLDER, exist_ok=True)
         
-        # Open image and resize if needed
-        image = Image.open(io.BytesIO(logo_data))
-        
-        # Convert to RGB if necessary
-        if image.mode in ('RGBA', 'LA', 'P'):
-            background = Image.new('RGB', image.size, (255, 255, 255))
-            if image.mode == 'P':
-                image = image.convert('RGBA')
-            background.paste(image, mask=image.split()[-1] if image.mode == 'RGBA' else None)
-            image = background
+        # Open image, decoding large JPEGs at reduced scale, and convert to RGB
+        image = flatten_to_rgb(open_image_for_size(logo_data, max(VARIANT_SIZES)))
+        source = image.copy()
         
         # Resize to reasonable size
         max_size = (100, 100)
-        image.thumbnail(max_size, Image.Resampling.LANCZOS)
+        image.thumbnail(max_size, Image.Resampling.LANCZOS, reducing_gap=3.0)
+        
+        # Encode as JPEG and name the file after its content, so identical
+        # logos are stored once no matter how many companies use them
+        output = io.BytesIO()
+        image.save(output, 'JPEG', quality=85, optimize=True)
+        jpeg_data = output.getvalue()
         
-        # Generate unique filename
-        filename = f"auto_{uuid.uuid4().hex[:8]}_{company_name.lower().replace(' ', '_')}.jpg"
+        filename = f"{hashlib.sha256(jpeg_data).hexdigest()[:20]}.jpg"
         filepath = os.path.join(COMPANY_LOGO_FOLDER, filename)
         
-        # Save as JPEG
-        image.save(filepath, 'JPEG', quality=85, optimize=True)
+        if not os.path.exists(filepath):
+            tmp_path = f"{filepath}.{uuid.uuid4().hex}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(jpeg_data)
+            os.replace(tmp_path, filepath)
+            
+            # Smaller WebP/JPEG copies for avatars and lists
+            generate_variants(source, COMPANY_LOGO_FOLDER, filename)
         
         return filename
         
@@ -153,17 +247,14 @@ def save_company_logo_from_data(logo_data, company_name):
         print(f"Error saving logo: {e}")
         return None
 
-def fetch_company_logo(company_name):
+def fetch_company_logo(company_name, skip_domains=None, on_failed_domains=None):
     """Main function to fetch company logo automatically"""
     if not company_name or len(company_name.strip()) < 2:
         return None
     
-    # Try Clearbit first (better quality)
-    logo_data = fetch_logo_from_clearbit(company_name)
-    
-    # Fallback to favicon
-    if not logo_data:
-        logo_data = fetch_logo_from_favicon(company_name)
+    # Race Clearbit and favicon sources together, keeping Clearbit's priority
+    candidates = get_logo_candidates(company_name, skip_domains=skip_domains)
+    logo_data = probe_logo_candidates(candidates, on_failed_domains=on_failed_domains)
     
     # Save the logo if found
     if logo_data:
@@ -176,4 +267,5 @@ def delete_company_logo(filename):
     if filename:
         file_path = os.path.join(COMPANY_LOGO_FOLDER, filename)
         if os.path.exists(file_path):
-            os.remove(file_path)
\ No newline at end of file
+            os.remove(file_path)
+        delete_variants(COMPANY_LOGO_FOLDER, filename)
\ No newline at end of file
@@ -0,0 +1,51 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from app import app, db
+
+# Logo fetches walk several domains with long timeouts, so they run on a
+# small worker pool instead of blocking the request that saved the experience.
+LOGO_WORKERS = int(os.environ.get('LOGO_WORKERS', 4))
+
+# Values for Experience.logo_status
+LOGO_PENDING = 'pending'
+LOGO_READY = 'ready'
+LOGO_MISSING = 'missing'
+
+_executor = ThreadPoolExecutor(max_workers=LOGO_WORKERS, thread_name_prefix='logo-fetch')
+
+
+def enqueue_logo_fetch(experience_id, company_name):
+    """Queue a background logo fetch for an experience that was already committed"""
+    return _executor.submit(run_logo_fetch, experience_id, company_name)
+
+
+def run_logo_fetch(experience_id, company_name):
+    """Resolve the company logo and store it on the experience row"""
+    from models import Experience
+    from logo_store import acquire_company_logo, release_company_logo
+
+    with app.app_context():
+        try:
+            filename = acquire_company_logo(company_name)
+        except Exception as e:
+            app.logger.warning(f"Logo fetch failed for {company_name!r}: {e}")
+            db.session.rollback()
+            filename = None
+
+        experience = db.session.get(Experience, experience_id)
+
+        # The experience was deleted or renamed while we were fetching
+        if experience is None or experience.company != company_name:
+            release_company_logo(filename)
+            db.session.commit()
+            return None
+
+        if experience.company_logo:
+            release_company_logo(experience.company_logo)
+
+        experience.company_logo = filename
+        experience.logo_status = LOGO_READY if filename else LOGO_MISSING
+        db.session.commit()
+
+    return filename
@@ -0,0 +1,156 @@
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+
+from sqlalchemy.exc import IntegrityError
+
+from app import db
+from models import CompanyLogo, Experience
+from logo_fetcher import fetch_company_logo, delete_company_logo, normalize_company_name, get_company_domain
+from logo_cache import (get_cached_lookup, remember_logo, remember_missing_logo, forget_lookup,
+                        get_dead_domains, mark_domains_dead)
+
+# One fetch at a time per company within this process. A company's lock
+# exists only while some thread holds or waits for it.
+_fetch_locks = {}  # company key -> [lock, threads using it]
+_fetch_locks_guard = threading.Lock()
+
+
+@contextmanager
+def _fetch_lock(key):
+    with _fetch_locks_guard:
+        entry = _fetch_locks.setdefault(key, [threading.Lock(), 0])
+        entry[1] += 1
+    try:
+        with entry[0]:
+            yield
+    finally:
+        with _fetch_locks_guard:
+            entry[1] -= 1
+            if not entry[1]:
+                del _fetch_locks[key]
+
+
+def _add_reference(count=1, **criteria):
+    """Atomically bump the reference count of a registry entry; returns rows matched"""
+    return CompanyLogo.query.filter_by(**criteria).update(
+        {CompanyLogo.ref_count: CompanyLogo.ref_count + count}, synchronize_session=False
+    )
+
+
+def lookup_company_logo(company_name):
+    """Return the registry entry for a company, or None"""
+    key = normalize_company_name(company_name)
+    if not key:
+        return None
+    return CompanyLogo.query.filter_by(normalized_name=key).first()
+
+
+def acquire_company_logo(company_name, count=1, retry_missing=False):
+    """Resolve a company to its canonical logo filename and take count references to it.
+
+    The logo is only fetched when no Experience has used this company before
+    and, unless retry_missing is set, no recent lookup for it failed. Changes
+    are left in the session for the caller to commit.
+    """
+    key = normalize_company_name(company_name)
+    if len(key) < 2:
+        return None
+
+    # Cached outcome: a miss skips the probe entirely, a hit skips the SELECT
+    found, cached_filename = get_cached_lookup(key)
+    if found and cached_filename is None and not retry_missing:
+        return None
+    if found and cached_filename:
+        if _add_reference(count, normalized_name=key, filename=cached_filename):
+            return cached_filename
+        forget_lookup(key)
+
+    with _fetch_lock(key):
+        entry = CompanyLogo.query.filter_by(normalized_name=key).first()
+        if entry:
+            _add_reference(count, id=entry.id)
+            remember_logo(key, entry.filename)
+            return entry.filename
+
+        # Another thread may have just failed to find one
+        found, cached_filename = get_cached_lookup(key)
+        if found and cached_filename is None and not retry_missing:
+            return None
+
+        dead_domains = get_dead_domains(get_company_domain(company_name))
+        filename = fetch_company_logo(company_name, skip_domains=dead_domains,
+                                      on_failed_domains=mark_domains_dead)
+        if not filename:
+            remember_missing_logo(key)
+            return None
+
+        try:
+            with db.session.begin_nested():
+                db.session.add(CompanyLogo(normalized_name=key, filename=filename, ref_count=count))
+        except IntegrityError:
+            # Another process registered the company first; use its logo
+            entry = CompanyLogo.query.filter_by(normalized_name=key).first()
+            _add_reference(count, id=entry.id)
+            if entry.filename != filename and not CompanyLogo.query.filter_by(filename=filename).first():
+                delete_company_logo(filename)
+            remember_logo(key, entry.filename)
+            return entry.filename
+
+    remember_logo(key, filename)
+    return filename
+
+
+def release_company_logo(filename):
+    """Drop one reference to a logo file, deleting it once nothing uses it.
+
+    Files that predate the registry are deleted straight away as before.
+    Changes are left in the session for the caller to commit.
+    """
+    if not filename:
+        return
+
+    entry = CompanyLogo.query.filter(
+        CompanyLogo.filename == filename, CompanyLogo.ref_count > 0
+    ).first()
+    if entry is None:
+        if not CompanyLogo.query.filter_by(filename=filename).first():
+            delete_company_logo(filename)
+        return
+
+    CompanyLogo.query.filter_by(id=entry.id).update(
+        {CompanyLogo.ref_count: CompanyLogo.ref_count - 1}, synchronize_session=False
+    )
+
+    remaining = db.session.query(db.func.sum(CompanyLogo.ref_count)).filter(
+        CompanyLogo.filename == filename
+    ).scalar() or 0
+    if remaining <= 0:
+        for entry in CompanyLogo.query.filter_by(filename=filename).all():
+            forget_lookup(entry.normalized_name)
+        CompanyLogo.query.filter_by(filename=filename).delete(synchronize_session=False)
+        delete_company_logo(filename)
+
+
+def refresh_company_logo(entry):
+    """Refetch a registry entry's logo and repoint the experiences that use it"""
+    old_filename = entry.filename
+    experiences = [
+        experience for experience in Experience.query.filter_by(company_logo=old_filename).all()
+        if normalize_company_name(experience.company) == entry.normalized_name
+    ]
+    company_name = experiences[0].company if experiences else entry.normalized_name
+
+    filename = fetch_company_logo(company_name)
+    entry.updated_at = datetime.utcnow()
+    if not filename or filename == old_filename:
+        return old_filename
+
+    for experience in experiences:
+        experience.company_logo = filename
+    entry.filename = filename
+    remember_logo(entry.normalized_name, filename)
+
+    if not CompanyLogo.query.filter(CompanyLogo.filename == old_filename, CompanyLogo.id != entry.id).first():
+        delete_company_logo(old_filename)
+    return filename
@@ -0,0 +1,296 @@
+import os
+import time
+from datetime import datetime
+
+from sqlalchemy import DateTime, bindparam, inspect, text
+from sqlalchemy.exc import IntegrityError, OperationalError
+
+from app import app, db
+
+# Versioned schema changes for databases created by an older release.
+# db.create_all() only creates missing tables, so every column or index
+# added to an existing table gets a numbered migration here. upgrade() runs
+# the ones not yet recorded in schema_version, each in its own transaction
+# together with its version row; a process that loses the race to record a
+# version rolls back and moves on. Migrations are written to be safe on a
+# database create_all() has just built, where they find nothing to do.
+# SQLite locks the whole database instead: a worker that can't get the
+# write lock within the driver's busy timeout gets "database is locked", so
+# upgrade() checks whether the holder applied the version and, if not,
+# tries again until UPGRADE_LOCK_WAIT seconds have passed.
+BATCH_SIZE = 1000
+UPGRADE_LOCK_WAIT = float(os.environ.get('UPGRADE_LOCK_WAIT', 600))
+
+# Which duplicate row of a connection pair survives: accepted over pending
+# over declined, then the oldest
+_STATUS_RANK = {'accepted': 0, 'pending': 1, 'declined': 2}
+
+
+def _quote(name):
+    # "user" is reserved on PostgreSQL and "current" on SQLite
+    return f'"{name}"'
+
+
+def add_column(conn, table, column, column_type):
+    """Add a column unless the table already has it"""
+    columns = {existing['name'] for existing in inspect(conn).get_columns(table)}
+    if column not in columns:
+        conn.execute(text(f'ALTER TABLE {_quote(table)} ADD COLUMN {column} {column_type}'))
+
+
+def create_index(conn, name, table, columns, unique=False):
+    """Create an index unless one of that name exists"""
+    kind = 'UNIQUE INDEX' if unique else 'INDEX'
+    conn.execute(text(f'CREATE {kind} IF NOT EXISTS {name} ON {_quote(table)} ({", ".join(_quote(column) for column in columns)})'))
+
+
+def _backfill(conn, table, source, target, compute):
+    """Set target = compute(source) on every row where target is NULL, a batch at a time"""
+    last_id = 0
+    while True:
+        rows = conn.execute(text(
+            f'SELECT id, {source} FROM {_quote(table)} '
+            f'WHERE {target} IS NULL AND {source} IS NOT NULL AND id > :last_id ORDER BY id LIMIT :limit'
+        ), {'last_id': last_id, 'limit': BATCH_SIZE}).all()
+        if not rows:
+            break
+        conn.execute(text(f'UPDATE {_quote(table)} SET {target} = :value WHERE id = :id'),
+                     [{'id': row_id, 'value': compute(value)} for row_id, value in rows])
+        last_id = rows[-1][0]
+
+
+def _logo_status(conn):
+    add_column(conn, 'experience', 'logo_status', 'VARCHAR(20)')
+
+
+def _normalized_skills(conn):
+    from skill_index import normalize_skill
+    add_column(conn, 'user_skill', 'normalized_skill', 'VARCHAR(100)')
+    _backfill(conn, 'user_skill', 'skill_name', 'normalized_skill', normalize_skill)
+    create_index(conn, 'ix_user_skill_normalized_skill_user_id', 'user_skill', ['normalized_skill', 'user_id'])
+
+
+def _company_keys(conn):
+    from alumni_index import company_key
+    add_column(conn, 'experience', 'company_key', 'VARCHAR(100)')
+    add_column(conn, 'user', 'current_company_key', 'VARCHAR(100)')
+    _backfill(conn, 'experience', 'company', 'company_key', company_key)
+    _backfill(conn, 'user', 'current_company', 'current_company_key', company_key)
+    create_index(conn, 'ix_experience_company_key_current_user_id', 'experience',
+                 ['company_key', 'current', 'user_id'])
+    create_index(conn, 'ix_user_current_company_key', 'user', ['current_company_key'])
+
+
+def _connection_pairs(conn):
+    for column in ['low_user_id', 'high_user_id']:
+        add_column(conn, 'connection', column, 'INTEGER REFERENCES "user" (id)')
+    conn.execute(text("""
+        UPDATE "connection"
+        SET low_user_id = CASE WHEN sender_id < receiver_id THEN sender_id ELSE receiver_id END,
+            high_user_id = CASE WHEN sender_id < receiver_id THEN receiver_id ELSE sender_id END
+        WHERE low_user_id IS NULL OR high_user_id IS NULL
+    """))
+
+    # Keep one row per pair before the pair becomes unique
+    duplicates = conn.execute(text("""
+        SELECT low_user_id, high_user_id FROM "connection"
+        GROUP BY low_user_id, high_user_id HAVING COUNT(id) > 1
+    """)).all()
+    for low, high in duplicates:
+        rows = conn.execute(text("""
+            SELECT id, status, created_at FROM "connection"
+            WHERE low_user_id = :low AND high_user_id = :high
+        """), {'low': low, 'high': high}).all()
+        rows.sort(key=lambda row: (_STATUS_RANK.get(row.status, 3), str(row.created_at or ''), row.id))
+        conn.execute(text('DELETE FROM "connection" WHERE id = :id'), [{'id': row.id} for row in rows[1:]])
+    if duplicates:
+        app.logger.info(f"Migration: merged duplicate connections for {len(duplicates)} pairs")
+
+    create_index(conn, 'uq_connection_pair', 'connection', ['low_user_id', 'high_user_id'], unique=True)
+    create_index(conn, 'ix_connection_high_user_id', 'connection', ['high_user_id'])
+
+
+def _hot_path_indexes(conn):
+    # One per query shape in routes.py that filters on more than a primary key
+    create_index(conn, 'ix_connection_receiver_id_status_created_at', 'connection',
+                 ['receiver_id', 'status', 'created_at'])
+    create_index(conn, 'ix_connection_sender_id_status_created_at', 'connection',
+                 ['sender_id', 'status', 'created_at'])
+    create_index(conn, 'ix_message_receiver_id_status_created_at', 'message',
+                 ['receiver_id', 'message_request_status', 'created_at'])
+    create_index(conn, 'ix_message_sender_id_receiver_id_created_at', 'message',
+                 ['sender_id', 'receiver_id', 'created_at'])
+    create_index(conn, 'ix_job_referral_candidate_id_created_at', 'job_referral', ['candidate_id', 'created_at'])
+    create_index(conn, 'ix_job_referral_referrer_id_created_at', 'job_referral', ['referrer_id', 'created_at'])
+    create_index(conn, 'ix_referral_request_status_created_at', 'referral_request', ['status', 'created_at'])
+    create_index(conn, 'ix_referral_request_job_seeker_id_created_at', 'referral_request',
+                 ['job_seeker_id', 'created_at'])
+    create_index(conn, 'ix_job_posting_is_active_created_at', 'job_posting', ['is_active', 'created_at'])
+    create_index(conn, 'ix_user_resume_file', 'user', ['resume_file'])
+    create_index(conn, 'ix_user_skill_user_id', 'user_skill', ['user_id'])
+    create_index(conn, 'ix_experience_user_id_start_date', 'experience', ['user_id', 'start_date'])
+    create_index(conn, 'ix_education_user_id_start_year', 'education', ['user_id', 'start_year'])
+
+
+def _user_counters(conn):
+    from models import UserCounter
+    from notification_counters import COUNTERS, fresh_counts
+    UserCounter.__table__.create(conn, checkfirst=True)
+    last_id = 0
+    while True:
+        user_ids = [row[0] for row in conn.execute(text(
+            'SELECT id FROM "user" WHERE id > :last_id AND id NOT IN (SELECT user_id FROM user_counter) '
+            'ORDER BY id LIMIT :limit'
+        ), {'last_id': last_id, 'limit': BATCH_SIZE})]
+        if not user_ids:
+            break
+        conn.execute(UserCounter.__table__.insert(), [
+            dict(user_id=user_id, **{name: counts[name] for name in COUNTERS})
+            for user_id, counts in fresh_counts(conn, user_ids).items()
+        ])
+        last_id = user_ids[-1]
+
+
+def _conversations(conn):
+    from models import Conversation
+    from conversation_threads import refresh_pair
+    Conversation.__table__.create(conn, checkfirst=True)
+    pairs = conn.execute(text("""
+        SELECT DISTINCT CASE WHEN sender_id < receiver_id THEN sender_id ELSE receiver_id END,
+                        CASE WHEN sender_id < receiver_id THEN receiver_id ELSE sender_id END
+        FROM message WHERE message_request_status = 'approved'
+    """)).all()
+    for low, high in pairs:
+        refresh_pair(conn, low, high)
+
+
+def _change_log(conn):
+    from models import SyncSequence, sync_change_seq
+    SyncSequence.__table__.create(conn, checkfirst=True)
+    sync_change_seq.create(conn, checkfirst=True)
+    add_column(conn, 'user_counter', 'sync_seq', 'INTEGER NOT NULL DEFAULT 0')
+    for table in ['message', 'connection']:
+        add_column(conn, table, 'change_seq', 'INTEGER')
+        # Rows from before the change log sort before every change
+        conn.execute(text(f'UPDATE {_quote(table)} SET change_seq = 0 WHERE change_seq IS NULL'))
+        create_index(conn, f'ix_{table}_receiver_id_change_seq', table, ['receiver_id', 'change_seq'])
+        create_index(conn, f'ix_{table}_sender_id_change_seq', table, ['sender_id', 'change_seq'])
+
+
+def _read_watermarks(conn):
+    from notification_counters import fresh_counts
+    from conversation_threads import refresh_pair
+    for column in ['low_read_id', 'high_read_id', 'change_seq']:
+        add_column(conn, 'conversation', column, 'INTEGER NOT NULL DEFAULT 0')
+    create_index(conn, 'ix_conversation_low_user_id_change_seq', 'conversation', ['low_user_id', 'change_seq'])
+    create_index(conn, 'ix_conversation_high_user_id_change_seq', 'conversation', ['high_user_id', 'change_seq'])
+    # Unread counts are a range of one direction's messages past the watermark
+    create_index(conn, 'ix_message_sender_id_receiver_id_status_id', 'message',
+                 ['sender_id', 'receiver_id', 'message_request_status', 'id'])
+
+    # Each side's watermark starts at the newest message it had marked read
+    for side, receiver, sender in [('low', 'low_user_id', 'high_user_id'), ('high', 'high_user_id', 'low_user_id')]:
+        conn.execute(text(f"""
+            UPDATE conversation SET {side}_read_id = COALESCE((
+                SELECT MAX(m.id) FROM message m
+                WHERE m.receiver_id = conversation.{receiver} AND m.sender_id = conversation.{sender}
+                  AND m.message_request_status = 'approved' AND m.read = :read
+            ), 0)
+        """), {'read': True})
+    for low, high in conn.execute(text('SELECT low_user_id, high_user_id FROM conversation')).all():
+        refresh_pair(conn, low, high)
+
+    # Unread counts now come from the watermarks
+    counters = conn.execute(text('SELECT user_id FROM user_counter')).all()
+    for start in range(0, len(counters), BATCH_SIZE):
+        user_ids = [row[0] for row in counters[start:start + BATCH_SIZE]]
+        conn.execute(text('UPDATE user_counter SET unread_messages = :count WHERE user_id = :user_id'), [
+            {'user_id': user_id, 'count': counts['unread_messages']}
+            for user_id, counts in fresh_counts(conn, user_ids).items()
+        ])
+
+
+def _listed_created_at(conn):
+    # Keyset pages skip rows with no created_at; date legacy ones as oldest
+    for table in ['user', 'connection', 'message', 'referral_request', 'job_referral', 'job_posting']:
+        # Bound as a DateTime so SQLite stores it in the same format as the ORM does
+        conn.execute(text(f'UPDATE {_quote(table)} SET created_at = :epoch WHERE created_at IS NULL')
+                     .bindparams(bindparam('epoch', datetime(1970, 1, 1), type_=DateTime())))
+
+
+# (version, name, function) in the order they must run; never renumber or edit
+# a released migration, add a new one instead
+MIGRATIONS = [
+    (1, 'experience logo status', _logo_status),
+    (2, 'normalized skills', _normalized_skills),
+    (3, 'company keys', _company_keys),
+    (4, 'unique connection pairs', _connection_pairs),
+    (5, 'hot path indexes', _hot_path_indexes),
+    (6, 'user counters', _user_counters),
+    (7, 'conversation summaries', _conversations),
+    (8, 'sync change log', _change_log),
+    (9, 'conversation read watermarks', _read_watermarks),
+    (10, 'created_at for listed rows', _listed_created_at),
+]
+
+
+def _ensure_version_table():
+    with db.engine.begin() as conn:
+        conn.execute(text("""
+            CREATE TABLE IF NOT EXISTS schema_version (
+                version INTEGER PRIMARY KEY,
+                name VARCHAR(100) NOT NULL,
+                applied_at TIMESTAMP NOT NULL
+            )
+        """))
+
+
+def applied_versions():
+    """Versions recorded in schema_version"""
+    _ensure_version_table()
+    with db.engine.connect() as conn:
+        return {row[0] for row in conn.execute(text('SELECT version FROM schema_version'))}
+
+
+def pending_migrations():
+    applied = applied_versions()
+    return [migration for migration in MIGRATIONS if migration[0] not in applied]
+
+
+def _is_locked(error):
+    return 'database is locked' in str(error.orig)
+
+
+def _apply(version, name, migrate):
+    """Run one migration with its version row; False if another process recorded it first"""
+    try:
+        with db.engine.begin() as conn:
+            # Claim the version first so a concurrent upgrade waits on it, then fails
+            conn.execute(text('INSERT INTO schema_version (version, name, applied_at) VALUES (:version, :name, :at)'),
+                         {'version': version, 'name': name, 'at': datetime.utcnow()})
+            migrate(conn)
+    except IntegrityError:
+        return False
+    return True
+
+
+def upgrade():
+    """Apply every pending migration in order; returns the versions this call applied"""
+    applied = []
+    for version, name, migrate in pending_migrations():
+        deadline = time.monotonic() + UPGRADE_LOCK_WAIT
+        while True:
+            try:
+                done = version not in applied_versions() and _apply(version, name, migrate)
+                break
+            except OperationalError as e:
+                if not _is_locked(e) or time.monotonic() > deadline:
+                    raise
+                app.logger.info(f"Migration {version} ({name}) waiting for another process to release the database")
+                time.sleep(1)
+        if not done:
+            app.logger.info(f"Migration {version} ({name}) already applied by another process")
+            continue
+        app.logger.info(f"Migration {version} ({name}) applied")
+        applied.append(version)
+    return applied
@@ -1,5 +1,6 @@
 from datetime import datetime
 from app import db
+from sqlalchemy import event
 from flask_login import UserMixin
 from werkzeug.security import generate_password_hash, check_password_hash
 
@@ -17,11 +18,12 @@ class User(UserMixin, db.Model):
     location = db.Column(db.String(100))
     about = db.Column(db.Text)
     current_company = db.Column(db.String(100))
+    current_company_key = db.Column(db.String(100), index=True)  # logo_fetcher.normalize_company_name(current_company)
     current_position = db.Column(db.String(100))
     job_status = db.Column(db.String(50), default='employed')  # employed, seeking, open
     open_for_referrals = db.Column(db.Boolean, default=True)  # Whether user accepts referral requests
     profile_image = db.Column(db.String(200))  # Store filename/path
-    resume_file = db.Column(db.String(200))  # Store resume filename/path
+    resume_file = db.Column(db.String(200), index=True)  # Store resume filename/path
     
     # Timestamps
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
@@ -50,16 +52,29 @@ class User(UserMixin, db.Model):
         return self.username
     
     def is_connected_to(self, user):
-        return Connection.query.filter(
-            ((Connection.sender_id == self.id) & (Connection.receiver_id == user.id)) |
-            ((Connection.sender_id == user.id) & (Connection.receiver_id == self.id))
-        ).filter(Connection.status == 'accepted').first() is not None
+        from connection_graph import is_connected
+        return is_connected(self.id, user.id)
     
     def has_pending_connection_with(self, user):
-        return Connection.query.filter(
-            ((Connection.sender_id == self.id) & (Connection.receiver_id == user.id)) |
-            ((Connection.sender_id == user.id) & (Connection.receiver_id == self.id))
-        ).filter(Connection.status == 'pending').first() is not None
+        from connection_graph import has_pending
+        return has_pending(self.id, user.id)
+
+    def connection_statuses(self, user_ids):
+        """Map each of user_ids to the status of its connection with this user"""
+        from connection_graph import connection_state
+        accepted, pending = connection_state(self.id)
+        statuses = {}
+        for user_id in user_ids:
+            if user_id in accepted:
+                statuses[user_id] = 'accepted'
+            elif user_id in pending:
+                statuses[user_id] = 'pending'
+        return statuses
+
+    def notification_counts(self):
+        """This user's UserCounter row, read once per session"""
+        from notification_counters import counts_for
+        return counts_for(self.id)
 
 
 class UserSkill(db.Model):
@@ -67,6 +82,13 @@ class UserSkill(db.Model):
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     skill_name = db.Column(db.String(100), nullable=False)
     proficiency = db.Column(db.String(20), default='intermediate')  # beginner, intermediate, advanced, expert
+    normalized_skill = db.Column(db.String(100))  # See skill_index.normalize_skill
+
+    # Posting lists for skill search: user ids by canonical skill
+    __table_args__ = (
+        db.Index('ix_user_skill_normalized_skill_user_id', 'normalized_skill', 'user_id'),
+        db.Index('ix_user_skill_user_id', 'user_id'),
+    )
 
 
 class Experience(db.Model):
@@ -81,6 +103,14 @@ class Experience(db.Model):
     description = db.Column(db.Text)
     location = db.Column(db.String(100))
     company_logo = db.Column(db.String(200))  # Store company logo filename/path
+    logo_status = db.Column(db.String(20))  # pending, ready, missing
+    company_key = db.Column(db.String(100))  # logo_fetcher.normalize_company_name(company)
+
+    # Alumni lookups: current and former employees by company
+    __table_args__ = (
+        db.Index('ix_experience_company_key_current_user_id', 'company_key', 'current', 'user_id'),
+        db.Index('ix_experience_user_id_start_date', 'user_id', 'start_date'),
+    )
 
 
 class Education(db.Model):
@@ -93,6 +123,8 @@ class Education(db.Model):
     end_year = db.Column(db.Integer)
     current = db.Column(db.Boolean, default=False)
 
+    __table_args__ = (db.Index('ix_education_user_id_start_year', 'user_id', 'start_year'),)
+
 
 class Connection(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -106,6 +138,39 @@ class Connection(db.Model):
     # Define relationships
     sender = db.relationship('User', foreign_keys=[sender_id], backref=db.backref('sent_connections', lazy='dynamic'))
     receiver = db.relationship('User', foreign_keys=[receiver_id], backref=db.backref('received_connections', lazy='dynamic'))
+    
+    # The pair as an undirected edge, smaller id first, so there is one row
+    # per pair of users whichever of them sent the request
+    low_user_id = db.Column(db.Integer, db.ForeignKey('user.id'))
+    high_user_id = db.Column(db.Integer, db.ForeignKey('user.id'), index=True)
+    change_seq = db.Column(db.Integer)  # Position in the delta-sync change log, see delta_sync
+    
+    __table_args__ = (
+        db.Index('uq_connection_pair', 'low_user_id', 'high_user_id', unique=True),
+        # Incoming and outgoing requests and connections by status, newest first
+        db.Index('ix_connection_receiver_id_status_created_at', 'receiver_id', 'status', 'created_at'),
+        db.Index('ix_connection_sender_id_status_created_at', 'sender_id', 'status', 'created_at'),
+        # A user's changes since a sync cursor
+        db.Index('ix_connection_receiver_id_change_seq', 'receiver_id', 'change_seq'),
+        db.Index('ix_connection_sender_id_change_seq', 'sender_id', 'change_seq'),
+    )
+    
+    @staticmethod
+    def pair(user_id, other_id):
+        """(low, high) ids of the edge between two users"""
+        return min(user_id, other_id), max(user_id, other_id)
+    
+    @classmethod
+    def between(cls, user_id, other_id):
+        """Query for the connection row between two users, whoever sent it"""
+        low, high = cls.pair(user_id, other_id)
+        return cls.query.filter_by(low_user_id=low, high_user_id=high)
+
+
+@event.listens_for(Connection, 'before_insert')
+@event.listens_for(Connection, 'before_update')
+def _set_connection_pair(mapper, connection, target):
+    target.low_user_id, target.high_user_id = Connection.pair(target.sender_id, target.receiver_id)
 
 
 class Message(db.Model):
@@ -113,14 +178,27 @@ class Message(db.Model):
     sender_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     receiver_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     content = db.Column(db.Text, nullable=False)
-    read = db.Column(db.Boolean, default=False)
+    read = db.Column(db.Boolean, default=False)  # No longer written; read state is Conversation's read watermarks
     message_request_status = db.Column(db.String(20), default='approved')  # pending, approved, declined
+    change_seq = db.Column(db.Integer)  # Position in the delta-sync change log, see delta_sync
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     # Define relationships
     sender = db.relationship('User', foreign_keys=[sender_id], backref=db.backref('sent_messages', lazy='dynamic'))
     receiver = db.relationship('User', foreign_keys=[receiver_id], backref=db.backref('received_messages', lazy='dynamic'))
 
+    __table_args__ = (
+        # Request counts and the request inbox newest first
+        db.Index('ix_message_receiver_id_status_created_at', 'receiver_id', 'message_request_status', 'created_at'),
+        # One direction of a conversation in order
+        db.Index('ix_message_sender_id_receiver_id_created_at', 'sender_id', 'receiver_id', 'created_at'),
+        # One direction's messages past a read watermark, for unread counts
+        db.Index('ix_message_sender_id_receiver_id_status_id', 'sender_id', 'receiver_id', 'message_request_status', 'id'),
+        # A user's changes since a sync cursor
+        db.Index('ix_message_receiver_id_change_seq', 'receiver_id', 'change_seq'),
+        db.Index('ix_message_sender_id_change_seq', 'sender_id', 'change_seq'),
+    )
+
 
 # Job Referral Request - when someone wants a recommendation for a specific role
 class ReferralRequest(db.Model):
@@ -135,6 +213,11 @@ class ReferralRequest(db.Model):
     
     job_seeker = db.relationship('User', backref='referral_requests')
 
+    __table_args__ = (
+        db.Index('ix_referral_request_status_created_at', 'status', 'created_at'),
+        db.Index('ix_referral_request_job_seeker_id_created_at', 'job_seeker_id', 'created_at'),
+    )
+
 
 # Job Referral - when someone recommends a candidate for a role
 class JobReferral(db.Model):
@@ -161,6 +244,11 @@ class JobReferral(db.Model):
     candidate = db.relationship('User', foreign_keys=[candidate_id], backref='received_referrals')
     referral_request = db.relationship('ReferralRequest', backref='referrals')
 
+    __table_args__ = (
+        db.Index('ix_job_referral_candidate_id_created_at', 'candidate_id', 'created_at'),
+        db.Index('ix_job_referral_referrer_id_created_at', 'referrer_id', 'created_at'),
+    )
+
 
 class JobPosting(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -176,3 +264,72 @@ class JobPosting(db.Model):
     is_active = db.Column(db.Boolean, default=True)
     
     posted_by = db.relationship('User', backref='job_postings')
+
+    __table_args__ = (db.Index('ix_job_posting_is_active_created_at', 'is_active', 'created_at'),)
+
+
+# Canonical logo shared by every Experience at the same company
+class CompanyLogo(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    normalized_name = db.Column(db.String(100), unique=True, nullable=False)  # See logo_fetcher.normalize_company_name
+    filename = db.Column(db.String(200), nullable=False, index=True)  # Content-addressed file in COMPANY_LOGO_FOLDER
+    ref_count = db.Column(db.Integer, default=0, nullable=False)  # Experience rows using this logo
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+# Badge counts per user, kept current by notification_counters
+class UserCounter(db.Model):
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    unread_messages = db.Column(db.Integer, default=0, nullable=False)  # Approved messages not yet read
+    pending_message_requests = db.Column(db.Integer, default=0, nullable=False)
+    pending_connection_requests = db.Column(db.Integer, default=0, nullable=False)
+    sync_seq = db.Column(db.Integer, default=0, nullable=False)  # Latest change_seq of the user's messages and connections
+
+
+# One row per pair of users with approved messages, kept current by conversation_threads
+class Conversation(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    low_user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)  # Smaller user id of the pair
+    high_user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    # Not a foreign key: the row is repointed after its last message is deleted, within the same flush
+    last_message_id = db.Column(db.Integer, nullable=False)
+    last_message_at = db.Column(db.DateTime, nullable=False)
+    low_unread = db.Column(db.Integer, default=0, nullable=False)  # Approved messages to low_user_id not yet read
+    high_unread = db.Column(db.Integer, default=0, nullable=False)
+    # Read watermarks: each side has read every message to it with an id up to this one
+    low_read_id = db.Column(db.Integer, default=0, nullable=False)
+    high_read_id = db.Column(db.Integer, default=0, nullable=False)
+    change_seq = db.Column(db.Integer, default=0, nullable=False)  # Last watermark move, for delta sync
+
+    low_user = db.relationship('User', foreign_keys=[low_user_id])
+    high_user = db.relationship('User', foreign_keys=[high_user_id])
+    last_message = db.relationship('Message', primaryjoin='Conversation.last_message_id == Message.id',
+                                   foreign_keys=[last_message_id], viewonly=True)
+
+    # Inbox: a user's conversations, most recent activity first
+    __table_args__ = (
+        db.Index('uq_conversation_pair', 'low_user_id', 'high_user_id', unique=True),
+        db.Index('ix_conversation_low_user_id_last_message_at', 'low_user_id', 'last_message_at'),
+        db.Index('ix_conversation_high_user_id_last_message_at', 'high_user_id', 'last_message_at'),
+        db.Index('ix_conversation_low_user_id_change_seq', 'low_user_id', 'change_seq'),
+        db.Index('ix_conversation_high_user_id_change_seq', 'high_user_id', 'change_seq'),
+    )
+
+    def partner(self, user_id):
+        return self.high_user if user_id == self.low_user_id else self.low_user
+
+    def unread_for(self, user_id):
+        return self.low_unread if user_id == self.low_user_id else self.high_unread
+
+    def read_id_for(self, user_id):
+        return self.low_read_id if user_id == self.low_user_id else self.high_read_id
+
+
+# Last change_seq handed out, on databases without sequences
+class SyncSequence(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    value = db.Column(db.Integer, default=0, nullable=False)
+
+
+sync_change_seq = db.Sequence('sync_change_seq', metadata=db.metadata)
@@ -0,0 +1,106 @@
+import os
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from app import app
+from connection_graph import connection_state, connected_ids, preload, graph_version
+from shared_cache import cache_get, cache_set
+
+# Second-degree features over the cached connection graph. Mutual counts are
+# set intersections of adjacency sets; "people you may know" counts how many
+# of a user's connections each friend-of-friend shares. Suggestions are
+# cached under the user's graph version, so a change to their own edges
+# recomputes them, and fall back to the last result while a large network
+# is recomputed in the background.
+SUGGESTION_LIMIT = 20
+SUGGESTION_TTL = int(os.environ.get('SUGGESTION_TTL', 3600))
+SUGGESTION_LAST_TTL = 7 * 24 * 3600
+SUGGESTION_WORKERS = int(os.environ.get('SUGGESTION_WORKERS', 2))
+
+# Networks larger than this are never computed inside a request
+MAX_INLINE_CONNECTIONS = 200
+
+_executor = ThreadPoolExecutor(max_workers=SUGGESTION_WORKERS, thread_name_prefix='suggestions')
+_in_flight = set()
+_in_flight_lock = threading.Lock()
+
+
+def mutual_connection_ids(user_id, other_id):
+    """Ids of the people both users are connected to"""
+    return connected_ids(user_id) & connected_ids(other_id)
+
+
+def mutual_counts(user_id, other_ids):
+    """Map each of other_ids to the number of connections it shares with user_id"""
+    other_ids = set(other_ids)
+    states = preload(other_ids | {user_id})
+    mine = states[user_id][0]
+    return {other_id: len(mine & states[other_id][0]) for other_id in other_ids}
+
+
+def compute_suggestions(user_id, limit=SUGGESTION_LIMIT):
+    """Rank friends-of-friends by mutual connections: [(user_id, mutual count), ...]"""
+    friends, pending = connection_state(user_id)
+    states = preload(friends)
+
+    counts = Counter()
+    for friend_id in friends:
+        counts.update(states[friend_id][0])
+
+    # Not yourself, not people you already know or have asked
+    for excluded in [user_id, *friends, *pending]:
+        counts.pop(excluded, None)
+    return sorted(counts.items(), key=lambda item: (-item[1], item[0]))[:limit]
+
+
+def _key(user_id, version):
+    return f"suggestions_{user_id}_{version}"
+
+
+def _last_key(user_id):
+    return f"suggestions_last_{user_id}"
+
+
+def refresh_suggestions(user_id):
+    """Compute and cache a user's suggestions"""
+    version = graph_version(user_id)
+    suggestions = compute_suggestions(user_id)
+    cache_set(_key(user_id, version), suggestions, SUGGESTION_TTL)
+    cache_set(_last_key(user_id), suggestions, SUGGESTION_LAST_TTL)
+    return suggestions
+
+
+def _refresh_in_background(user_id):
+    with app.app_context():
+        try:
+            refresh_suggestions(user_id)
+        except Exception as e:
+            app.logger.warning(f"Suggestion refresh failed for user {user_id}: {e}")
+        finally:
+            with _in_flight_lock:
+                _in_flight.discard(user_id)
+
+
+def enqueue_suggestions(user_id):
+    """Queue a background refresh unless one is already running for the user"""
+    with _in_flight_lock:
+        if user_id in _in_flight:
+            return
+        _in_flight.add(user_id)
+    _executor.submit(_refresh_in_background, user_id)
+
+
+def get_suggestions(user_id, limit=SUGGESTION_LIMIT):
+    """Cached suggestions for a user, computed inline only for small networks"""
+    suggestions = cache_get(_key(user_id, graph_version(user_id)))
+    if suggestions is None:
+        if len(connected_ids(user_id)) <= MAX_INLINE_CONNECTIONS:
+            suggestions = refresh_suggestions(user_id)
+        else:
+            enqueue_suggestions(user_id)
+            suggestions = cache_get(_last_key(user_id)) or []
+    
+    # A stale list may name people connected to since
+    friends, pending = connection_state(user_id)
+    return [item for item in suggestions if item[0] not in friends and item[0] not in pending][:limit]
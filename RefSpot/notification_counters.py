@@ -0,0 +1,161 @@
+from collections import defaultdict
+
+from sqlalchemy import event, func, inspect, insert, select, update, case, or_, and_
+from sqlalchemy.orm import Session
+
+from app import db
+from models import User, Message, Connection, Conversation, UserCounter
+
+# Navbar and dashboard badge counts, one UserCounter row per user. Every
+# flush that adds, changes or deletes a Message or Connection adds the
+# difference it makes to the affected counters in the same transaction,
+# as "col = col + delta" so concurrent writers never lose an update.
+# Bulk UPDATE/DELETE statements bypass the flush and must call
+# adjust_counters or recount_users themselves, and a moved read watermark
+# calls recount_unread. reconcile() repairs drift.
+COUNTERS = ('unread_messages', 'pending_message_requests', 'pending_connection_requests')
+
+_table = UserCounter.__table__
+
+
+def _message_counters(receiver_id, message_request_status):
+    if message_request_status == 'pending':
+        return [(receiver_id, 'pending_message_requests')]
+    if message_request_status == 'approved':
+        # Unread until the receiver's watermark passes it, see recount_unread
+        return [(receiver_id, 'unread_messages')]
+    return []
+
+
+def _connection_counters(receiver_id, status):
+    return [(receiver_id, 'pending_connection_requests')] if status == 'pending' else []
+
+
+# Model -> (columns the counters depend on, their defaults, function giving the (user id, counter) pairs of a row)
+COUNTED_MODELS = {
+    Message: (['receiver_id', 'message_request_status'], ['approved'], _message_counters),
+    Connection: (['receiver_id', 'status'], ['pending'], _connection_counters),
+}
+
+
+def counts_for(user_id):
+    """A user's counters; all zero if they have no row yet"""
+    return db.session.get(UserCounter, user_id) or UserCounter(
+        user_id=user_id, **dict.fromkeys(COUNTERS, 0))
+
+
+def _row_counters(obj, old=False):
+    """(user id, counter) pairs a row contributes, as stored before the flush if old"""
+    columns, defaults, counters = COUNTED_MODELS[type(obj)]
+    state = inspect(obj)
+    values = []
+    for column in columns:
+        history = state.attrs[column].history
+        value = history.deleted[0] if old and history.deleted else getattr(obj, column)
+        values.append(value)
+    # Column defaults may not be on a freshly inserted instance
+    values[1:] = [default if value is None else value for value, default in zip(values[1:], defaults)]
+    return counters(*values)
+
+
+def fresh_counts(connection, user_ids):
+    """Recount the counters of user_ids from Message, Connection and the read watermarks"""
+    counts = {user_id: dict.fromkeys(COUNTERS, 0) for user_id in user_ids}
+    rows = connection.execute(select(Message.receiver_id, func.count()).where(
+        Message.receiver_id.in_(counts), Message.message_request_status == 'pending'
+    ).group_by(Message.receiver_id))
+    for user_id, count in rows:
+        counts[user_id]['pending_message_requests'] = count
+    # Approved messages past the receiver's watermark; a pair with no row yet has read nothing
+    read_id = case((Conversation.low_user_id == Message.receiver_id, Conversation.low_read_id),
+                   else_=Conversation.high_read_id)
+    rows = connection.execute(select(Message.receiver_id, func.count()).select_from(Message).outerjoin(
+        Conversation, or_(
+            and_(Conversation.low_user_id == Message.receiver_id, Conversation.high_user_id == Message.sender_id),
+            and_(Conversation.low_user_id == Message.sender_id, Conversation.high_user_id == Message.receiver_id))
+    ).where(
+        Message.receiver_id.in_(counts), Message.message_request_status == 'approved',
+        Message.id > func.coalesce(read_id, 0)
+    ).group_by(Message.receiver_id))
+    for user_id, count in rows:
+        counts[user_id]['unread_messages'] = count
+    rows = connection.execute(select(Connection.receiver_id, func.count()).where(
+        Connection.receiver_id.in_(counts), Connection.status == 'pending'
+    ).group_by(Connection.receiver_id))
+    for user_id, count in rows:
+        counts[user_id]['pending_connection_requests'] = count
+    return counts
+
+
+def _apply(connection, user_id, deltas):
+    values = {name: _table.c[name] + delta for name, delta in deltas.items() if delta}
+    if not values:
+        return
+    updated = connection.execute(update(_table).where(_table.c.user_id == user_id).values(**values)).rowcount
+    if not updated:
+        # No row yet (a user from before counters existed): the recount already includes this change
+        connection.execute(insert(_table).values(user_id=user_id, **fresh_counts(connection, [user_id])[user_id]))
+
+
+def adjust_counters(user_id, **deltas):
+    """Add deltas to a user's counters within the current transaction"""
+    _apply(db.session.connection(), user_id, deltas)
+
+
+def recount_users(user_ids):
+    """Set users' counters from a fresh count within the current transaction"""
+    connection = db.session.connection()
+    for user_id, counts in fresh_counts(connection, set(user_ids)).items():
+        if not connection.execute(update(_table).where(_table.c.user_id == user_id).values(**counts)).rowcount:
+            connection.execute(insert(_table).values(user_id=user_id, **counts))
+
+
+def recount_unread(connection, user_id):
+    """Set a user's unread count to the sum over their conversations, after a watermark moved"""
+    conversations = Conversation.__table__
+    total = select(func.coalesce(func.sum(case(
+        (conversations.c.low_user_id == user_id, conversations.c.low_unread), else_=conversations.c.high_unread
+    )), 0)).where(or_(conversations.c.low_user_id == user_id, conversations.c.high_user_id == user_id))
+    connection.execute(update(_table).where(_table.c.user_id == user_id).values(
+        unread_messages=total.scalar_subquery()))
+
+
+def reconcile(user_ids):
+    """Repair the counters of user_ids that drifted from a fresh count; returns how many were wrong"""
+    connection = db.session.connection()
+    stored = {row.user_id: row for row in connection.execute(select(_table).where(_table.c.user_id.in_(user_ids)))}
+    drifted = [user_id for user_id, counts in fresh_counts(connection, user_ids).items()
+               if user_id not in stored or any(getattr(stored[user_id], name) != counts[name] for name in COUNTERS)]
+    if drifted:
+        recount_users(drifted)
+    return len(drifted)
+
+
+@event.listens_for(Session, 'after_flush')
+def _count_changes(session, flush_context):
+    """Apply the flush's effect on counters in the flush's own transaction"""
+    deltas = defaultdict(lambda: defaultdict(int))
+    for obj in session.new:
+        if type(obj) in COUNTED_MODELS:
+            for user_id, name in _row_counters(obj):
+                deltas[user_id][name] += 1
+    for obj in session.dirty:
+        if type(obj) in COUNTED_MODELS and session.is_modified(obj, include_collections=False):
+            for user_id, name in _row_counters(obj, old=True):
+                deltas[user_id][name] -= 1
+            for user_id, name in _row_counters(obj):
+                deltas[user_id][name] += 1
+    for obj in session.deleted:
+        if type(obj) in COUNTED_MODELS:
+            for user_id, name in _row_counters(obj, old=True):
+                deltas[user_id][name] -= 1
+
+    if deltas:
+        connection = session.connection()
+        for user_id, changes in deltas.items():
+            _apply(connection, user_id, changes)
+
+
+@event.listens_for(User, 'after_insert')
+def _create_counters(mapper, connection, target):
+    connection.execute(insert(_table).values(user_id=target.id, **dict.fromkeys(COUNTERS, 0)))
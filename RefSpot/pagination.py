@@ -0,0 +1,83 @@
+import base64
+from collections import namedtuple
+from datetime import datetime
+
+from sqlalchemy import and_, or_
+
+# Keyset pagination: lists are ordered newest first by (created_at, id) and
+# each page starts strictly after the last row of the previous one, so a page
+# costs one index range scan however deep into the list it is. Rows without a
+# sort value have no position to resume from and are left out; migration 10
+# gives legacy rows one.
+PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+Page = namedtuple('Page', ['items', 'next_cursor'])
+
+
+def encode_cursor(sort_value, row_id):
+    """Opaque cursor for the position after a row.
+
+    sort_value is normally a created_at datetime; ranked lists may sort on a
+    number instead, which is tagged so decode_cursor can tell them apart.
+    """
+    if isinstance(sort_value, datetime):
+        value = sort_value.isoformat()
+    else:
+        value = f"n{sort_value}"
+    raw = f"{value}|{row_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Return (sort_value, id) for a cursor, or None if it is missing or malformed"""
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        value, row_id = raw.rsplit('|', 1)
+        if value.startswith('n'):
+            number = float(value[1:])
+            value = int(number) if number.is_integer() else number
+        else:
+            value = datetime.fromisoformat(value)
+        return value, int(row_id)
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+
+def page_size(value, default=PAGE_SIZE):
+    """Clamp a requested page size to 1..MAX_PAGE_SIZE"""
+    try:
+        return max(1, min(int(value), MAX_PAGE_SIZE))
+    except (TypeError, ValueError):
+        return default
+
+
+def paginate(query, created_column, id_column, cursor=None, limit=PAGE_SIZE, row_key=None):
+    """Return one Page of query results, newest first, starting after cursor.
+
+    created_column may be any descending sort key, such as a relevance score.
+    row_key maps a result row to its (sort value, id); by default the row's
+    attributes named after the two columns are used.
+    """
+    query = query.filter(created_column.isnot(None))
+    position = decode_cursor(cursor)
+    if position:
+        created_at, row_id = position
+        query = query.filter(or_(
+            created_column < created_at,
+            and_(created_column == created_at, id_column < row_id)
+        ))
+
+    rows = query.order_by(created_column.desc(), id_column.desc()).limit(limit + 1).all()
+    items = rows[:limit]
+
+    next_cursor = None
+    if len(rows) > limit:
+        last = items[-1]
+        if row_key:
+            next_cursor = encode_cursor(*row_key(last))
+        else:
+            next_cursor = encode_cursor(getattr(last, created_column.key), getattr(last, id_column.key))
+    return Page(items, next_cursor)
@@ -0,0 +1,97 @@
+import atexit
+import os
+import threading
+
+from sqlalchemy import update
+
+from app import app, db
+from models import Connection, Conversation
+from conversation_threads import advance_read
+from notification_counters import recount_unread
+from delta_sync import lock_users, record_change
+from live_events import queue_event
+
+# Read receipts. Opening a conversation marks it read by moving the
+# reader's watermark on its Conversation row up to the latest message: one
+# conditional UPDATE of one row, skipped entirely when nothing is unread,
+# instead of rewriting every unread Message row on each page view. With
+# READ_RECEIPT_DELAY set, marks are held in this process for that many
+# seconds and written in one transaction, so a burst of views costs one
+# write; badges and receipts then lag by up to the delay, and marks not yet
+# written when the process dies are lost (those messages stay unread).
+READ_RECEIPT_DELAY = float(os.environ.get('READ_RECEIPT_DELAY', 0))
+
+_pending = {}  # (reader id, other id) -> highest message id to mark read
+_pending_lock = threading.Lock()
+_flush_timer = None
+
+
+def _apply(marks):
+    """Move watermarks within the current transaction; returns how many moved.
+
+    marks maps (reader id, other id) to the highest message id read.
+    """
+    connection = db.session.connection()
+    # Lock every user's counter row once, in id order, before any Conversation row, as a message flush does
+    lock_users(connection, {user_id for pair in marks for user_id in pair})
+    moved = [(reader_id, other_id, message_id) for (reader_id, other_id), message_id in sorted(marks.items())
+             if advance_read(connection, reader_id, other_id, message_id)]
+    if not moved:
+        # Nothing changed for delta sync, so no change number and no new ETags
+        return 0
+
+    seq = record_change([user_id for reader_id, other_id, _ in moved for user_id in (reader_id, other_id)])
+    conversations = Conversation.__table__
+    for reader_id, other_id, message_id in moved:
+        low, high = Connection.pair(reader_id, other_id)
+        connection.execute(update(conversations).where(
+            conversations.c.low_user_id == low, conversations.c.high_user_id == high
+        ).values(change_seq=seq))
+        queue_event(db.session, other_id, 'messages_read', {'reader_id': reader_id, 'read_id': message_id})
+    for reader_id in sorted({reader_id for reader_id, _, _ in moved}):
+        recount_unread(connection, reader_id)
+    return len(moved)
+
+
+def mark_read(reader_id, other_id, message_id):
+    """Mark messages to reader_id from other_id up to message_id read.
+
+    Returns whether the current transaction was written to, in which case the
+    caller commits; with a write-behind delay the mark is queued instead.
+    """
+    if READ_RECEIPT_DELAY <= 0:
+        return _apply({(reader_id, other_id): message_id}) > 0
+
+    global _flush_timer
+    with _pending_lock:
+        key = (reader_id, other_id)
+        _pending[key] = max(message_id, _pending.get(key, 0))
+        if _flush_timer is None:
+            _flush_timer = threading.Timer(READ_RECEIPT_DELAY, flush_read_marks)
+            _flush_timer.daemon = True
+            _flush_timer.start()
+    return False
+
+
+def flush_read_marks():
+    """Write every queued mark in one transaction; returns how many watermarks moved"""
+    global _flush_timer
+    with _pending_lock:
+        marks = dict(_pending)
+        _pending.clear()
+        _flush_timer = None
+    if not marks:
+        return 0
+
+    with app.app_context():
+        try:
+            moved = _apply(marks)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            app.logger.warning(f"Dropped {len(marks)} read receipts: {e}")
+            return 0
+    return moved
+
+
+atexit.register(flush_read_marks)
@@ -0,0 +1,99 @@
+from connection_graph import preload
+from alumni_index import current_employee_ids
+
+# Shortest chains of connections from a job seeker to people currently at
+# a company. The search is a bidirectional BFS over the cached adjacency
+# sets: one side grows from the seeker, the other from every employee at
+# once, always expanding whichever frontier is smaller, so a three-hop
+# query touches a few thousand adjacency sets rather than the whole graph.
+MAX_HOPS = 3
+PATH_LIMIT = 5
+
+# Cap on the shortest-path parents kept per node, to bound path enumeration
+MAX_PARENTS = 10
+
+
+class _Side:
+    """One direction of the search: BFS distances and parents from its roots"""
+
+    def __init__(self, roots):
+        self.depth = 0
+        self.dist = {root: 0 for root in roots}
+        self.parents = {root: [] for root in roots}
+        self.frontier = list(roots)
+
+    def expand(self):
+        """Advance one level; returns the nodes reached for the first time"""
+        # One cache round trip and a query per chunk of uncached users
+        states = preload(self.frontier)
+        reached = []
+        for node in self.frontier:
+            for neighbour in states[node][0]:
+                seen = self.dist.get(neighbour)
+                if seen is None:
+                    self.dist[neighbour] = self.depth + 1
+                    self.parents[neighbour] = [node]
+                    reached.append(neighbour)
+                elif seen == self.depth + 1 and len(self.parents[neighbour]) < MAX_PARENTS:
+                    self.parents[neighbour].append(node)
+        self.depth += 1
+        self.frontier = reached
+        return reached
+
+    def paths_to(self, node, limit):
+        """Up to limit shortest paths from a root to node, root first"""
+        if not self.parents[node]:
+            return [[node]]
+        paths = []
+        for parent in self.parents[node]:
+            for path in self.paths_to(parent, limit - len(paths)):
+                paths.append(path + [node])
+                if len(paths) >= limit:
+                    return paths
+        return paths
+
+
+def find_referral_paths(seeker_id, company_name, limit=PATH_LIMIT, max_hops=MAX_HOPS):
+    """Up to limit shortest connection paths from seeker_id to current employees of a company.
+
+    Each path is a list of user ids starting with the seeker and ending with
+    an employee; paths longer than max_hops connections are not returned.
+    """
+    targets = current_employee_ids(company_name) - {seeker_id}
+    if not targets:
+        return []
+
+    forward = _Side([seeker_id])
+    backward = _Side(targets)
+    meetings = []  # (path length, meeting node)
+    met = set()
+
+    while forward.depth + backward.depth < max_hops:
+        if not forward.frontier and not backward.frontier:
+            break
+        # Grow the smaller frontier; an exhausted side cannot grow
+        side, other = (forward, backward) if (
+            forward.frontier and (len(forward.frontier) <= len(backward.frontier) or not backward.frontier)
+        ) else (backward, forward)
+        for node in side.expand():
+            if node in other.dist and node not in met:
+                met.add(node)
+                meetings.append((forward.dist[node] + backward.dist[node], node))
+        # Enough meeting points; anything reached later only makes longer paths
+        if len(meetings) >= limit:
+            break
+
+    paths = []
+    seen = set()
+    for length, node in sorted(meetings):
+        for head in forward.paths_to(node, limit):
+            for tail in backward.paths_to(node, limit):
+                # Backward paths run employee-first
+                path = head + tail[::-1][1:]
+                if len(set(path)) != len(path) or tuple(path) in seen:
+                    continue
+                seen.add(tuple(path))
+                paths.append(path)
+                if len(paths) >= limit:
+                    return paths
+    return paths
@@ -1,14 +1,32 @@
-from flask import render_template, redirect, url_for, flash, request, abort, jsonify
+from flask import render_template, redirect, url_for, flash, request, abort, jsonify, Response
 from flask_login import login_user, logout_user, login_required, current_user
 from app import app, db, cache
 from functools import wraps
-from models import User, UserSkill, Experience, Education, Connection, Message, ReferralRequest, JobReferral, JobPosting
+from models import (User, UserSkill, Experience, Education, Connection, Message, ReferralRequest, JobReferral, JobPosting,
+                    Conversation)
 from forms import (LoginForm, RegistrationForm, ProfileForm, ExperienceForm, 
                    EducationForm, SkillForm, ConnectionRequestForm, MessageForm,
                    ReferralRequestForm, JobReferralForm, JobPostingForm, SearchForm, ProfilePhotoForm, ResumeUploadForm)
-from logo_fetcher import fetch_company_logo, delete_company_logo
+from logo_store import release_company_logo
+from image_variants import generate_variants_from_file, delete_variants, find_variant
+from search_index import job_search_filter
+from suggest_index import suggest, SUGGEST_LIMIT, MAX_SUGGEST_LIMIT
+from skill_index import normalize_skill, parse_skill_query, skill_scores
+from search_cache import ranked_page
+from network_suggestions import get_suggestions, mutual_connection_ids, SUGGESTION_LIMIT
+from referral_paths import find_referral_paths, PATH_LIMIT
+from alumni_index import alumni_query, company_tenures, company_key, user_company_keys, ALUMNI_CURRENT, ALUMNI_FORMER
+from pagination import paginate, page_size
+from notification_counters import recount_users, counts_for
+from conversation_threads import recount_conversation, history_page, read_marks
+from read_receipts import mark_read
+from live_events import stream as live_event_stream
+from delta_sync import changes_since, record_change, sync_state
+from logo_jobs import enqueue_logo_fetch, LOGO_PENDING
 from datetime import datetime
 from sqlalchemy import or_, and_, desc
+from sqlalchemy.orm import joinedload
+from sqlalchemy.exc import IntegrityError
 from werkzeug.utils import secure_filename
 import os
 import uuid
@@ -44,6 +62,9 @@ def save_profile_photo(file):
         file_path = os.path.join(UPLOAD_FOLDER, filename)
         file.save(file_path)
         
+        # Pre-scaled copies so lists don't download the full photo
+        generate_variants_from_file(UPLOAD_FOLDER, filename)
+        
         return filename
     return None
 
@@ -69,6 +90,7 @@ def delete_profile_photo(filename):
         file_path = os.path.join(UPLOAD_FOLDER, filename)
         if os.path.exists(file_path):
             os.remove(file_path)
+        delete_variants(UPLOAD_FOLDER, filename)
 
 def delete_resume_file(filename):
     """Delete resume file from filesystem"""
@@ -78,6 +100,120 @@ def delete_resume_file(filename):
             os.remove(file_path)
 
 
+@app.template_global()
+def image_variant_url(folder, filename, display_size, fmt='jpg'):
+    """URL of the smallest stored variant covering display_size.
+
+    Without one, a JPEG request falls back to the original image and any
+    other format gets None, since the original is not in that format.
+    """
+    variant = find_variant(os.path.join(app.static_folder, folder), filename, display_size, fmt)
+    if not variant and fmt != 'jpg':
+        return None
+    return url_for('static', filename=f"{folder}/{variant or filename}")
+
+@app.template_global()
+def page_url(cursor_param, cursor):
+    """URL of the current page with cursor_param set to cursor, or removed if cursor is None"""
+    args = request.args.to_dict()
+    args.pop(cursor_param, None)
+    if cursor:
+        args[cursor_param] = cursor
+    return url_for(request.endpoint, **(request.view_args or {}), **args)
+
+def wants_json():
+    """Check if the client asked for a JSON response"""
+    return request.args.get('format') == 'json' or request.accept_mimetypes.best == 'application/json'
+
+def get_page(query, model, cursor_param='cursor'):
+    """Paginate a query newest first using the cursor and limit request arguments"""
+    return paginate(query, model.created_at, model.id,
+                    cursor=request.args.get(cursor_param),
+                    limit=page_size(request.args.get('limit')))
+
+def user_to_dict(user):
+    """Public profile summary for JSON responses"""
+    return {
+        'id': user.id,
+        'username': user.username,
+        'full_name': user.get_full_name(),
+        'headline': user.headline,
+        'current_company': user.current_company,
+        'current_position': user.current_position,
+        'location': user.location,
+        'profile_url': url_for('view_profile', username=user.username)
+    }
+
+def person_result_to_dict(result):
+    """Search result person, with their spans at the searched company if any"""
+    data = user_to_dict(result['data'])
+    if 'tenures' in result:
+        data['tenures'] = [{
+            'start_date': start_date.isoformat() if start_date else None,
+            'end_date': end_date.isoformat() if end_date else None,
+            'current': current
+        } for start_date, end_date, current in result['tenures']]
+    return data
+
+def job_to_dict(job):
+    """Job posting for JSON responses"""
+    return {
+        'id': job.id,
+        'title': job.title,
+        'company': job.company,
+        'location': job.location,
+        'employment_type': job.employment_type,
+        'salary_range': job.salary_range,
+        'created_at': job.created_at.isoformat() if job.created_at else None
+    }
+
+def referral_request_to_dict(referral_request):
+    """Referral request for JSON responses"""
+    return {
+        'id': referral_request.id,
+        'job_seeker': user_to_dict(referral_request.job_seeker),
+        'target_company': referral_request.target_company,
+        'target_role': referral_request.target_role,
+        'status': referral_request.status,
+        'created_at': referral_request.created_at.isoformat() if referral_request.created_at else None
+    }
+
+def job_referral_to_dict(referral):
+    """Job referral for JSON responses"""
+    return {
+        'id': referral.id,
+        'referrer': user_to_dict(referral.referrer),
+        'candidate': user_to_dict(referral.candidate),
+        'company': referral.company,
+        'role_title': referral.role_title,
+        'status': referral.status,
+        'created_at': referral.created_at.isoformat() if referral.created_at else None
+    }
+
+def message_to_dict(message, marks=None):
+    """Message for JSON responses; marks are read watermarks as returned by read_marks"""
+    return {
+        'id': message.id,
+        'sender': message.sender.username,
+        'receiver': message.receiver.username,
+        'content': message.content,
+        'read': message.id <= (marks or {}).get((message.receiver_id, message.sender_id), 0),
+        'status': message.message_request_status,
+        'created_at': message.created_at.isoformat() if message.created_at else None
+    }
+
+
+def connection_to_dict(connection):
+    """Connection for JSON responses"""
+    return {
+        'id': connection.id,
+        'sender': connection.sender.username,
+        'receiver': connection.receiver.username,
+        'status': connection.status,
+        'created_at': connection.created_at.isoformat() if connection.created_at else None,
+        'updated_at': connection.updated_at.isoformat() if connection.updated_at else None
+    }
+
 
 # Performance optimization helpers
 def cache_key_for_user(user_id, suffix=""):
@@ -108,21 +244,27 @@ def get_user_connections_cached(user_id):
         User.id != user_id
     ).all()
 
-@cache.memoize(timeout=60)
+def get_skills_by_user(user_ids):
+    """Map user ids to their skill names, loaded in one query"""
+    skills = {user_id: [] for user_id in user_ids}
+    if skills:
+        rows = db.session.query(UserSkill.user_id, UserSkill.skill_name).filter(
+            UserSkill.user_id.in_(skills.keys())
+        ).order_by(UserSkill.id).all()
+        for user_id, skill_name in rows:
+            skills[user_id].append(skill_name)
+    return skills
+
+def suggested_people(user_id, limit):
+    """People a user may know as [(user, mutual connection count), ...]"""
+    suggestions = get_suggestions(user_id, limit)
+    users = {user.id: user for user in User.query.filter(User.id.in_([uid for uid, _ in suggestions])).all()}
+    return [(users[uid], count) for uid, count in suggestions if uid in users]
+
 def get_message_counts(user_id):
-    """Get message counts with caching"""
-    unread_count = Message.query.filter_by(
-        receiver_id=user_id, 
-        read=False,
-        message_request_status='approved'
-    ).count()
-    
-    pending_requests = Message.query.filter_by(
-        receiver_id=user_id,
-        message_request_status='pending'
-    ).count()
-    
-    return unread_count, pending_requests
+    """Unread messages and pending message requests, from the user's counters"""
+    counts = counts_for(user_id)
+    return counts.unread_messages, counts.pending_message_requests
 
 
 @app.route('/')
@@ -134,23 +276,22 @@ def index():
                 Connection.receiver_id == current_user.id)
         ).filter(Connection.status == 'accepted').order_by(Connection.updated_at.desc()).limit(5).all()
         
-        unread_messages = Message.query.filter_by(
-            receiver_id=current_user.id, read=False
-        ).count()
-        
-        pending_requests = Connection.query.filter_by(
-            receiver_id=current_user.id, status='pending'
-        ).count()
+        counts = current_user.notification_counts()
+        unread_messages = counts.unread_messages
+        pending_requests = counts.pending_connection_requests
         
         recent_referrals = JobReferral.query.filter_by(
             candidate_id=current_user.id
         ).order_by(JobReferral.created_at.desc()).limit(3).all()
         
+        people_you_may_know = suggested_people(current_user.id, 5)
+        
         return render_template('index.html', 
                              recent_connections=recent_connections,
                              unread_messages=unread_messages,
                              pending_requests=pending_requests,
-                             recent_referrals=recent_referrals)
+                             recent_referrals=recent_referrals,
+                             people_you_may_know=people_you_may_know)
     else:
         return render_template('index.html')
 
@@ -216,16 +357,18 @@ def view_profile(username):
     skills = UserSkill.query.filter_by(user_id=user.id).all()
     experiences = Experience.query.filter_by(user_id=user.id).order_by(Experience.start_date.desc()).all()
     educations = Education.query.filter_by(user_id=user.id).order_by(Education.start_year.desc()).all()
-    referrals = JobReferral.query.filter_by(candidate_id=user.id).order_by(JobReferral.created_at.desc()).all()
+    referral_count = JobReferral.query.filter_by(candidate_id=user.id).count()
     
     is_own_profile = current_user.id == user.id
     is_connected = current_user.is_connected_to(user) if not is_own_profile else False
     has_pending_request = current_user.has_pending_connection_with(user) if not is_own_profile else False
+    mutual_count = len(mutual_connection_ids(current_user.id, user.id)) if not is_own_profile else 0
     
     return render_template('profile/view.html', user=user, skills=skills, 
                          experiences=experiences, educations=educations,
-                         referrals=referrals, is_own_profile=is_own_profile,
-                         is_connected=is_connected, has_pending_request=has_pending_request)
+                         referral_count=referral_count, is_own_profile=is_own_profile,
+                         is_connected=is_connected, has_pending_request=has_pending_request,
+                         mutual_count=mutual_count)
 
 
 @app.route('/profile/edit', methods=['GET', 'POST'])
@@ -274,7 +417,7 @@ def add_skill():
         # Check if skill already exists for user
         existing_skill = UserSkill.query.filter_by(
             user_id=current_user.id, 
-            skill_name=skill_name
+            normalized_skill=normalize_skill(skill_name)
         ).first()
         
         if not existing_skill:
@@ -313,9 +456,6 @@ def delete_skill(skill_id):
 def add_experience():
     form = ExperienceForm()
     if form.validate_on_submit():
-        # Automatically fetch company logo
-        company_logo_filename = fetch_company_logo(form.company.data)
-        
         experience = Experience(
             user_id=current_user.id,
             company=form.company.data,
@@ -326,10 +466,13 @@ def add_experience():
             employment_type=form.employment_type.data,
             description=form.description.data,
             location=form.location.data,
-            company_logo=company_logo_filename
+            logo_status=LOGO_PENDING
         )
         db.session.add(experience)
         db.session.commit()
+        
+        # Fetch the company logo in the background
+        enqueue_logo_fetch(experience.id, experience.company)
         flash('Work experience added successfully!', 'success')
         return redirect(url_for('view_profile', username=current_user.username))
     
@@ -346,12 +489,13 @@ def edit_experience(experience_id):
     form = ExperienceForm(obj=experience)
     if form.validate_on_submit():
         # Check if company name changed
-        if experience.company != form.company.data:
+        company_changed = experience.company != form.company.data
+        if company_changed:
             # Delete old logo if exists
             if experience.company_logo:
-                delete_company_logo(experience.company_logo)
-            # Fetch new logo for the new company
-            experience.company_logo = fetch_company_logo(form.company.data)
+                release_company_logo(experience.company_logo)
+            experience.company_logo = None
+            experience.logo_status = LOGO_PENDING
         
         experience.company = form.company.data
         experience.position = form.position.data
@@ -363,6 +507,11 @@ def edit_experience(experience_id):
         experience.location = form.location.data
         
         db.session.commit()
+        
+        # Fetch a logo for the new company in the background
+        if company_changed:
+            enqueue_logo_fetch(experience.id, experience.company)
+        
         flash('Work experience updated successfully!', 'success')
         return redirect(url_for('view_profile', username=current_user.username))
     
@@ -378,7 +527,7 @@ def delete_experience(experience_id):
     
     # Delete company logo if exists
     if experience.company_logo:
-        delete_company_logo(experience.company_logo)
+        release_company_logo(experience.company_logo)
     
     db.session.delete(experience)
     db.session.commit()
@@ -520,22 +669,31 @@ def remove_resume():
 @app.route('/connections')
 @login_required
 def connections():
-    accepted_connections = db.session.query(Connection).filter(
+    accepted_connections = db.session.query(Connection).options(
+        joinedload(Connection.sender), joinedload(Connection.receiver)
+    ).filter(
         or_(
             and_(Connection.sender_id == current_user.id, Connection.status == 'accepted'),
             and_(Connection.receiver_id == current_user.id, Connection.status == 'accepted')
         )
-    ).all()
+    )
+    page = get_page(accepted_connections, Connection)
     
     # Get the actual connected users
     connected_users = []
-    for conn in accepted_connections:
+    for conn in page.items:
         if conn.sender_id == current_user.id:
             connected_users.append(conn.receiver)
         else:
             connected_users.append(conn.sender)
     
-    return render_template('connections/index.html', connected_users=connected_users)
+    if wants_json():
+        return jsonify({
+            'connections': [user_to_dict(user) for user in connected_users],
+            'next_cursor': page.next_cursor
+        })
+    
+    return render_template('connections/index.html', connected_users=connected_users, page=page)
 
 
 @app.route('/connections/requests')
@@ -572,12 +730,7 @@ def send_connection_request(username):
         return redirect(url_for('view_profile', username=username))
     
     # Check if already connected or request pending
-    existing_connection = Connection.query.filter(
-        or_(
-            and_(Connection.sender_id == current_user.id, Connection.receiver_id == user.id),
-            and_(Connection.sender_id == user.id, Connection.receiver_id == current_user.id)
-        )
-    ).first()
+    existing_connection = Connection.between(current_user.id, user.id).first()
     
     if existing_connection:
         if existing_connection.status == 'accepted':
@@ -594,7 +747,9 @@ def send_connection_request(username):
             message=""
         )
         db.session.add(connection)
-        db.session.commit()
+        if not commit_connection_request():
+            flash('Connection request already pending', 'info')
+            return redirect(url_for('view_profile', username=username))
         flash('Connection request sent!', 'success')
         return redirect(url_for('view_profile', username=username))
     
@@ -607,13 +762,26 @@ def send_connection_request(username):
             message=form.message.data
         )
         db.session.add(connection)
-        db.session.commit()
+        if not commit_connection_request():
+            flash('Connection request already pending', 'info')
+            return redirect(url_for('view_profile', username=username))
         flash('Connection request sent!', 'success')
         return redirect(url_for('view_profile', username=username))
     
     return render_template('connections/send_request.html', form=form, user=user)
 
 
+def commit_connection_request():
+    """Commit a new Connection; False if the pair already has a row"""
+    try:
+        db.session.commit()
+        return True
+    except IntegrityError:
+        # A request between the same users was committed concurrently
+        db.session.rollback()
+        return False
+
+
 @app.route('/connections/<int:request_id>/accept', methods=['POST'])
 @login_required
 def accept_connection(request_id):
@@ -693,13 +861,7 @@ def remove_connection_by_username(username):
     user = User.query.filter_by(username=username).first_or_404()
     
     # Find the connection between current user and the target user
-    connection = Connection.query.filter(
-        or_(
-            and_(Connection.sender_id == current_user.id, Connection.receiver_id == user.id),
-            and_(Connection.sender_id == user.id, Connection.receiver_id == current_user.id)
-        ),
-        Connection.status == 'accepted'
-    ).first()
+    connection = Connection.between(current_user.id, user.id).filter_by(status='accepted').first()
     
     if not connection:
         flash('Connection not found', 'error')
@@ -715,28 +877,31 @@ def remove_connection_by_username(username):
 @app.route('/messages')
 @login_required
 def messages():
-    # Get approved conversations only
-    conversations = db.session.query(Message).filter(
-        or_(Message.sender_id == current_user.id, Message.receiver_id == current_user.id),
-        Message.message_request_status == 'approved'
-    ).order_by(Message.created_at.desc()).all()
-    
-    # Group by conversation partner
-    conversation_partners = {}
-    for message in conversations:
-        partner_id = message.sender_id if message.receiver_id == current_user.id else message.receiver_id
-        if partner_id not in conversation_partners:
-            partner = User.query.get(partner_id)
-            conversation_partners[partner_id] = {
-                'user': partner,
-                'last_message': message,
-                'unread_count': Message.query.filter_by(
-                    sender_id=partner_id, receiver_id=current_user.id, read=False,
-                    message_request_status='approved'
-                ).count()
-            }
-    
-    return render_template('messages/index.html', conversations=conversation_partners.values())
+    # One row per conversation, most recent activity first
+    threads = Conversation.query.options(
+        joinedload(Conversation.low_user), joinedload(Conversation.high_user), joinedload(Conversation.last_message)
+    ).filter(or_(Conversation.low_user_id == current_user.id, Conversation.high_user_id == current_user.id))
+    page = paginate(threads, Conversation.last_message_at, Conversation.id,
+                    cursor=request.args.get('cursor'), limit=page_size(request.args.get('limit')))
+    conversations = [{
+        'user': thread.partner(current_user.id),
+        'last_message': thread.last_message,
+        'unread_count': thread.unread_for(current_user.id),
+        'read_id': thread.read_id_for(thread.last_message.receiver_id)
+    } for thread in page.items]
+
+    if wants_json():
+        return jsonify({
+            'conversations': [{
+                'user': user_to_dict(conversation['user']),
+                'last_message': dict(message_to_dict(conversation['last_message']),
+                                     read=conversation['last_message'].id <= conversation['read_id']),
+                'unread_count': conversation['unread_count']
+            } for conversation in conversations],
+            'next_cursor': page.next_cursor
+        })
+    
+    return render_template('messages/index.html', conversations=conversations, page=page)
 
 
 @app.route('/messages/requests')
@@ -746,9 +911,16 @@ def message_requests():
     pending_requests = Message.query.filter_by(
         receiver_id=current_user.id, 
         message_request_status='pending'
-    ).order_by(Message.created_at.desc()).all()
+    )
+    page = get_page(pending_requests, Message)
     
-    return render_template('messages/requests.html', pending_requests=pending_requests)
+    if wants_json():
+        return jsonify({
+            'requests': [message_to_dict(message) for message in page.items],
+            'next_cursor': page.next_cursor
+        })
+    
+    return render_template('messages/requests.html', pending_requests=page.items, page=page)
 
 
 @app.route('/messages/requests/<int:message_id>/approve', methods=['POST'])
@@ -786,25 +958,19 @@ def decline_message_request(message_id):
 def conversation(username):
     user = User.query.filter_by(username=username).first_or_404()
     
-    # Check if there's an existing approved conversation
-    existing_conversation = Message.query.filter(
-        or_(
-            and_(Message.sender_id == current_user.id, Message.receiver_id == user.id),
-            and_(Message.sender_id == user.id, Message.receiver_id == current_user.id)
-        ),
-        Message.message_request_status == 'approved'
-    ).first()
+    # A Conversation row exists once the pair has an approved message
+    low, high = Connection.pair(current_user.id, user.id)
+    existing_conversation = Conversation.query.filter_by(low_user_id=low, high_user_id=high).first()
     
     # If no approved conversation exists, create a message request
     if not existing_conversation:
         flash('This will send a message request to the user', 'info')
     
-    # Mark approved messages as read
-    Message.query.filter_by(
-        sender_id=user.id, receiver_id=current_user.id, read=False,
-        message_request_status='approved'
-    ).update({'read': True})
-    db.session.commit()
+    # Mark approved messages as read by moving our watermark; no write when nothing is unread
+    if existing_conversation and existing_conversation.unread_for(current_user.id) \
+            and existing_conversation.read_id_for(current_user.id) < existing_conversation.last_message_id:
+        if mark_read(current_user.id, user.id, existing_conversation.last_message_id):
+            db.session.commit()
     
     form = MessageForm()
     if form.validate_on_submit():
@@ -857,24 +1023,51 @@ def conversation(username):
             'error': '; '.join(errors) if errors else 'Please fill in all required fields'
         })
     
-    # Get all conversation history (approved messages)
-    # Force a fresh query by clearing any cached results
-    db.session.expire_all()
-    messages = Message.query.filter(
-        or_(
-            and_(Message.sender_id == current_user.id, Message.receiver_id == user.id),
-            and_(Message.sender_id == user.id, Message.receiver_id == current_user.id)
-        ),
-        Message.message_request_status == 'approved'
-    ).order_by(Message.created_at.asc()).all()
+    # Latest page of the conversation, oldest first; older pages come from conversation_history
+    page = history_page(current_user.id, user.id, limit=page_size(request.args.get('limit')))
+    messages = page.items[::-1]
+    partner_read_id = existing_conversation.read_id_for(user.id) if existing_conversation else 0
     
-    return render_template('messages/conversation.html', user=user, messages=messages, form=form)
+    return render_template('messages/conversation.html', user=user, messages=messages, page=page, form=form,
+                           partner_read_id=partner_read_id)
+
+
+@app.route('/api/messages/<username>/history')
+@login_required
+def conversation_history(username):
+    """Older messages of a conversation, oldest first, starting before cursor"""
+    user = User.query.filter_by(username=username).first_or_404()
+    page = history_page(current_user.id, user.id, cursor=request.args.get('cursor'),
+                        limit=page_size(request.args.get('limit')))
+    marks = read_marks(current_user.id, [user.id])
+    return jsonify({
+        'messages': [message_to_dict(message, marks) for message in page.items[::-1]],
+        'next_cursor': page.next_cursor
+    })
+
+@app.route('/api/messages/<username>/read', methods=['POST'])
+@login_required
+def mark_conversation_read(username):
+    """Mark messages from a user read up to message_id, for messages shown live on an open conversation"""
+    user = User.query.filter_by(username=username).first_or_404()
+    low, high = Connection.pair(current_user.id, user.id)
+    existing_conversation = Conversation.query.filter_by(low_user_id=low, high_user_id=high).first()
+    message_id = (request.get_json(silent=True) or {}).get('message_id')
+    if not existing_conversation or not isinstance(message_id, int):
+        return jsonify({'success': False, 'error': 'Missing conversation or message_id'}), 400
+
+    # Never past the newest message, or messages sent later would arrive already read
+    if mark_read(current_user.id, user.id, min(message_id, existing_conversation.last_message_id)):
+        db.session.commit()
+    return jsonify({'success': True})
 
 @app.route('/messages/<username>/delete', methods=['POST'])
 @login_required
 def delete_conversation(username):
     user = User.query.filter_by(username=username).first_or_404()
     
+    # Lock both users' counter rows before touching messages, counters or the conversation
+    record_change([current_user.id, user.id])
     # Delete all messages between current user and target user
     Message.query.filter(
         or_(
@@ -882,11 +1075,65 @@ def delete_conversation(username):
             and_(Message.sender_id == user.id, Message.receiver_id == current_user.id)
         )
     ).delete()
+    # The unread counts derive from the conversation's watermarks, so rebuild it first
+    recount_conversation(current_user.id, user.id)
+    recount_users([current_user.id, user.id])
     db.session.commit()
     
     flash(f'Conversation with {user.get_full_name()} has been deleted.', 'success')
     return redirect(url_for('messages'))
 
+@app.route('/api/events')
+@login_required
+def live_events():
+    """Server-sent events: new messages, message and connection requests, approvals"""
+    response = Response(live_event_stream(current_user.id), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    # Keep proxies from buffering the stream
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+@app.route('/api/sync')
+@login_required
+def sync():
+    """Messages, connections, read receipts and counters changed since the client's cursor"""
+    since = request.args.get('since', default=-1, type=int)
+    state = sync_state(current_user.id)
+    etag = f"sync-{current_user.id}-{since}-{state}"
+    if request.if_none_match.contains(etag):
+        response = app.response_class(status=304)
+        response.set_etag(etag)
+        return response
+
+    if state > since:
+        changes, cursor, has_more = changes_since(current_user.id, since)
+    else:
+        changes, cursor, has_more = {}, since, False
+    messages, threads = changes.get(Message, []), changes.get(Conversation, [])
+    marks = read_marks(current_user.id, [message.sender_id if message.receiver_id == current_user.id
+                                         else message.receiver_id for message in messages])
+    counts = current_user.notification_counts()
+    response = jsonify({
+        'cursor': cursor,
+        'has_more': has_more,
+        'messages': [message_to_dict(message, marks) for message in messages],
+        'connections': [connection_to_dict(connection) for connection in changes.get(Connection, [])],
+        'read_receipts': [{
+            'user': thread.partner(current_user.id).username,
+            'read_id': thread.read_id_for(current_user.id),
+            'partner_read_id': thread.read_id_for(thread.partner(current_user.id).id),
+            'unread_count': thread.unread_for(current_user.id)
+        } for thread in threads],
+        'counters': {
+            'unread_messages': counts.unread_messages,
+            'pending_message_requests': counts.pending_message_requests,
+            'pending_connection_requests': counts.pending_connection_requests
+        }
+    })
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
 @app.route('/api/messages/send', methods=['POST'])
 @login_required
 def send_message_api():
@@ -941,22 +1188,42 @@ def send_message_api():
 @login_required
 def referrals():
     # Get referral requests (people looking for jobs)
-    open_requests = ReferralRequest.query.filter_by(status='open').order_by(ReferralRequest.created_at.desc()).all()
+    open_page = get_page(ReferralRequest.query.filter_by(status='open'), ReferralRequest, 'open_cursor')
     
     # Get referrals I've given (as a company employee)
-    given_referrals = JobReferral.query.filter_by(referrer_id=current_user.id).order_by(JobReferral.created_at.desc()).all()
+    given_page = get_page(JobReferral.query.filter_by(referrer_id=current_user.id), JobReferral, 'given_cursor')
     
     # Get referrals I've received (as a job seeker)
-    received_referrals = JobReferral.query.filter_by(candidate_id=current_user.id).order_by(JobReferral.created_at.desc()).all()
+    received_page = get_page(JobReferral.query.filter_by(candidate_id=current_user.id), JobReferral, 'received_cursor')
     
     # Get my own referral requests
-    my_requests = ReferralRequest.query.filter_by(job_seeker_id=current_user.id).order_by(ReferralRequest.created_at.desc()).all()
+    my_page = get_page(ReferralRequest.query.filter_by(job_seeker_id=current_user.id), ReferralRequest, 'mine_cursor')
+    
+    # Companies I work or worked at, to flag requests I can help with
+    my_companies = user_company_keys(current_user.id)
+    insider_requests = {r.id: my_companies[company_key(r.target_company)]
+                        for r in open_page.items if company_key(r.target_company) in my_companies}
+    
+    if wants_json():
+        return jsonify({
+            'open_requests': [referral_request_to_dict(r) for r in open_page.items],
+            'open_next_cursor': open_page.next_cursor,
+            'given_referrals': [job_referral_to_dict(r) for r in given_page.items],
+            'given_next_cursor': given_page.next_cursor,
+            'received_referrals': [job_referral_to_dict(r) for r in received_page.items],
+            'received_next_cursor': received_page.next_cursor,
+            'my_requests': [referral_request_to_dict(r) for r in my_page.items],
+            'mine_next_cursor': my_page.next_cursor
+        })
     
     return render_template('referrals/index.html', 
-                         open_requests=open_requests,
-                         given_referrals=given_referrals,
-                         received_referrals=received_referrals,
-                         my_requests=my_requests)
+                         open_requests=open_page.items,
+                         given_referrals=given_page.items,
+                         received_referrals=received_page.items,
+                         my_requests=my_page.items,
+                         open_page=open_page, given_page=given_page,
+                         received_page=received_page, my_page=my_page,
+                         insider_requests=insider_requests)
 
 
 @app.route('/referrals/request', methods=['GET', 'POST'])
@@ -977,6 +1244,29 @@ def request_referral():
     
     return render_template('referrals/request.html', form=form)
 
+@app.route('/referrals/paths')
+@login_required
+def referral_paths():
+    """Shortest chains of connections from the current user to people at a company"""
+    company = request.args.get('company', '').strip()
+    paths = []
+    if company:
+        limit = min(request.args.get('limit', PATH_LIMIT, type=int), 20)
+        id_paths = find_referral_paths(current_user.id, company, limit=max(limit, 1))
+        users = {user.id: user for user in User.query.filter(
+            User.id.in_({user_id for path in id_paths for user_id in path})
+        ).all()}
+        paths = [[users[user_id] for user_id in path] for path in id_paths
+                 if all(user_id in users for user_id in path)]
+    
+    if wants_json():
+        return jsonify({
+            'company': company,
+            'paths': [[user_to_dict(user) for user in path] for path in paths]
+        })
+    
+    return render_template('referrals/paths.html', company=company, paths=paths)
+
 @app.route('/referrals/request-from/<username>', methods=['GET', 'POST'])
 @login_required
 def request_referral_from_user(username):
@@ -1112,20 +1402,17 @@ def jobs():
     query = JobPosting.query.filter_by(is_active=True)
     
     if search_query:
-        query = query.filter(
-            or_(
-                JobPosting.title.contains(search_query),
-                JobPosting.company.contains(search_query),
-                JobPosting.description.contains(search_query)
-            )
-        )
+        query = query.filter(job_search_filter(search_query))
     
     if location_filter:
         query = query.filter(JobPosting.location.contains(location_filter))
     
-    jobs = query.order_by(JobPosting.created_at.desc()).all()
+    page = get_page(query, JobPosting)
+    
+    if wants_json():
+        return jsonify({'jobs': [job_to_dict(job) for job in page.items], 'next_cursor': page.next_cursor})
     
-    return render_template('jobs/index.html', jobs=jobs, 
+    return render_template('jobs/index.html', jobs=page.items, page=page,
                          search_query=search_query, location_filter=location_filter)
 
 
@@ -1158,42 +1445,104 @@ def post_job():
 def search():
     form = SearchForm()
     results = []
+    people_page = jobs_page = None
     
     if request.args.get('query'):
         query = request.args.get('query')
         search_type = request.args.get('search_type', 'people')
         
         if search_type in ['people', 'all']:
-            people = User.query.filter(
-                or_(
-                    User.username.contains(query),
-                    User.first_name.contains(query),
-                    User.last_name.contains(query),
-                    User.headline.contains(query),
-                    User.current_company.contains(query)
-                )
-            ).filter(User.id != current_user.id).all()
+            people_page = ranked_page('user', query, request.args.get('people_cursor'),
+                                      limit=page_size(request.args.get('limit')),
+                                      exclude_ids={current_user.id})
             
-            for person in people:
+            for person in people_page.items:
                 results.append({
                     'type': 'person',
                     'data': person
                 })
         
-        if search_type in ['jobs', 'all']:
-            jobs = JobPosting.query.filter(
-                JobPosting.is_active == True,
-                or_(
-                    JobPosting.title.contains(query),
-                    JobPosting.company.contains(query),
-                    JobPosting.description.contains(query)
+        if search_type == 'skills':
+            # People having every listed skill, strongest proficiency first
+            skills = parse_skill_query(query)
+            if skills:
+                scores = skill_scores(skills)
+                people_page = paginate(
+                    db.session.query(User, scores.c.score).join(scores, scores.c.user_id == User.id)
+                    .filter(User.id != current_user.id),
+                    scores.c.score, User.id,
+                    cursor=request.args.get('people_cursor'),
+                    limit=page_size(request.args.get('limit')),
+                    row_key=lambda row: (row.score, row.User.id)
                 )
-            ).all()
+                
+                for person, score in people_page.items:
+                    results.append({
+                        'type': 'person',
+                        'data': person
+                    })
+        
+        if search_type == 'company':
+            # Current and former employees from everyone's work history
+            employment = request.args.get('employment')
+            if employment not in [ALUMNI_CURRENT, ALUMNI_FORMER]:
+                employment = None
+            people_page = get_page(alumni_query(query, employment).filter(User.id != current_user.id),
+                                   User, 'people_cursor')
+            tenures = company_tenures(query, [person.id for person in people_page.items])
+            
+            for person in people_page.items:
+                results.append({
+                    'type': 'person',
+                    'data': person,
+                    'tenures': tenures[person.id]
+                })
+        
+        if search_type in ['jobs', 'all']:
+            jobs_page = ranked_page('job_posting', query, request.args.get('jobs_cursor'),
+                                    limit=page_size(request.args.get('limit')),
+                                    options=[joinedload(JobPosting.posted_by)])
             
-            for job in jobs:
+            for job in jobs_page.items:
                 results.append({
                     'type': 'job',
                     'data': job
                 })
     
-    return render_template('search/index.html', form=form, results=results, query=request.args.get('query', ''))
+    if wants_json():
+        return jsonify({
+            'people': [person_result_to_dict(r) for r in results if r['type'] == 'person'],
+            'people_next_cursor': people_page.next_cursor if people_page else None,
+            'jobs': [job_to_dict(r['data']) for r in results if r['type'] == 'job'],
+            'jobs_next_cursor': jobs_page.next_cursor if jobs_page else None
+        })
+    
+    # Relationship state for every person shown, resolved in one query per facet
+    people = [r['data'] for r in results if r['type'] == 'person']
+    posters = [r['data'].posted_by_id for r in results if r['type'] == 'job' and r['data'].posted_by_id]
+    connection_status = current_user.connection_statuses([person.id for person in people] + posters)
+    user_skills = get_skills_by_user([person.id for person in people])
+    
+    return render_template('search/index.html', form=form, results=results, query=request.args.get('query', ''),
+                         people_page=people_page, jobs_page=jobs_page,
+                         connection_status=connection_status, user_skills=user_skills)
+
+
+@app.route('/api/people-you-may-know')
+@login_required
+def people_you_may_know():
+    """Friends of friends ranked by mutual connections"""
+    limit = min(request.args.get('limit', 10, type=int), SUGGESTION_LIMIT)
+    return jsonify({'people': [
+        dict(user_to_dict(user), mutual_connections=count)
+        for user, count in suggested_people(current_user.id, max(limit, 1))
+    ]})
+
+
+@app.route('/api/search/suggest')
+@login_required
+def search_suggest():
+    """Typeahead suggestions for the search box, served from memory"""
+    query = request.args.get('q', '')
+    limit = min(request.args.get('limit', SUGGEST_LIMIT, type=int), MAX_SUGGEST_LIMIT)
+    return jsonify({'query': query, 'suggestions': suggest(query, max(limit, 1))})
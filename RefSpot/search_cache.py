@@ -0,0 +1,122 @@
+import hashlib
+import os
+import uuid
+
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+from models import User, JobPosting
+from search_index import SEARCH_FIELDS, SEARCH_MODELS, ranked_search_query, search_terms
+from pagination import Page, PAGE_SIZE, paginate, encode_cursor, decode_cursor
+from shared_cache import cache_get, cache_set
+
+# Ranked search results are cached per normalized query as the ordered ids
+# of the top SEARCH_CACHE_RESULTS matches, so popular queries and their
+# next pages cost one IN lookup. Each table has a version token that is
+# part of every key; committing a change to a searchable field stamps a new
+# random one, which orphans that table's cached results. A fresh token
+# rather than an increment, so two processes bumping at once can't both
+# write the same next version and leave results cached between the two
+# commits in place.
+SEARCH_CACHE_TTL = int(os.environ.get('SEARCH_CACHE_TTL', 300))
+SEARCH_CACHE_RESULTS = 500
+SEARCH_VERSION_TTL = 30 * 24 * 3600
+
+# Columns whose changes can alter search results, beyond SEARCH_FIELDS
+_EXTRA_FIELDS = {
+    'job_posting': ['is_active'],
+}
+
+
+def _version_key(table):
+    return f"search_version_{table}"
+
+
+def _results_key(table, version, query):
+    digest = hashlib.sha1(' '.join(search_terms(query)).encode()).hexdigest()
+    return f"search_results_{table}_v{version}_{digest}"
+
+
+def bump_search_version(table):
+    """Invalidate every cached result for a table"""
+    cache_set(_version_key(table), uuid.uuid4().hex, SEARCH_VERSION_TTL)
+
+
+def ranked_matches(table, query):
+    """Return ([(id, score), ...], truncated) for the best matches of query, best first"""
+    version = cache_get(_version_key(table)) or 0
+    key = _results_key(table, version, query)
+    cached = cache_get(key)
+    if cached is not None:
+        return cached
+
+    model = SEARCH_MODELS[table]
+    ranked, score = ranked_search_query(table, query)
+    rows = ranked.order_by(score.desc(), model.id.desc()).limit(SEARCH_CACHE_RESULTS + 1).all()
+    result = ([(row.id, row.score) for row in rows[:SEARCH_CACHE_RESULTS]], len(rows) > SEARCH_CACHE_RESULTS)
+    cache_set(key, result, SEARCH_CACHE_TTL)
+    return result
+
+
+def _load(model, ids, options):
+    """Instances for ids, in the same order"""
+    if not ids:
+        return []
+    found = {obj.id: obj for obj in model.query.options(*options).filter(model.id.in_(ids)).all()}
+    return [found[row_id] for row_id in ids if row_id in found]
+
+
+def ranked_page(table, query, cursor=None, limit=PAGE_SIZE, exclude_ids=(), options=()):
+    """One Page of model instances matching query, best first, starting after cursor"""
+    model = SEARCH_MODELS[table]
+    matches, truncated = ranked_matches(table, query)
+
+    start = 0
+    position = decode_cursor(cursor)
+    if position:
+        while start < len(matches) and (matches[start][1], matches[start][0]) >= position:
+            start += 1
+
+    if truncated and start >= len(matches):
+        # Past the cached head of a very broad query; page the database directly
+        ranked, score = ranked_search_query(table, query)
+        if exclude_ids:
+            ranked = ranked.filter(model.id.notin_(exclude_ids))
+        page = paginate(ranked, score, model.id, cursor=cursor, limit=limit,
+                        row_key=lambda row: (row.score, row.id))
+        return Page(_load(model, [row.id for row in page.items], options), page.next_cursor)
+
+    remaining = [(row_id, score) for row_id, score in matches[start:] if row_id not in exclude_ids]
+    selected = remaining[:limit]
+    # A truncated list continues in the database after its last entry
+    next_cursor = None
+    if selected and (len(remaining) > limit or truncated):
+        next_cursor = encode_cursor(selected[-1][1], selected[-1][0])
+    return Page(_load(model, [row_id for row_id, _ in selected], options), next_cursor)
+
+
+@event.listens_for(Session, 'after_flush')
+def _collect_search_changes(session, flush_context):
+    """Note which searchable tables the flush changed"""
+    changed = session.info.setdefault('search_tables_changed', set())
+    for obj in list(session.new) + list(session.deleted):
+        if isinstance(obj, (User, JobPosting)):
+            changed.add(obj.__table__.name)
+    for obj in session.dirty:
+        if isinstance(obj, (User, JobPosting)):
+            table = obj.__table__.name
+            state = inspect(obj)
+            fields = SEARCH_FIELDS[table] + _EXTRA_FIELDS.get(table, [])
+            if any(state.attrs[field].history.has_changes() for field in fields):
+                changed.add(table)
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_search_results(session):
+    for table in session.info.pop('search_tables_changed', ()):
+        bump_search_version(table)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_search_changes(session):
+    session.info.pop('search_tables_changed', None)
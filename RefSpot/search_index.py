@@ -0,0 +1,174 @@
+import re
+
+from sqlalchemy import or_, text, select, literal_column, func, literal
+from sqlalchemy.exc import SQLAlchemyError
+
+from app import app, db
+from models import User, JobPosting
+
+# Full-text indexes over the columns the search and jobs pages match on.
+# SQLite uses FTS5 tables kept in sync by triggers; Postgres uses a generated
+# tsvector column with a GIN index. Anything else falls back to LIKE scans.
+SEARCH_FIELDS = {
+    'user': ['username', 'first_name', 'last_name', 'headline', 'current_company'],
+    'job_posting': ['title', 'company', 'description'],
+}
+
+# Relative weight of each field when ranking, in SEARCH_FIELDS order: a
+# match in a name or title counts for more than one in a description
+SEARCH_WEIGHTS = {
+    'user': [2.0, 3.0, 3.0, 1.0, 1.5],
+    'job_posting': [3.0, 2.0, 1.0],
+}
+
+SEARCH_MODELS = {
+    'user': User,
+    'job_posting': JobPosting,
+}
+
+# Which backend init_search_index() managed to set up: 'fts5', 'tsvector' or None
+_backend = None
+
+
+def _fts_table(table):
+    return f"{table}_fts"
+
+
+def _sqlite_statements(table, fields):
+    """DDL for an external-content FTS5 table and the triggers that keep it in sync"""
+    fts = _fts_table(table)
+    columns = ', '.join(fields)
+    new_values = ', '.join(f"new.{field}" for field in fields)
+    old_values = ', '.join(f"old.{field}" for field in fields)
+    return [
+        f"""CREATE VIRTUAL TABLE {fts} USING fts5({columns}, content='{table}', content_rowid='id',
+            tokenize='unicode61', prefix='2 3')""",
+        f"""CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON "{table}" BEGIN
+            INSERT INTO {fts}(rowid, {columns}) VALUES (new.id, {new_values});
+        END""",
+        f"""CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON "{table}" BEGIN
+            INSERT INTO {fts}({fts}, rowid, {columns}) VALUES ('delete', old.id, {old_values});
+        END""",
+        f"""CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE OF {columns} ON "{table}" BEGIN
+            INSERT INTO {fts}({fts}, rowid, {columns}) VALUES ('delete', old.id, {old_values});
+            INSERT INTO {fts}(rowid, {columns}) VALUES (new.id, {new_values});
+        END""",
+        # Index rows that existed before the FTS table
+        f"INSERT INTO {fts}({fts}) VALUES ('rebuild')",
+    ]
+
+
+def _postgres_statements(table, fields):
+    """DDL for a generated tsvector column and its GIN index"""
+    document = " || ' ' || ".join(f"coalesce({field}, '')" for field in fields)
+    return [
+        f"""ALTER TABLE "{table}" ADD COLUMN IF NOT EXISTS search_vector tsvector
+            GENERATED ALWAYS AS (to_tsvector('simple', {document})) STORED""",
+        f'CREATE INDEX IF NOT EXISTS ix_{table}_search_vector ON "{table}" USING GIN (search_vector)',
+    ]
+
+
+def init_search_index():
+    """Create the full-text index structures for the current database if missing"""
+    global _backend
+    dialect = db.engine.dialect.name
+
+    try:
+        with db.engine.begin() as conn:
+            if dialect == 'sqlite':
+                for table, fields in SEARCH_FIELDS.items():
+                    exists = conn.execute(
+                        text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"),
+                        {'name': _fts_table(table)}
+                    ).first()
+                    if not exists:
+                        for statement in _sqlite_statements(table, fields):
+                            conn.execute(text(statement))
+                _backend = 'fts5'
+            elif dialect == 'postgresql':
+                for table, fields in SEARCH_FIELDS.items():
+                    for statement in _postgres_statements(table, fields):
+                        conn.execute(text(statement))
+                _backend = 'tsvector'
+    except SQLAlchemyError as e:
+        # e.g. SQLite built without FTS5; search keeps working through LIKE
+        app.logger.warning(f"Full-text search index unavailable: {e}")
+        _backend = None
+
+
+def search_terms(query):
+    """Split a search query into lower-case word terms"""
+    return re.findall(r'\w+', (query or '').lower())
+
+
+def _match_clause(model, table, query):
+    """Filter clause selecting rows of model whose indexed fields match every query term as a prefix"""
+    terms = search_terms(query)
+    if not terms:
+        return None
+
+    if _backend == 'fts5':
+        fts = _fts_table(table)
+        match = ' '.join(f'"{term}"*' for term in terms)
+        return model.id.in_(
+            select(literal_column('rowid')).select_from(text(fts))
+            .where(text(f"{fts} MATCH :match_{table}").bindparams(**{f'match_{table}': match}))
+        )
+
+    if _backend == 'tsvector':
+        tsquery = ' & '.join(f"{term}:*" for term in terms)
+        return text(f"\"{table}\".search_vector @@ to_tsquery('simple', :tsquery_{table})").bindparams(
+            **{f'tsquery_{table}': tsquery}
+        )
+
+    return None
+
+
+def user_search_filter(query):
+    """Filter clause for people matching a search query"""
+    clause = _match_clause(User, 'user', query)
+    if clause is not None:
+        return clause
+    return or_(*[getattr(User, field).contains(query) for field in SEARCH_FIELDS['user']])
+
+
+def job_search_filter(query):
+    """Filter clause for job postings matching a search query"""
+    clause = _match_clause(JobPosting, 'job_posting', query)
+    if clause is not None:
+        return clause
+    return or_(*[getattr(JobPosting, field).contains(query) for field in SEARCH_FIELDS['job_posting']])
+
+
+def ranked_search_query(table, query):
+    """(query, score) where query yields (id, score) for rows of table matching query.
+
+    Higher scores are better matches. FTS5 ranks with weighted BM25 and Postgres with ts_rank_cd; without a
+    full-text index every LIKE match scores 0.
+    """
+    model = SEARCH_MODELS[table]
+    base = model.query.with_entities(model.id)
+    if table == 'job_posting':
+        base = base.filter(JobPosting.is_active == True)
+
+    terms = search_terms(query)
+    if _backend == 'fts5' and terms:
+        fts = _fts_table(table)
+        weights = ', '.join(str(weight) for weight in SEARCH_WEIGHTS[table])
+        match = ' '.join(f'"{term}"*' for term in terms)
+        # bm25() is lower for better matches
+        ranked = select(
+            literal_column('rowid').label('id'),
+            literal_column(f"-bm25({fts}, {weights})").label('score')
+        ).select_from(text(fts)).where(
+            text(f"{fts} MATCH :rank_{table}").bindparams(**{f'rank_{table}': match})
+        ).subquery()
+        return base.join(ranked, ranked.c.id == model.id).add_columns(ranked.c.score), ranked.c.score
+
+    if _backend == 'tsvector' and terms:
+        tsquery = ' & '.join(f"{term}:*" for term in terms)
+        score = func.ts_rank_cd(literal_column(f'"{table}".search_vector'), func.to_tsquery('simple', tsquery))
+        return base.filter(_match_clause(model, table, query)).add_columns(score.label('score')), score
+
+    fallback = user_search_filter(query) if table == 'user' else job_search_filter(query)
+    return base.filter(fallback).add_columns(literal(0).label('score')), literal(0)
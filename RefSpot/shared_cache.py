@@ -0,0 +1,101 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from app import cache
+
+# Thin wrapper over the Flask-Caching backend so callers keep working when
+# the shared cache (Redis) is unreachable. Values are written to this
+# process only while the backend is raising, and read back only then; a
+# miss in a reachable backend is a miss. The local copy is bounded: least
+# recently used entries go once it holds LOCAL_CACHE_ENTRIES, and expired
+# ones are swept at most every LOCAL_CACHE_SWEEP seconds.
+LOCAL_CACHE_ENTRIES = int(os.environ.get('LOCAL_CACHE_ENTRIES', 10000))
+LOCAL_CACHE_SWEEP = 60
+LOCAL_COUNTER_TTL = 30 * 24 * 3600
+
+# key -> (expires at, value), least recently used first
+_local_cache = OrderedDict()
+_local_lock = threading.Lock()
+_last_sweep = time.monotonic()
+
+
+def _local_get(key):
+    with _local_lock:
+        item = _local_cache.get(key)
+        if item is None:
+            return None
+        expires_at, value = item
+        if expires_at < time.monotonic():
+            del _local_cache[key]
+            return None
+        _local_cache.move_to_end(key)
+        return value
+
+
+def _local_set(key, value, timeout):
+    global _last_sweep
+    with _local_lock:
+        now = time.monotonic()
+        _local_cache[key] = (now + timeout, value)
+        _local_cache.move_to_end(key)
+        if now - _last_sweep >= LOCAL_CACHE_SWEEP:
+            for expired in [k for k, (expires_at, _) in _local_cache.items() if expires_at < now]:
+                del _local_cache[expired]
+            _last_sweep = now
+        while len(_local_cache) > LOCAL_CACHE_ENTRIES:
+            _local_cache.popitem(last=False)
+
+
+def cache_get(key):
+    """Read from the shared cache, or this process while it is unreachable"""
+    try:
+        return cache.get(key)
+    except Exception:
+        # Cache is not available, continue with the in-process copy
+        return _local_get(key)
+
+
+def cache_get_many(keys):
+    """Read several keys in one round trip; values in the same order"""
+    keys = list(keys)
+    if not keys:
+        return []
+    try:
+        return list(cache.get_many(*keys))
+    except Exception:
+        return [_local_get(key) for key in keys]
+
+
+def cache_set(key, value, timeout):
+    """Write to the shared cache, or this process while it is unreachable"""
+    try:
+        cache.set(key, value, timeout=timeout)
+    except Exception:
+        _local_set(key, value, timeout)
+        return
+    # A copy left from an outage would be stale by the next one
+    with _local_lock:
+        _local_cache.pop(key, None)
+
+
+def cache_inc(key):
+    """Add one to a counter in the shared cache, atomically; returns the new value"""
+    try:
+        return cache.inc(key)
+    except Exception:
+        with _local_lock:
+            value = _local_cache.get(key, (None, 0))[1]
+            _local_cache[key] = (time.monotonic() + LOCAL_COUNTER_TTL, value + 1)
+            _local_cache.move_to_end(key)
+            return value + 1
+
+
+def cache_delete(key):
+    with _local_lock:
+        _local_cache.pop(key, None)
+    try:
+        cache.delete(key)
+    except Exception:
+        pass
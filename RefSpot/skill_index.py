@@ -0,0 +1,76 @@
+import re
+
+from sqlalchemy import event, func, case
+
+from app import db
+from models import UserSkill
+
+# Skill search runs on UserSkill.normalized_skill: a canonical lower-case
+# name with common aliases folded together, indexed with user_id so each
+# skill's posting list is a single index range. A multi-skill query
+# intersects the posting lists and ranks people by summed proficiency.
+SKILL_ALIASES = {
+    'golang': 'go',
+    'k8s': 'kubernetes',
+    'js': 'javascript',
+    'ts': 'typescript',
+    'py': 'python',
+    'postgres': 'postgresql',
+    'node': 'node.js',
+    'nodejs': 'node.js',
+    'react.js': 'react',
+    'reactjs': 'react',
+    'ml': 'machine learning',
+    'ai': 'artificial intelligence',
+    'aws': 'amazon web services',
+    'gcp': 'google cloud',
+}
+
+PROFICIENCY_WEIGHTS = {
+    'beginner': 1,
+    'intermediate': 2,
+    'advanced': 3,
+    'expert': 4,
+}
+
+MAX_QUERY_SKILLS = 10
+
+
+def normalize_skill(skill_name):
+    """Canonical form of a skill name: lower case, single spaces, aliases resolved"""
+    name = ' '.join((skill_name or '').lower().split())
+    return SKILL_ALIASES.get(name, name)
+
+
+def parse_skill_query(query):
+    """Split a query like "Kubernetes, Go and Python" into canonical skill names.
+
+    Only commas, semicolons and the word "and" separate skills; "/" and "&"
+    are part of names such as CI/CD, C/C++ and R&D.
+    """
+    parts = re.split(r'\s*(?:[,;]|\band\b)\s*', (query or '').lower())
+    skills = []
+    for part in parts:
+        skill = normalize_skill(part)
+        if skill and skill not in skills:
+            skills.append(skill)
+    return skills[:MAX_QUERY_SKILLS]
+
+
+def skill_scores(skills):
+    """Subquery of (user_id, score) for users having every skill, scored by proficiency"""
+    weight = case(PROFICIENCY_WEIGHTS, value=UserSkill.proficiency, else_=PROFICIENCY_WEIGHTS['intermediate'])
+    return db.session.query(
+        UserSkill.user_id.label('user_id'),
+        func.sum(weight).label('score')
+    ).filter(
+        UserSkill.normalized_skill.in_(skills)
+    ).group_by(UserSkill.user_id).having(
+        func.count(func.distinct(UserSkill.normalized_skill)) == len(skills)
+    ).subquery()
+
+
+@event.listens_for(UserSkill, 'before_insert')
+@event.listens_for(UserSkill, 'before_update')
+def _normalize_on_write(mapper, connection, target):
+    target.normalized_skill = normalize_skill(target.skill_name)
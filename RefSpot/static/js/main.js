@@ -166,17 +166,133 @@ function initializeMessages() {
         }, 1000);
     }
     
-    // Real-time message updates (simplified)
-    if (window.location.pathname.includes('/messages/')) {
-        // In a real application, this would use WebSockets or polling
-        setInterval(checkForNewMessages, 30000); // Check every 30 seconds
+    // Live updates pushed by the server; only signed-in pages have the messages menu
+    if (document.getElementById('messagesDropdown') && typeof EventSource !== 'undefined') {
+        initializeLiveEvents();
     }
 }
 
-function checkForNewMessages() {
-    // Placeholder for real-time message checking
-    // In a real implementation, this would make an API call
-    console.log('Checking for new messages...');
+function initializeLiveEvents() {
+    const events = new EventSource('/api/events');
+
+    events.addEventListener('message', function(e) {
+        const message = JSON.parse(e.data);
+        const conversation = document.querySelector('.conversation-messages');
+        if (conversation && Number(conversation.dataset.partnerId) === message.sender.id) {
+            appendLiveMessage(conversation, message);
+            markLiveMessageRead(message);
+        } else {
+            bumpMessagesBadge();
+            showLiveNotification(`New message from ${message.sender.full_name}`,
+                                 `/messages/${encodeURIComponent(message.sender.username)}`);
+        }
+    });
+
+    events.addEventListener('messages_read', function(e) {
+        const receipt = JSON.parse(e.data);
+        const conversation = document.querySelector('.conversation-messages');
+        if (conversation && Number(conversation.dataset.partnerId) === receipt.reader_id) {
+            markSentMessagesRead(conversation, receipt.read_id);
+        }
+    });
+
+    events.addEventListener('message_request', function(e) {
+        const message = JSON.parse(e.data);
+        bumpMessagesBadge();
+        showLiveNotification(`${message.sender.full_name} sent you a message request`, '/messages/requests');
+    });
+
+    events.addEventListener('message_request_approved', function(e) {
+        const approval = JSON.parse(e.data);
+        showLiveNotification(`${approval.receiver.full_name} accepted your message request`,
+                             `/messages/${encodeURIComponent(approval.receiver.username)}`);
+    });
+
+    events.addEventListener('connection_request', function(e) {
+        const request = JSON.parse(e.data);
+        showLiveNotification(`${request.sender.full_name} wants to connect`, '/connections/requests');
+    });
+
+    events.addEventListener('connection_accepted', function(e) {
+        const connection = JSON.parse(e.data);
+        showLiveNotification(`${connection.receiver.full_name} accepted your connection request`,
+                             `/profile/${encodeURIComponent(connection.receiver.username)}`);
+    });
+}
+
+function appendLiveMessage(container, message) {
+    const content = document.createElement('div');
+    content.textContent = message.content;
+    const time = new Date(message.created_at).toLocaleString([], {
+        month: 'long', day: '2-digit', year: 'numeric', hour: '2-digit', minute: '2-digit'
+    });
+    container.insertAdjacentHTML('beforeend', `
+        <div class="message-bubble message-received">
+            <div class="message-content" style="word-wrap: break-word; white-space: pre-wrap;">${content.innerHTML}</div>
+            <div class="message-time small mt-2 text-muted">${time}</div>
+        </div>
+    `);
+    container.scrollTop = container.scrollHeight;
+}
+
+// Messages appended to an open conversation are read; once the tab is visible, move the watermark
+function markLiveMessageRead(message) {
+    if (document.visibilityState === 'hidden') {
+        document.addEventListener('visibilitychange', function() {
+            markLiveMessageRead(message);
+        }, { once: true });
+        return;
+    }
+    fetch(`/api/messages/${encodeURIComponent(message.sender.username)}/read`, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ message_id: message.id })
+    }).catch(() => {});
+}
+
+function markSentMessagesRead(container, readId) {
+    container.querySelectorAll('.message-sent[data-message-id]').forEach(function(bubble) {
+        const check = bubble.querySelector('.message-time svg, .message-time i');
+        if (check && Number(bubble.dataset.messageId) <= readId) {
+            check.outerHTML = '<i data-feather="check-circle" style="width: 12px; height: 12px;" class="ms-1 text-success"></i>';
+        }
+    });
+    feather.replace();
+}
+
+function bumpMessagesBadge() {
+    const link = document.getElementById('messagesDropdown');
+    let badge = link.querySelector('.badge');
+    if (!badge) {
+        badge = document.createElement('span');
+        badge.className = 'badge bg-primary position-absolute top-0 end-0';
+        badge.style.fontSize = '0.6rem';
+        badge.textContent = '0';
+        link.appendChild(badge);
+    }
+    badge.textContent = String(Number(badge.textContent) + 1);
+}
+
+function showLiveNotification(text, url) {
+    let area = document.getElementById('liveNotifications');
+    if (!area) {
+        area = document.createElement('div');
+        area.id = 'liveNotifications';
+        area.className = 'position-fixed bottom-0 end-0 p-3';
+        area.style.zIndex = '1080';
+        document.body.appendChild(area);
+    }
+    const alert = document.createElement('div');
+    alert.className = 'alert alert-info alert-dismissible fade show shadow-sm mb-2';
+    alert.setAttribute('role', 'alert');
+    const link = document.createElement('a');
+    link.href = url;
+    link.className = 'alert-link';
+    link.textContent = text;
+    alert.appendChild(link);
+    alert.insertAdjacentHTML('beforeend', '<button type="button" class="btn-close" data-bs-dismiss="alert"></button>');
+    area.appendChild(alert);
+    setTimeout(() => alert.remove(), 8000);
 }
 
 // Search enhancements
@@ -211,15 +327,21 @@ function initializeSearch() {
 }
 
 function showSearchSuggestions(query) {
-    // In a real implementation, this would make an API call for suggestions
-    const suggestions = [
-        'Software Engineer',
-        'Product Manager',
-        'Data Scientist',
-        'UX Designer',
-        'Marketing Manager'
-    ].filter(item => item.toLowerCase().includes(query.toLowerCase()));
-    
+    fetch(`/api/search/suggest?q=${encodeURIComponent(query)}`, {
+        headers: { 'Accept': 'application/json' }
+    })
+        .then(response => response.ok ? response.json() : { suggestions: [] })
+        .then(data => {
+            // Ignore answers for text the user has already changed
+            const searchInput = document.querySelector('input[name="query"]');
+            if (searchInput && searchInput.value.trim() === query) {
+                renderSearchSuggestions(data.suggestions.map(suggestion => suggestion.text));
+            }
+        })
+        .catch(() => hideSearchSuggestions());
+}
+
+function renderSearchSuggestions(suggestions) {
     const existingSuggestions = document.querySelector('.search-suggestions');
     if (existingSuggestions) {
         existingSuggestions.remove();
@@ -0,0 +1,215 @@
+import os
+import re
+import threading
+import time
+from bisect import bisect_left, insort
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from app import app, db
+from models import User, UserSkill, Experience, JobPosting
+from shared_cache import cache_get, cache_inc
+
+# In-memory typeahead index over people's names, companies, job titles and
+# skills. Every suffix of a phrase that starts on a word boundary is kept in
+# one sorted list, so a prefix lookup is a bisect plus a short forward scan
+# and "eng" finds "Software Engineer". The index is built at startup and
+# kept current by applying each committed change to the rows it covers.
+# Every such commit also increments a counter in the shared cache; a process
+# whose own commits don't account for the counter's value has missed writes
+# made by another worker, and rebuilds in the background, checking at most
+# every SUGGEST_CHECK_INTERVAL seconds.
+SUGGEST_LIMIT = 8
+MAX_SUGGEST_LIMIT = 20
+MAX_SCAN = 500  # Keys examined per lookup, however common the prefix
+SUGGEST_CHECK_INTERVAL = int(os.environ.get('SUGGEST_CHECK_INTERVAL', 30))
+_VERSION_KEY = 'suggest_index_version'
+
+_keys = []       # Sorted (key, kind, phrase) for every word-boundary suffix
+_entries = {}    # (kind, phrase) -> [label, number of rows using it]
+_sources = {}    # (model name, row id) -> [(kind, label), ...] that row contributed
+_lock = threading.Lock()
+_version = 0         # Shared counter value this process's index reflects
+_checked_at = 0      # Monotonic time of the last comparison with the shared counter
+_rebuild = None      # Background rebuild thread, while one runs
+_check_lock = threading.Lock()
+
+
+def _normalize(text):
+    """Lower-case words of a phrase joined by single spaces"""
+    return ' '.join(re.findall(r'\w+', (text or '').lower()))
+
+
+def _user_phrases(row):
+    name = ' '.join(part for part in [row.first_name, row.last_name] if part) or row.username
+    return [('person', name), ('company', row.current_company), ('title', row.current_position)]
+
+
+def _job_phrases(row):
+    if row.is_active is False:
+        return []
+    return [('company', row.company), ('title', row.title)]
+
+
+# Model -> (columns read at build time, function giving the (kind, label) pairs of a row)
+INDEXED_MODELS = {
+    User: (['first_name', 'last_name', 'username', 'current_company', 'current_position'], _user_phrases),
+    UserSkill: (['skill_name'], lambda row: [('skill', row.skill_name)]),
+    Experience: (['company', 'position'], lambda row: [('company', row.company), ('title', row.position)]),
+    JobPosting: (['company', 'title', 'is_active'], _job_phrases),
+}
+
+
+def _row_phrases(obj):
+    """(kind, label) pairs a model instance contributes, or None if its model isn't indexed"""
+    indexed = INDEXED_MODELS.get(type(obj))
+    return indexed[1](obj) if indexed else None
+
+
+def _add_phrase(kind, label, new_keys=None):
+    """Count a phrase, inserting its keys in order, or appending them to new_keys to be sorted later"""
+    phrase = _normalize(label)
+    if not phrase:
+        return
+    entry = _entries.get((kind, phrase))
+    if entry:
+        entry[1] += 1
+        return
+    _entries[(kind, phrase)] = [label.strip(), 1]
+    for match in re.finditer(r'\w+', phrase):
+        key = (phrase[match.start():], kind, phrase)
+        if new_keys is None:
+            insort(_keys, key)
+        else:
+            new_keys.append(key)
+
+
+def _remove_phrase(kind, label):
+    phrase = _normalize(label)
+    entry = _entries.get((kind, phrase))
+    if not entry:
+        return
+    entry[1] -= 1
+    if entry[1] > 0:
+        return
+    del _entries[(kind, phrase)]
+    for match in re.finditer(r'\w+', phrase):
+        key = (phrase[match.start():], kind, phrase)
+        i = bisect_left(_keys, key)
+        if i < len(_keys) and _keys[i] == key:
+            del _keys[i]
+
+
+def _set_source(source, phrases, new_keys=None):
+    """Replace the phrases a row contributes; phrases=None drops the row"""
+    for kind, label in _sources.pop(source, []):
+        _remove_phrase(kind, label)
+    if phrases:
+        phrases = [(kind, label) for kind, label in phrases if label]
+        for kind, label in phrases:
+            _add_phrase(kind, label, new_keys)
+        _sources[source] = phrases
+
+
+def build_suggest_index():
+    """(Re)build the index from the database"""
+    global _keys, _entries, _sources, _version
+    # Read before the rows, so a write committed meanwhile triggers another rebuild
+    version = cache_get(_VERSION_KEY) or 0
+    rows = []
+    for model, (columns, phrases) in INDEXED_MODELS.items():
+        query = db.session.query(model.id, *[getattr(model, column) for column in columns])
+        rows += [((model.__name__, row.id), phrases(row)) for row in query]
+    db.session.rollback()
+
+    with _lock:
+        # Collect every key and sort once; inserting each in order is quadratic
+        keys, _entries, _sources = [], {}, {}
+        for source, phrases in rows:
+            _set_source(source, phrases, keys)
+        keys.sort()
+        _keys = keys
+        _version = version
+
+
+def _rebuild_in_background():
+    global _rebuild
+    with app.app_context():
+        try:
+            build_suggest_index()
+        except Exception as e:
+            app.logger.warning(f"Suggest index rebuild failed: {e}")
+        finally:
+            _rebuild = None
+
+
+def _check_version():
+    """Start a rebuild if another process changed indexed rows since ours was built"""
+    global _checked_at, _rebuild
+    if time.monotonic() - _checked_at < SUGGEST_CHECK_INTERVAL or not _check_lock.acquire(blocking=False):
+        return
+    try:
+        if _rebuild is None:
+            _checked_at = time.monotonic()
+            if (cache_get(_VERSION_KEY) or 0) != _version:
+                _rebuild = threading.Thread(target=_rebuild_in_background, name='suggest-rebuild', daemon=True)
+                _rebuild.start()
+    finally:
+        _check_lock.release()
+
+
+def suggest(query, limit=SUGGEST_LIMIT):
+    """Top suggestions whose words start with query, most used first"""
+    prefix = _normalize(query)
+    if not prefix:
+        return []
+
+    _check_version()
+    with _lock:
+        found = {}
+        i = bisect_left(_keys, (prefix,))
+        end = min(len(_keys), i + MAX_SCAN)
+        while i < end and _keys[i][0].startswith(prefix):
+            _, kind, phrase = _keys[i]
+            if (kind, phrase) not in found:
+                label, count = _entries[(kind, phrase)]
+                # Phrases that start with the query beat mid-phrase matches
+                found[(kind, phrase)] = (not phrase.startswith(prefix), -count, len(label), label, kind)
+            i += 1
+
+    ranked = sorted(found.values())[:limit]
+    return [{'text': label, 'type': kind} for _, _, _, label, kind in ranked]
+
+
+@event.listens_for(Session, 'after_flush')
+def _collect_changes(session, flush_context):
+    """Remember what the flush changed so it can be applied once committed"""
+    changes = session.info.setdefault('suggest_changes', {})
+    for obj in list(session.new) + list(session.dirty):
+        phrases = _row_phrases(obj)
+        if phrases is not None:
+            changes[(type(obj).__name__, obj.id)] = phrases
+    for obj in session.deleted:
+        if _row_phrases(obj) is not None:
+            changes[(type(obj).__name__, obj.id)] = None
+
+
+@event.listens_for(Session, 'after_commit')
+def _apply_changes(session):
+    global _version
+    changes = session.info.pop('suggest_changes', None)
+    if not changes:
+        return
+    version = cache_inc(_VERSION_KEY)
+    with _lock:
+        for source, phrases in changes.items():
+            _set_source(source, phrases)
+        # Any other value means another process wrote too; the next check rebuilds
+        if version == _version + 1:
+            _version = version
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_changes(session):
+    session.info.pop('suggest_changes', None)
@@ -0,0 +1,121 @@
+import io
+import logging
+import os
+import tempfile
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import pytest
+from PIL import Image
+
+# app.py reads these at import, so they are set before any test imports it
+os.environ.setdefault('DATABASE_URL', f"sqlite:///{tempfile.mkdtemp(prefix='refspot-tests-')}/test.db")
+os.environ.setdefault('SESSION_SECRET', 'test-secret')
+
+# Import the app before any test module imports a module that needs it
+from app import app as flask_app  # noqa: E402
+
+# Probes still in flight when a stub server stops would log after pytest closes its streams
+logging.getLogger('urllib3').setLevel(logging.WARNING)
+
+
+def _png(size=48):
+    # Noise, so the file is well over the favicon size check
+    image = Image.frombytes('RGB', (size, size), os.urandom(size * size * 3))
+    output = io.BytesIO()
+    image.save(output, 'PNG')
+    return output.getvalue()
+
+
+class _LogoHandler(BaseHTTPRequestHandler):
+    """Serves /<delay seconds>/<ok|missing>/<anything>: a PNG or a 404 after the delay"""
+
+    def do_GET(self):
+        _, delay, outcome, *_ = self.path.split('/')
+        self.server.hits.append(self.path)
+        time.sleep(float(delay))
+        if outcome == 'ok':
+            body = self.server.image
+            self.send_response(200)
+            self.send_header('Content-Type', 'image/png')
+        else:
+            body = b'not found'
+            self.send_response(404)
+            self.send_header('Content-Type', 'text/plain')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        try:
+            self.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def logo_server():
+    """A local stub logo host; returns its base URL, with .hits listing requested paths"""
+    server = ThreadingHTTPServer(('127.0.0.1', 0), _LogoHandler)
+    server.daemon_threads = True
+    server.hits = []
+    server.image = _png()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    base = f"http://127.0.0.1:{server.server_address[1]}"
+    yield type('LogoServer', (), {'url': base, 'hits': server.hits, 'image': server.image})
+    server.shutdown()
+    server.server_close()
+
+
+class _CacheBackend:
+    """Dict standing in for Redis that counts round trips and can be switched off"""
+
+    def __init__(self):
+        self.values = {}
+        self.up = True
+        self.calls = []
+
+    def _call(self, name):
+        self.calls.append(name)
+        if not self.up:
+            raise ConnectionError('cache backend down')
+
+    def get(self, key):
+        self._call('get')
+        return self.values.get(key)
+
+    def get_many(self, *keys):
+        self._call('get_many')
+        return [self.values.get(key) for key in keys]
+
+    def set(self, key, value, timeout=None):
+        self._call('set')
+        self.values[key] = value
+
+    def inc(self, key):
+        self._call('inc')
+        self.values[key] = self.values.get(key, 0) + 1
+        return self.values[key]
+
+    def delete(self, key):
+        self._call('delete')
+        self.values.pop(key, None)
+
+
+@pytest.fixture
+def cache_backend(monkeypatch):
+    """Replace the shared cache backend, and the outage copy, with fresh ones"""
+    import shared_cache
+    backend = _CacheBackend()
+    monkeypatch.setattr(shared_cache, 'cache', backend)
+    monkeypatch.setattr(shared_cache, '_local_cache', shared_cache.OrderedDict())
+    return backend
+
+
+@pytest.fixture(scope='session')
+def app():
+    """The application, on the throwaway SQLite database set up above"""
+    flask_app.config.update(TESTING=True, WTF_CSRF_ENABLED=False)
+    return flask_app
@@ -0,0 +1,26 @@
+from datetime import date
+
+from alumni_index import alumni_query, ALUMNI_CURRENT, ALUMNI_FORMER
+from app import db
+from models import Experience, User
+
+
+def test_everyone_includes_current_and_former(app):
+    with app.app_context():
+        profile_only = User(username='alumni-profile', email='alumni-profile@example.com', password_hash='-',
+                            current_company='Alumnia Inc')
+        former = User(username='alumni-former', email='alumni-former@example.com', password_hash='-')
+        db.session.add_all([profile_only, former])
+        db.session.flush()
+        db.session.add(Experience(user_id=former.id, company='Alumnia', position='Engineer',
+                                  start_date=date(2015, 1, 1), end_date=date(2018, 1, 1), current=False))
+        db.session.commit()
+
+        def usernames(status):
+            return {user.username for user in alumni_query('Alumnia', status)}
+
+        everyone, current, past = usernames(None), usernames(ALUMNI_CURRENT), usernames(ALUMNI_FORMER)
+        assert current == {'alumni-profile'}
+        assert past == {'alumni-former'}
+        assert current <= everyone and past <= everyone
+        assert everyone == {'alumni-profile', 'alumni-former'}
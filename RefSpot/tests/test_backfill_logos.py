@@ -0,0 +1,69 @@
+import importlib
+import re
+
+import pytest
+
+import commands
+import logo_fetcher
+from app import db
+from logo_jobs import LOGO_PENDING, LOGO_READY
+from models import User, Experience
+
+
+@pytest.fixture
+def stub_logos(monkeypatch, tmp_path, logo_server):
+    """Point logo fetching at the stub through the environment, as an operator would"""
+    monkeypatch.setenv('LOGO_CLEARBIT_URL', f"{logo_server.url}/0/missing/{{domain}}")
+    monkeypatch.setenv('LOGO_FAVICON_URLS', f"{logo_server.url}/0/ok/{{domain}}")
+    importlib.reload(logo_fetcher)
+    # Logo files are written under the working directory
+    monkeypatch.chdir(tmp_path)
+    yield logo_server
+    monkeypatch.undo()
+    importlib.reload(logo_fetcher)
+
+
+def _companies_fetched(hits):
+    return {re.sub(r'(www\.)?(.*?)(group|corp)?\.(com|in|org|net)$', r'\2', hit.rsplit('/', 1)[-1]) for hit in hits}
+
+
+def test_backfill_resumes_after_interruption(app, monkeypatch, stub_logos):
+    companies = [f"Backfill Stub {name}" for name in ['Alpha', 'Beta', 'Gamma', 'Delta']]
+    with app.app_context():
+        user = User(username='backfill-owner', email='backfill-owner@example.com')
+        user.set_password('secret1')
+        db.session.add(user)
+        db.session.flush()
+        experiences = [Experience(user_id=user.id, company=company, position='Engineer', logo_status=LOGO_PENDING)
+                       for company in companies for _ in range(2)]
+        db.session.add_all(experiences)
+        db.session.commit()
+        first_id = experiences[0].id
+    runner = app.test_cli_runner()
+
+    # Interrupt the run once its first batch (two companies) is committed
+    report = commands._report
+
+    def interrupt_after_first_batch(*args):
+        report(*args)
+        raise KeyboardInterrupt
+
+    monkeypatch.setattr(commands, '_report', interrupt_after_first_batch)
+    result = runner.invoke(args=['backfill-logos', '--batch-size', '4', '--after-id', str(first_id - 1)])
+    assert result.exit_code == 1 and 'Aborted' in result.output  # Click's handling of Ctrl-C
+    resume_id = int(re.search(r'resume with --after-id (\d+)', result.output).group(1))
+    assert resume_id == first_id + 3
+    first_run = _companies_fetched(stub_logos.hits)
+    assert first_run == {'backfillstubalpha', 'backfillstubbeta'}
+
+    monkeypatch.setattr(commands, '_report', report)
+    result = runner.invoke(args=['backfill-logos', '--batch-size', '4', '--after-id', str(resume_id)])
+    assert result.exception is None, result.output
+    assert 'Done: 4 experiences, 4 logos attached' in result.output
+    # The resumed run fetched only the companies the first one had not reached
+    assert _companies_fetched(stub_logos.hits) - first_run == {'backfillstubgamma', 'backfillstubdelta'}
+
+    with app.app_context():
+        rows = Experience.query.filter(Experience.company.in_(companies)).all()
+        assert {row.logo_status for row in rows} == {LOGO_READY}
+        assert len({row.company_logo for row in rows}) == 1  # The stub serves one image for every company
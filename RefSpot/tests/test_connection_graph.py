@@ -0,0 +1,33 @@
+import connection_graph
+import network_suggestions
+from app import db
+from models import Connection, User
+
+
+def _users(count, prefix):
+    users = [User(username=f'{prefix}{i}', email=f'{prefix}{i}@example.com', password_hash='-')
+             for i in range(count)]
+    db.session.add_all(users)
+    db.session.flush()
+    return [user.id for user in users]
+
+
+def test_preload_reads_versions_in_one_round_trip(app, cache_backend, monkeypatch):
+    with app.app_context():
+        hub, *spokes = _users(6, 'graph-hub')
+        db.session.add_all(Connection(sender_id=hub, receiver_id=spoke, status='accepted') for spoke in spokes[:4])
+        db.session.add(Connection(sender_id=spokes[4], receiver_id=hub, status='pending'))
+        db.session.commit()
+
+        # Smaller than the batch, so the adjacency cache evicts while loading
+        monkeypatch.setattr(connection_graph, 'GRAPH_CACHE_USERS', 2)
+        cache_backend.calls.clear()
+        states = connection_graph.preload([hub, *spokes])
+        assert cache_backend.calls == ['get_many']
+        assert states[hub] == (frozenset(spokes[:4]), frozenset(spokes[4:]))
+        assert all(states[spoke][0] == {hub} for spoke in spokes[:4])
+        assert len(connection_graph._adjacency) == 2
+
+        # Suggestions work from the preloaded edges, not the evicted cache
+        assert network_suggestions.mutual_counts(spokes[0], spokes[1:4]) == dict.fromkeys(spokes[1:4], 1)
+        assert network_suggestions.compute_suggestions(spokes[0]) == [(spoke, 1) for spoke in spokes[1:4]]
@@ -0,0 +1,33 @@
+import pytest
+
+import domain_resolver
+
+
+@pytest.fixture
+def registry(monkeypatch):
+    """An empty registry that doesn't load the shipped data file"""
+    monkeypatch.setattr(domain_resolver, '_mappings', {})
+    monkeypatch.setattr(domain_resolver, '_trie', None)
+    monkeypatch.setattr(domain_resolver, '_loaded', True)
+    for company, domain in [('HP', 'hp.com'), ('HP Enterprise', 'hpe.com'), ('General Motors', 'gm.com'),
+                            ('Motors', 'motors.example'), ('AT&T', 'att.com')]:
+        domain_resolver.register_company_domain(company, domain)
+
+
+@pytest.mark.parametrize('name, domain', [
+    # A short key matches only as a whole word
+    ('HP Inc', 'hp.com'),
+    ('hp', 'hp.com'),
+    ('Shpock', None),
+    ('Chip Designs', None),
+    ('HPE', None),
+    # The longest whole-word match wins, wherever it starts
+    ('HP Enterprise Services', 'hpe.com'),
+    ('Hewlett Packard / HP Enterprise', 'hpe.com'),
+    ('General Motors Company', 'gm.com'),
+    ('Tesla Motors', 'motors.example'),
+    ('AT and T Mobility', 'att.com'),
+    ('Unknown Widgets', None),
+])
+def test_whole_word_longest_match(registry, name, domain):
+    assert domain_resolver.resolve_company_domain(name) == domain
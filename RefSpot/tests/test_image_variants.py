@@ -0,0 +1,24 @@
+import os
+
+from PIL import Image
+
+from image_variants import generate_variants_from_file, delete_variants
+
+
+def test_webp_source_only_when_a_webp_variant_exists(app):
+    from routes import image_variant_url
+    folder = os.path.join(app.static_folder, 'uploads/profile_photos')
+    os.makedirs(folder, exist_ok=True)
+    filename = 'legacy-upload-test.jpg'
+    Image.new('RGB', (200, 200), 'red').save(os.path.join(folder, filename))
+    try:
+        with app.test_request_context():
+            # A legacy upload: only the original JPEG exists
+            assert image_variant_url('uploads/profile_photos', filename, 60).endswith(f'/{filename}')
+            assert image_variant_url('uploads/profile_photos', filename, 60, 'webp') is None
+
+            generate_variants_from_file(folder, filename)
+            assert image_variant_url('uploads/profile_photos', filename, 60, 'webp').endswith('.webp')
+    finally:
+        delete_variants(folder, filename)
+        os.remove(os.path.join(folder, filename))
@@ -0,0 +1,51 @@
+import re
+
+import pytest
+from sqlalchemy import text
+
+from app import db
+from commands import _full_scans, _hot_queries
+
+# The index SQLite should pick for each hot query on a freshly built database
+EXPECTED_INDEXES = {
+    'connections': {'ix_connection_sender_id_status_created_at', 'ix_connection_receiver_id_status_created_at'},
+    'incoming connection requests': {'ix_connection_receiver_id_status_created_at'},
+    'outgoing connection requests': {'ix_connection_sender_id_status_created_at'},
+    'connection between': {'uq_connection_pair'},
+    'conversation read state': {'uq_conversation_pair'},
+    'message requests': {'ix_message_receiver_id_status_created_at'},
+    'unread past watermark': {'ix_message_sender_id_receiver_id_status_id'},
+    'conversation': {'ix_message_sender_id_receiver_id_status_id'},
+    'open referral requests': {'ix_referral_request_status_created_at'},
+    'my referral requests': {'ix_referral_request_job_seeker_id_created_at'},
+    'referrals given': {'ix_job_referral_referrer_id_created_at'},
+    'referrals received': {'ix_job_referral_candidate_id_created_at'},
+    'active jobs': {'ix_job_posting_is_active_created_at'},
+    'profile skills': {'ix_user_skill_user_id'},
+    'profile experience': {'ix_experience_user_id_start_date'},
+    'profile education': {'ix_education_user_id_start_year'},
+    'resume download': {'ix_user_resume_file'},
+    'skill posting list': {'ix_user_skill_normalized_skill_user_id'},
+    'current employees': {'ix_experience_company_key_current_user_id'},
+}
+
+
+def _plan(query):
+    statement = query.statement.compile(db.engine, compile_kwargs={'literal_binds': True})
+    return statement, [row[-1] for row in db.session.execute(text(f'EXPLAIN QUERY PLAN {statement}'))]
+
+
+def test_every_hot_query_has_an_expectation(app):
+    with app.app_context():
+        assert {label for label, _ in _hot_queries(1)} == set(EXPECTED_INDEXES)
+
+
+@pytest.mark.parametrize('label', sorted(EXPECTED_INDEXES))
+def test_hot_query_plan(app, label):
+    with app.app_context():
+        query = dict(_hot_queries(1))[label]
+        statement, plan = _plan(query)
+        used = {match for line in plan for match in re.findall(r'USING (?:COVERING )?INDEX (\w+)', line)}
+        assert used == EXPECTED_INDEXES[label], plan
+        assert _full_scans(statement) == []
+        db.session.rollback()
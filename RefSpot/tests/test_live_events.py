@@ -0,0 +1,45 @@
+import time
+
+import live_events
+from app import db
+from models import Connection, Conversation, Message, User
+from notification_counters import counts_for
+
+
+def test_stream_ends_after_its_lifetime(monkeypatch):
+    monkeypatch.setattr(live_events, 'LIVE_STREAM_LIFETIME', 0.3)
+    monkeypatch.setattr(live_events, 'LIVE_HEARTBEAT', 0.1)
+    started = time.monotonic()
+    lines = list(live_events.stream(424242))
+    assert lines[0] == "retry: 5000\n\n"
+    assert ": keep-alive\n\n" in lines
+    assert time.monotonic() - started < 2
+    # The stream unsubscribed on the way out
+    assert 424242 not in live_events.broker._subscribers
+
+
+def test_live_message_marked_read_from_the_page(app):
+    with app.app_context():
+        reader = User(username='live-reader', email='live-reader@example.com', password_hash='-')
+        writer = User(username='live-writer', email='live-writer@example.com', password_hash='-')
+        db.session.add_all([reader, writer])
+        db.session.flush()
+        db.session.add(Message(sender_id=writer.id, receiver_id=reader.id, content='hi',
+                               message_request_status='approved'))
+        db.session.commit()
+        reader_id, writer_id = reader.id, writer.id
+        assert counts_for(reader_id).unread_messages == 1
+
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = str(reader_id)
+    # An id past the newest message only reads up to the newest
+    response = client.post('/api/messages/live-writer/read', json={'message_id': 10 ** 9})
+    assert response.get_json() == {'success': True}
+    assert client.post('/api/messages/live-writer/read', json={}).status_code == 400
+
+    with app.app_context():
+        low, high = Connection.pair(reader_id, writer_id)
+        conversation = Conversation.query.filter_by(low_user_id=low, high_user_id=high).one()
+        assert conversation.read_id_for(reader_id) == conversation.last_message_id
+        assert counts_for(reader_id).unread_messages == 0
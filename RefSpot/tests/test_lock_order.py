@@ -0,0 +1,87 @@
+from contextlib import contextmanager
+
+from sqlalchemy import event
+from sqlalchemy.dialects import postgresql
+
+import read_receipts
+from app import db
+from delta_sync import lock_users
+from models import Connection, Conversation, Message, User
+
+# PostgreSQL deadlocks when two transactions lock the same user_counter and
+# conversation rows in different orders. Every writer locks the users'
+# counter rows, in id order, before writing either table; these tests check
+# that order in the statements each path sends.
+_LOCK = 'SELECT user_counter.user_id \nFROM user_counter \nWHERE user_counter.user_id IN'
+
+
+@contextmanager
+def _statements():
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(db.engine, 'before_cursor_execute', record)
+    try:
+        yield statements
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', record)
+
+
+def _first_shared_row_access(statements):
+    """The first statement that reads or writes a user_counter or conversation row"""
+    return next(statement for statement in statements if 'user_counter' in statement or 'conversation' in statement)
+
+
+def _pair(prefix):
+    users = [User(username=f'{prefix}{i}', email=f'{prefix}{i}@example.com', password_hash='-') for i in range(2)]
+    db.session.add_all(users)
+    db.session.flush()
+    db.session.add(Message(sender_id=users[0].id, receiver_id=users[1].id, content='first',
+                           message_request_status='approved'))
+    db.session.commit()
+    return users
+
+
+def test_lock_is_ordered_and_for_update():
+    statements = []
+    lock_users(type('Recorder', (), {'execute': lambda self, statement: statements.append(statement)})(), [3, 1, 2])
+    sql = str(statements[0].compile(dialect=postgresql.dialect()))
+    assert sql.endswith('ORDER BY user_counter.user_id FOR UPDATE')
+
+
+def test_message_flush_locks_counters_first(app):
+    with app.app_context():
+        sender, receiver = _pair('lock-flush')
+        with _statements() as statements:
+            # A reply, racing the original direction
+            db.session.add(Message(sender_id=receiver.id, receiver_id=sender.id, content='reply',
+                                   message_request_status='approved'))
+            db.session.commit()
+        assert _first_shared_row_access(statements).startswith(_LOCK)
+
+
+def test_read_receipt_locks_counters_first(app):
+    with app.app_context():
+        sender, receiver = _pair('lock-read')
+        low, high = Connection.pair(sender.id, receiver.id)
+        last_id = Conversation.query.filter_by(low_user_id=low, high_user_id=high).one().last_message_id
+        with _statements() as statements:
+            assert read_receipts.mark_read(receiver.id, sender.id, last_id)
+            db.session.commit()
+        assert _first_shared_row_access(statements).startswith(_LOCK)
+
+
+def test_delete_conversation_locks_counters_first(app):
+    with app.app_context():
+        sender, receiver = _pair('lock-delete')
+        sender_id = sender.id
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = str(sender_id)
+    with app.app_context(), _statements() as statements:
+        assert client.post('/messages/lock-delete1/delete').status_code == 302
+    first_write = next(statement for statement in statements if statement.startswith(('DELETE', 'UPDATE', 'INSERT')))
+    assert statements.index(_first_shared_row_access(statements)) < statements.index(first_write)
+    assert _first_shared_row_access(statements).startswith(_LOCK)
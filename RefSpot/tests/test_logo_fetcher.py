@@ -0,0 +1,57 @@
+import time
+
+import logo_fetcher
+
+
+def _point_at(monkeypatch, clearbit, favicon):
+    monkeypatch.setattr(logo_fetcher, 'CLEARBIT_URL_TEMPLATE', clearbit)
+    monkeypatch.setattr(logo_fetcher, 'FAVICON_URL_TEMPLATES', [favicon])
+
+
+def test_every_candidate_comes_from_the_templates(monkeypatch, logo_server):
+    _point_at(monkeypatch, f"{logo_server.url}/0/ok/clearbit/{{domain}}", f"{logo_server.url}/0/ok/favicon/{{domain}}")
+    candidates = logo_fetcher.get_logo_candidates('Acme Widgets')
+    assert candidates
+    assert all(url.startswith(logo_server.url) for url, *_ in candidates)
+
+
+def test_slow_failures_are_probed_concurrently(monkeypatch, logo_server):
+    # Every Clearbit candidate takes 0.5s to fail; probed one by one that is seconds
+    _point_at(monkeypatch, f"{logo_server.url}/0.5/missing/{{domain}}", f"{logo_server.url}/0/ok/{{domain}}")
+    candidates = logo_fetcher.get_logo_candidates('Acme Widgets')
+    slow = sum(1 for url, *_ in candidates if '/missing/' in url)
+    assert slow > 2
+
+    started = time.monotonic()
+    logo = logo_fetcher.probe_logo_candidates(candidates, deadline=5)
+    elapsed = time.monotonic() - started
+
+    assert logo == logo_server.image
+    assert elapsed < 0.5 * slow / 2
+
+
+def test_deadline_settles_for_the_fast_logo(monkeypatch, logo_server):
+    # The preferred source hangs past the deadline; the fast one is used
+    _point_at(monkeypatch, f"{logo_server.url}/3/ok/{{domain}}", f"{logo_server.url}/0/ok/{{domain}}")
+    candidates = logo_fetcher.get_logo_candidates('Acme Widgets')
+
+    started = time.monotonic()
+    logo = logo_fetcher.probe_logo_candidates(candidates, deadline=1)
+    elapsed = time.monotonic() - started
+
+    assert logo == logo_server.image
+    assert elapsed < 2
+
+
+def test_preferred_logo_wins_without_waiting_for_the_rest(monkeypatch, logo_server):
+    _point_at(monkeypatch, f"{logo_server.url}/0/ok/{{domain}}", f"{logo_server.url}/3/ok/{{domain}}")
+    failed = []
+
+    started = time.monotonic()
+    logo = logo_fetcher.probe_logo_candidates(logo_fetcher.get_logo_candidates('Acme Widgets'), deadline=5,
+                                              on_failed_domains=failed.extend)
+    elapsed = time.monotonic() - started
+
+    assert logo == logo_server.image
+    assert elapsed < 1
+    assert failed == []
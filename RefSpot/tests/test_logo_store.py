@@ -0,0 +1,71 @@
+import pytest
+from sqlalchemy import insert
+
+import logo_store
+from app import db
+from models import CompanyLogo
+
+
+@pytest.fixture
+def registry(app, cache_backend, monkeypatch):
+    """Logo registry with fetches answered by the test and deletions recorded instead of done"""
+    fetched, deleted = [], []
+
+    def fetch(company_name, **kwargs):
+        fetched.append(company_name)
+        return registry.next_filename
+
+    monkeypatch.setattr(logo_store, 'fetch_company_logo', fetch)
+    monkeypatch.setattr(logo_store, 'delete_company_logo', deleted.append)
+    registry = type('Registry', (), {'fetched': fetched, 'deleted': deleted, 'next_filename': None})
+    with app.app_context():
+        yield registry
+        db.session.rollback()
+        CompanyLogo.query.delete()
+        db.session.commit()
+
+
+def _refs(key):
+    return db.session.query(CompanyLogo.ref_count).filter_by(normalized_name=key).scalar()
+
+
+def test_acquires_share_one_fetch(registry):
+    registry.next_filename = 'shared.png'
+    assert logo_store.acquire_company_logo('Shared Co') == 'shared.png'
+    assert logo_store.acquire_company_logo('Shared Co', count=2) == 'shared.png'
+    db.session.commit()
+    assert registry.fetched == ['Shared Co']
+    assert _refs('shared') == 3
+    # Locks are dropped once no thread uses them
+    assert logo_store._fetch_locks == {}
+
+
+def test_release_keeps_file_while_referenced_then_deletes(registry):
+    registry.next_filename = 'kept.png'
+    logo_store.acquire_company_logo('Kept Co', count=2)
+    db.session.commit()
+
+    logo_store.release_company_logo('kept.png')
+    db.session.commit()
+    assert _refs('kept') == 1
+    assert registry.deleted == []
+
+    logo_store.release_company_logo('kept.png')
+    db.session.commit()
+    assert CompanyLogo.query.filter_by(filename='kept.png').first() is None
+    assert registry.deleted == ['kept.png']
+
+
+def test_registration_race_uses_the_winners_logo(registry, monkeypatch):
+    def fetch_while_another_process_registers(company_name, **kwargs):
+        with db.engine.begin() as conn:
+            conn.execute(insert(CompanyLogo.__table__).values(
+                normalized_name='raced', filename='winner.png', ref_count=1))
+        return 'loser.png'
+
+    monkeypatch.setattr(logo_store, 'fetch_company_logo', fetch_while_another_process_registers)
+    assert logo_store.acquire_company_logo('Raced Co') == 'winner.png'
+    db.session.commit()
+    assert _refs('raced') == 2
+    # The losing fetch's file is unused, so it goes
+    assert registry.deleted == ['loser.png']
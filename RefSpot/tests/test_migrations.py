@@ -0,0 +1,44 @@
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+from sqlalchemy import text
+
+import migrations
+from app import db
+
+
+def test_upgrade_waits_out_a_locked_sqlite_database(app, monkeypatch):
+    """A second worker starting while another migrates skips the version instead of crashing"""
+    calls = []
+    monkeypatch.setattr(migrations, 'MIGRATIONS', [(999, 'locked test', lambda conn: calls.append(conn))])
+    with app.app_context():
+        migrations._ensure_version_table()
+        path = db.engine.url.database
+
+    holding = threading.Event()
+
+    def other_worker():
+        # Holds the write lock past the driver's busy timeout, then records the version
+        conn = sqlite3.connect(path, isolation_level=None)
+        conn.execute('BEGIN IMMEDIATE')
+        conn.execute('INSERT INTO schema_version (version, name, applied_at) VALUES (999, ?, ?)',
+                     ('locked test', datetime.utcnow().isoformat(' ')))
+        holding.set()
+        time.sleep(6)
+        conn.execute('COMMIT')
+        conn.close()
+
+    worker = threading.Thread(target=other_worker)
+    worker.start()
+    holding.wait()
+    try:
+        with app.app_context():
+            assert migrations.upgrade() == []
+            assert calls == []
+            assert 999 in migrations.applied_versions()
+    finally:
+        worker.join()
+        with app.app_context(), db.engine.begin() as conn:
+            conn.execute(text('DELETE FROM schema_version WHERE version = 999'))
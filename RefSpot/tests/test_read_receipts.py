@@ -0,0 +1,36 @@
+import read_receipts
+from app import db
+from delta_sync import sync_state
+from models import Connection, Conversation, Message, User
+
+
+def _conversation(reader_id, other_id):
+    low, high = Connection.pair(reader_id, other_id)
+    return Conversation.query.filter_by(low_user_id=low, high_user_id=high).one()
+
+
+def test_only_a_moved_watermark_takes_a_change_number(app, monkeypatch):
+    with app.app_context():
+        reader, *others = [User(username=f'receipts{i}', email=f'receipts{i}@example.com', password_hash='-')
+                           for i in range(3)]
+        db.session.add_all([reader, *others])
+        db.session.flush()
+        db.session.add_all(Message(sender_id=other.id, receiver_id=reader.id, content='hi',
+                                   message_request_status='approved') for other in others)
+        db.session.commit()
+        reader_id, other_ids = reader.id, [other.id for other in others]
+        last_ids = {other_id: _conversation(reader_id, other_id).last_message_id for other_id in other_ids}
+
+        # Both conversations in one batch share one change number
+        monkeypatch.setattr(read_receipts, 'READ_RECEIPT_DELAY', 60)
+        for other_id in other_ids:
+            read_receipts.mark_read(reader_id, other_id, last_ids[other_id])
+        assert read_receipts.flush_read_marks() == 2
+        seq = sync_state(reader_id)
+        assert {_conversation(reader_id, other_id).change_seq for other_id in other_ids} == {seq}
+
+        # A mark the watermark is already past writes nothing, so ETags stay valid
+        monkeypatch.setattr(read_receipts, 'READ_RECEIPT_DELAY', 0)
+        assert not read_receipts.mark_read(reader_id, other_ids[0], last_ids[other_ids[0]])
+        db.session.rollback()
+        assert sync_state(reader_id) == seq
@@ -0,0 +1,59 @@
+import random
+from collections import deque
+
+import connection_graph
+from app import db
+from models import Connection, User
+from referral_paths import find_referral_paths
+
+
+def _distances(edges, starts):
+    """Hop counts from the nearest of starts by plain BFS, to check the bidirectional search against"""
+    dist = dict.fromkeys(starts, 0)
+    queue = deque(starts)
+    while queue:
+        node = queue.popleft()
+        for neighbour in edges[node]:
+            if neighbour not in dist:
+                dist[neighbour] = dist[node] + 1
+                queue.append(neighbour)
+    return dist
+
+
+def test_paths_on_a_synthetic_graph(app, cache_backend, monkeypatch):
+    rng = random.Random(17)
+    with app.app_context():
+        users = [User(username=f'paths{i}', email=f'paths{i}@example.com', password_hash='-',
+                      current_company='Pathfinder Labs' if i % 20 == 19 else None)
+                 for i in range(300)]
+        db.session.add_all(users)
+        db.session.flush()
+        ids = [user.id for user in users]
+        edges = {user_id: set() for user_id in ids}
+        pairs = set()
+        while len(pairs) < 600:
+            a, b = rng.sample(ids, 2)
+            pairs.add((min(a, b), max(a, b)))
+        for a, b in pairs:
+            edges[a].add(b)
+            edges[b].add(a)
+        db.session.add_all(Connection(sender_id=a, receiver_id=b, status='accepted') for a, b in pairs)
+        db.session.commit()
+
+        # Far smaller than a frontier, so lookups after preload would miss
+        monkeypatch.setattr(connection_graph, 'GRAPH_CACHE_USERS', 5)
+        employees = {user.id for user in users if user.current_company}
+        # A seeker three hops from the nearest employee, so both sides of the search grow
+        dist = _distances(edges, employees)
+        seeker = min(user_id for user_id, hops in dist.items() if hops == 3)
+
+        cache_backend.calls.clear()
+        paths = find_referral_paths(seeker, 'Pathfinder Labs')
+        assert paths
+        for path in paths:
+            assert path[0] == seeker and path[-1] in employees
+            assert len(path) - 1 <= 3
+            assert all(b in edges[a] for a, b in zip(path, path[1:]))
+        assert min(len(path) - 1 for path in paths) == 3
+        # One version read per expanded frontier, none per user
+        assert set(cache_backend.calls) == {'get_many'}
@@ -0,0 +1,39 @@
+import shared_cache
+
+
+def test_local_copy_only_while_backend_is_down(cache_backend):
+    shared_cache.cache_set('key', 'shared', 60)
+    assert not shared_cache._local_cache
+
+    cache_backend.up = False
+    shared_cache.cache_set('key', 'local', 60)
+    assert shared_cache.cache_get('key') == 'local'
+
+    # Once the backend is back, a miss there is a miss and the outage copy is gone
+    cache_backend.up = True
+    cache_backend.values.clear()
+    assert shared_cache.cache_get('key') is None
+    shared_cache.cache_set('key', 'fresh', 60)
+    cache_backend.up = False
+    assert shared_cache.cache_get('key') is None
+
+
+def test_local_copy_is_bounded(cache_backend, monkeypatch):
+    monkeypatch.setattr(shared_cache, 'LOCAL_CACHE_ENTRIES', 3)
+    cache_backend.up = False
+    for i in range(5):
+        shared_cache.cache_set(f'key{i}', i, 60)
+    assert list(shared_cache._local_cache) == ['key2', 'key3', 'key4']
+
+    monkeypatch.setattr(shared_cache, '_last_sweep', 0)
+    shared_cache.cache_set('expired', 1, -1)
+    shared_cache.cache_set('kept', 1, 60)
+    assert 'expired' not in shared_cache._local_cache
+
+
+def test_counter_falls_back_to_this_process(cache_backend):
+    assert shared_cache.cache_inc('counter') == 1
+    cache_backend.up = False
+    assert shared_cache.cache_inc('counter') == 1
+    assert shared_cache.cache_inc('counter') == 2
+    assert shared_cache.cache_get('counter') == 2
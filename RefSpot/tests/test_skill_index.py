@@ -0,0 +1,10 @@
+from skill_index import parse_skill_query
+
+
+def test_separators():
+    assert parse_skill_query('Kubernetes, Go and Python; k8s') == ['kubernetes', 'go', 'python']
+
+
+def test_compound_skill_names_stay_whole():
+    assert parse_skill_query('CI/CD, C/C++ and R&D') == ['ci/cd', 'c/c++', 'r&d']
+    assert parse_skill_query('Android') == ['android']
@@ -0,0 +1,47 @@
+import suggest_index
+from app import db
+from models import User, UserSkill
+
+
+def test_build_sorts_keys_once_and_updates_stay_sorted(app):
+    with app.app_context():
+        user = User(username='suggest-owner', email='suggest-owner@example.com', password_hash='-',
+                    first_name='Grace', last_name='Hopper', current_position='Staff Software Engineer')
+        db.session.add(user)
+        db.session.commit()
+        suggest_index.build_suggest_index()
+        assert suggest_index._keys == sorted(suggest_index._keys)
+        assert {'text': 'Staff Software Engineer', 'type': 'title'} in suggest_index.suggest('engin')
+
+        # Incremental updates after commit insert in order
+        db.session.add(UserSkill(user_id=user.id, skill_name='Zygote Modelling'))
+        db.session.commit()
+        assert suggest_index._keys == sorted(suggest_index._keys)
+        assert suggest_index.suggest('zygote') == [{'text': 'Zygote Modelling', 'type': 'skill'}]
+
+
+def test_rebuilds_after_another_worker_writes(app, cache_backend, monkeypatch):
+    with app.app_context():
+        suggest_index.build_suggest_index()
+
+        # Our own commit is applied in place and accounted for
+        db.session.add(User(username='suggest-local', email='suggest-local@example.com', password_hash='-',
+                            first_name='Quillon', last_name='Local'))
+        db.session.commit()
+        assert suggest_index._version == cache_backend.values['suggest_index_version']
+        assert suggest_index.suggest('quillon') == [{'text': 'Quillon Local', 'type': 'person'}]
+
+        # Another worker's commit only shows here as a bumped counter
+        with db.engine.begin() as conn:
+            conn.execute(User.__table__.insert().values(username='suggest-remote', email='suggest-remote@example.com',
+                                                        password_hash='-', first_name='Quarrow', last_name='Remote'))
+        cache_backend.inc('suggest_index_version')
+        assert suggest_index.suggest('quarrow') == []
+
+        monkeypatch.setattr(suggest_index, 'SUGGEST_CHECK_INTERVAL', 0)
+        suggest_index.suggest('quarrow')
+        rebuild = suggest_index._rebuild
+        if rebuild:
+            rebuild.join(5)
+        assert suggest_index.suggest('quarrow') == [{'text': 'Quarrow Remote', 'type': 'person'}]
+        assert suggest_index._version == cache_backend.values['suggest_index_version']